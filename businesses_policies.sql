@@ -1,3 +1,4 @@
+-- Superseded by supabase/migrations/20261018000300_businesses_rls.sql (kept for projects set up by hand)
 -- Enable Row-Level Security
 ALTER TABLE businesses ENABLE ROW LEVEL SECURITY;
 
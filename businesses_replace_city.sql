@@ -0,0 +1,48 @@
+-- Atomic city replace for the nightly scraper (PostgREST: POST /rest/v1/rpc/replace_city_businesses)
+-- One call = DELETE city + INSERT new rows in a single transaction.
+-- Any error (e.g. 23505 on business_key) rolls back both, so the old rows stay untouched
+-- and the client needs no snapshot/restore round-trips.
+
+CREATE OR REPLACE FUNCTION public.replace_city_businesses(p_city text, p_rows jsonb)
+RETURNS integer
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = public
+AS $$
+DECLARE
+  inserted integer;
+BEGIN
+  IF p_city IS NULL OR btrim(p_city) = '' THEN
+    RAISE EXCEPTION 'replace_city_businesses: p_city is required';
+  END IF;
+
+  IF jsonb_typeof(p_rows) IS DISTINCT FROM 'array' THEN
+    RAISE EXCEPTION 'replace_city_businesses: p_rows must be a JSON array';
+  END IF;
+
+  -- Never let a payload write outside the city being replaced
+  IF EXISTS (
+    SELECT 1 FROM jsonb_array_elements(p_rows) AS r
+    WHERE r->>'city' IS DISTINCT FROM p_city
+  ) THEN
+    RAISE EXCEPTION 'replace_city_businesses: every row must have city = %', p_city;
+  END IF;
+
+  DELETE FROM businesses WHERE city = p_city;
+
+  INSERT INTO businesses (name, address, phone, website, city, service, state, maps_url, review_count, avg_rating)
+  SELECT name, address, phone, website, city, service, state, maps_url, review_count, avg_rating
+  FROM jsonb_populate_recordset(NULL::businesses, p_rows);
+
+  GET DIAGNOSTICS inserted = ROW_COUNT;
+  RETURN inserted;
+END;
+$$;
+
+-- Only the service role (nightly job) may replace cities
+REVOKE ALL ON FUNCTION public.replace_city_businesses(text, jsonb) FROM PUBLIC;
+REVOKE ALL ON FUNCTION public.replace_city_businesses(text, jsonb) FROM anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.replace_city_businesses(text, jsonb) TO service_role;
+
+-- Make the new function visible to PostgREST without a restart
+NOTIFY pgrst, 'reload schema';
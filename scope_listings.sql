@@ -0,0 +1,35 @@
+-- Per-scope listing snapshots for the site build (written by the scraper, see scraper/scope_listings.py)
+-- One row per (city, service): the ordered cards (pin_rank, then rank) as one JSON document.
+-- getStaticPaths reads the manifest columns only (no listing); each page reads one document by slug.
+-- content_hash / version only change when the listing does, so unchanged pages can reuse a cached copy.
+
+CREATE TABLE IF NOT EXISTS public.scope_listings (
+  city          text        NOT NULL,
+  service       text        NOT NULL,
+  city_slug     text        NOT NULL,
+  service_slug  text        NOT NULL,
+  listing       jsonb       NOT NULL DEFAULT '[]'::jsonb,
+  row_count     integer     NOT NULL DEFAULT 0,
+  content_hash  text        NOT NULL,
+  version       integer     NOT NULL DEFAULT 1,
+  updated_at    timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (city, service)
+);
+
+-- Page lookups are by URL slug
+CREATE UNIQUE INDEX IF NOT EXISTS scope_listings_slugs_key
+  ON public.scope_listings (city_slug, service_slug);
+
+-- Public read; only the service role (nightly job, bypasses RLS) writes
+ALTER TABLE public.scope_listings ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Allow anonymous reads" ON public.scope_listings;
+CREATE POLICY "Allow anonymous reads"
+ON public.scope_listings
+FOR SELECT
+TO anon
+USING (
+  true
+);
+
+NOTIFY pgrst, 'reload schema';
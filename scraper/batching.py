@@ -0,0 +1,114 @@
+# scraper/batching.py
+# Adaptive chunk sizing for PostgREST writes
+# - chunk rows grow while requests are fast, shrink when they get slow or fail
+# - every chunk also respects a byte ceiling (request body or URL length)
+# - retryable failures (413/414/408/429/5xx, timeouts) are split instead of failing the scope; only 413/414
+#   guarantee nothing was written, so callers resend the other cases idempotently
+# - summary() feeds the run metrics (chosen sizes, throughput, splits)
+
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Statuses where sending fewer rows per request can succeed
+RETRYABLE_STATUSES = {408, 413, 414, 429, 500, 502, 503, 504}
+# Request rejected for its size before anything was written
+TOO_LARGE_STATUSES = {413, 414}
+
+class AdaptiveBatcher:
+    """
+    Thread-safe chunk-size controller (shared by concurrent in-flight chunks).
+    rows: current target rows per chunk, kept within [min_rows, max_rows].
+    """
+
+    def __init__(self, start_rows: int, min_rows: int = 1, max_rows: int = 2000,
+                 max_bytes: int = 1_000_000, target_latency_s: float = 5.0, name: str = "batch"):
+        self.min_rows = max(1, min_rows)
+        self.max_rows = max(self.min_rows, max_rows)
+        self.max_bytes = max_bytes
+        self.target_latency_s = target_latency_s
+        self.name = name
+        self.rows = min(self.max_rows, max(self.min_rows, start_rows))
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._chunks = 0
+        self._sent_rows = 0
+        self._sent_bytes = 0
+        self._busy_s = 0.0
+        self._errors = 0
+        self._splits = 0
+        self._sizes: List[int] = []
+
+    @staticmethod
+    def is_retryable(status: Optional[int]) -> bool:
+        """None means the request never got a response (timeout / connection reset)."""
+        return status is None or status in RETRYABLE_STATUSES
+
+    @staticmethod
+    def is_too_large(status: Optional[int]) -> bool:
+        return status in TOO_LARGE_STATUSES
+
+    def record(self, rows: int, nbytes: int, latency_s: float, ok: bool, status: Optional[int] = None) -> None:
+        with self._lock:
+            self._busy_s += latency_s
+            if ok:
+                self._chunks += 1
+                self._sent_rows += rows
+                self._sent_bytes += nbytes
+                self._sizes.append(rows)
+                if latency_s <= self.target_latency_s / 2 and rows >= self.rows:
+                    # Fast and at full size: grow (multiplicative, at least +1 row)
+                    self.rows = min(self.max_rows, max(self.rows + 1, int(self.rows * 1.5)))
+                elif latency_s > self.target_latency_s:
+                    self.rows = max(self.min_rows, int(self.rows * 0.7))
+                return
+            self._errors += 1
+            if self.is_retryable(status):
+                self.rows = max(self.min_rows, min(self.rows, rows) // 2)
+
+    def note_split(self) -> None:
+        with self._lock:
+            self._splits += 1
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes = self._sizes
+            wall = time.perf_counter() - self._started
+            return {
+                "name": self.name,
+                "chunks": self._chunks,
+                "rows": self._sent_rows,
+                "bytes": self._sent_bytes,
+                "errors": self._errors,
+                "splits": self._splits,
+                "size_min": min(sizes) if sizes else 0,
+                "size_max": max(sizes) if sizes else 0,
+                "size_avg": round(sum(sizes) / len(sizes), 1) if sizes else 0,
+                "size_next": self.rows,
+                "rows_per_s": round(self._sent_rows / self._busy_s, 1) if self._busy_s else 0.0,
+                "bytes_per_s": round(self._sent_bytes / self._busy_s, 1) if self._busy_s else 0.0,
+                "wall_s": round(wall, 2),
+            }
+
+def format_summary(m: Dict[str, Any]) -> str:
+    return (f"{m['name']}: {m['rows']} rows in {m['chunks']} chunks "
+            f"(size min/avg/max {m['size_min']}/{m['size_avg']}/{m['size_max']}, next {m['size_next']}) | "
+            f"{m['rows_per_s']} rows/s, {m['bytes_per_s'] / 1e3:.1f} kB/s | errors {m['errors']}, splits {m['splits']}")
+
+def iter_chunks(items: Iterable[bytes], batcher: AdaptiveBatcher, overhead: int = 2, sep: int = 1) -> Iterator[List[bytes]]:
+    """
+    Group pre-encoded items into chunks of at most batcher.rows items and batcher.max_bytes bytes.
+    The row limit is re-read for every chunk, so the size adapts while the stream is consumed.
+    A single item larger than max_bytes still goes out alone (the server decides).
+    """
+    chunk: List[bytes] = []
+    size = overhead
+    for item in items:
+        if chunk and (len(chunk) >= batcher.rows or size + len(item) + sep > batcher.max_bytes):
+            yield chunk
+            chunk = []
+            size = overhead
+        chunk.append(item)
+        size += len(item) + sep
+    if chunk:
+        yield chunk
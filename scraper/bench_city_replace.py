@@ -0,0 +1,89 @@
+# scraper/bench_city_replace.py
+# Benchmark: client-side city replace (snapshot GET -> DELETE -> chunked POSTs) vs the
+# single-transaction RPC from businesses_replace_city.sql.
+#
+# Needs a LOCAL Supabase stack (Postgres + PostgREST under /rest/v1), e.g. `supabase start`,
+# with the businesses table and businesses_replace_city.sql applied:
+#   psql "$LOCAL_DB_URL" -f businesses_replace_city.sql
+#   BENCH_SUPABASE_URL=http://127.0.0.1:54321 BENCH_SERVICE_KEY=... \
+#     python scraper/bench_city_replace.py --rows 70 --rounds 10
+#
+# Never point this at production: it deletes and rewrites the bench city on every round.
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Client-side vs RPC city replace benchmark (local stack only).")
+    parser.add_argument("--rows", type=int, default=70, help="rows per city (10 per service x 7 services)")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--city", default="Benchville")
+    args = parser.parse_args()
+
+    url = os.getenv("BENCH_SUPABASE_URL", "http://127.0.0.1:54321").rstrip("/")
+    key = os.getenv("BENCH_SERVICE_KEY", "")
+    if not key:
+        print("[FAIL] BENCH_SERVICE_KEY is required (local service_role key).")
+        return 2
+    if "supabase.co" in url:
+        print("[FAIL] Refusing to benchmark against a hosted project.")
+        return 2
+
+    # Point the scraper helpers at the local stack before importing them
+    os.environ["NEXT_PUBLIC_SUPABASE_URL"] = url
+    os.environ["SUPABASE_SERVICE_ROLE_KEY"] = key
+    import scraper as S
+    from records import Business
+    S.configure_logging()
+
+    rows = [
+        Business(
+            name=f"Bench Handyman {i}", address=f"{i} Main St", phone=f"+1615555{i:04d}",
+            website=f"https://bench{i}.example.com", city=args.city, service="handyman",
+            maps_url=f"https://www.google.com/maps/place/bench{i}", review_count=i, avg_rating=4.5,
+        )
+        for i in range(args.rows)
+    ]
+
+    def client_path() -> bool:
+        snapshot = S.backup_supabase_city(args.city)
+        if not S.delete_supabase_city(args.city):
+            return False
+        try:
+            S.upload_businesses_chunked(rows)
+            return True
+        except Exception:
+            S.restore_supabase_city(args.city, snapshot)
+            return False
+
+    def rpc_path() -> bool:
+        return bool(S.replace_city_via_rpc(args.city, rows))
+
+    # Seed once so both paths replace a populated city
+    if not rpc_path() and not client_path():
+        print("[FAIL] Could not seed bench city (is the local stack up and the SQL applied?).")
+        return 3
+
+    results = {}
+    for label, fn in (("client", client_path), ("rpc", rpc_path)):
+        times = []
+        for _ in range(args.rounds):
+            t0 = time.perf_counter()
+            if not fn():
+                print(f"[FAIL] {label} replace failed")
+                return 4
+            times.append(time.perf_counter() - t0)
+        results[label] = times
+        print(f"[BENCH] {label:<6} rows={args.rows} median={statistics.median(times) * 1e3:.1f} ms "
+              f"p90={sorted(times)[int(0.9 * (len(times) - 1))] * 1e3:.1f} ms")
+
+    S.delete_supabase_city(args.city)
+    speedup = statistics.median(results["client"]) / statistics.median(results["rpc"])
+    print(f"[BENCH] rpc vs client: x{speedup:.2f} faster (median)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
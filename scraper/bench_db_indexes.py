@@ -0,0 +1,185 @@
+# scraper/bench_db_indexes.py
+# EXPLAIN (ANALYZE, BUFFERS) of the pipeline's hot queries before / after supabase/migrations
+# - scratch schema in a local Postgres (dropped and re-created each run), synthetic businesses rows
+# - "before": table + business_key only (primary key on id), "after": every migration applied
+# - the statements are the SQL PostgREST issues for backup_supabase_city, delete_supabase_city,
+#   fetch_existing_scope, patch_one, the on_conflict upsert, delete_stale_for_scope and an anon page read
+# - also checks records.business_key_for() against the generated column on edge-case rows
+# Talks to the server through psql (no Python driver needed); connection via --dsn or PG* env vars.
+#
+# Usage (from the repo root): python scraper/bench_db_indexes.py --dsn postgresql://postgres@localhost:5432/postgres [--rows 100000]
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from records import business_key_for
+
+MIGRATIONS = Path(__file__).resolve().parent.parent / "supabase" / "migrations"
+SCHEMA = "bench_idx"
+BASELINE = ("_businesses_table.sql", "_business_key.sql")
+
+class Psql:
+    def __init__(self, psql: str, dsn: Optional[str]):
+        self.cmd = [psql, "-X", "-q", "-t", "-A", "-v", "ON_ERROR_STOP=1"] + ([dsn] if dsn else [])
+
+    def run(self, sql: str) -> str:
+        proc = subprocess.run(self.cmd, input=f"SET search_path TO {SCHEMA};\n{sql}",
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip() or f"psql exited with {proc.returncode}")
+        return proc.stdout
+
+def _lit(value: Any) -> str:
+    return "NULL" if value is None else "'" + str(value).replace("'", "''") + "'"
+
+def setup(db: Psql, rows: int) -> Dict[str, Any]:
+    db.run(f"""
+        DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+        CREATE SCHEMA {SCHEMA};
+        DO $$ BEGIN
+          IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN CREATE ROLE anon NOLOGIN; END IF;
+        END $$;
+        GRANT USAGE ON SCHEMA {SCHEMA} TO anon;
+    """)
+    for path in sorted(MIGRATIONS.glob("*.sql")):
+        if path.name.endswith(BASELINE):
+            db.run(path.read_text(encoding="utf-8"))
+    # ~60 cities x 20 services; per scope the top-N plus older rows that piled up
+    db.run(f"""
+        INSERT INTO businesses (name, address, phone, website, city, service, state, maps_url, review_count, avg_rating, pin_rank)
+        SELECT 'Business ' || g,
+               g || ' Main St',
+               '(615) 555-' || lpad((g % 10000)::text, 4, '0'),
+               CASE WHEN g % 10 = 0 THEN NULL ELSE 'https://www.biz' || g || '.example.com/' END,
+               'City ' || (g % 60),
+               'service ' || ((g / 60) % 20),
+               'TN',
+               CASE WHEN g % 5 = 0 THEN NULL ELSE 'https://www.google.com/maps/place/biz' || g END,
+               g % 500,
+               round((3 + (g % 20) / 10.0)::numeric, 1),
+               CASE WHEN g % 97 = 0 THEN 0 ELSE 100 END
+        FROM generate_series(1, {rows}) AS g;
+        GRANT SELECT ON businesses TO anon;
+        VACUUM ANALYZE businesses;
+    """)
+    row = db.run("SELECT name, coalesce(website, ''), city, service FROM businesses WHERE id = 4242;").strip().split("|")
+    return {"name": row[0], "website": row[1], "city": row[2], "service": row[3]}
+
+def apply_rest(db: Psql) -> None:
+    for path in sorted(MIGRATIONS.glob("*.sql")):
+        if not path.name.endswith(BASELINE):
+            db.run(path.read_text(encoding="utf-8"))
+    db.run("VACUUM ANALYZE businesses;")  # steady state: visibility map set, so index-only scans are possible
+
+def queries(p: Dict[str, Any]) -> List[Tuple[str, str, bool]]:
+    """(label, statement, run as anon)"""
+    city, service = _lit(p["city"]), _lit(p["service"])
+    cols = "name, address, phone, website, city, service, state, maps_url, review_count, avg_rating"
+    upsert_rows = ", ".join(
+        f"('Business {i}', 'https://www.biz{i}.example.com/', {city}, {service}, {i % 500})" for i in range(4242, 4252)
+    )
+    return [
+        ("backup_supabase_city (page 1)",
+         f"SELECT {cols}, id FROM businesses WHERE city = {city} ORDER BY id LIMIT 1000", False),
+        ("fetch_existing_scope (page 1)",
+         f"SELECT id, name, website FROM businesses WHERE city = {city} AND service = {service} ORDER BY id LIMIT 1000", False),
+        ("patch_one",
+         f"UPDATE businesses SET review_count = review_count + 1 WHERE name = {_lit(p['name'])} "
+         f"AND website = {_lit(p['website'])} AND city = {city} AND service = {service}", False),
+        ("upsert on_conflict (10 rows)",
+         f"INSERT INTO businesses (name, website, city, service, review_count) VALUES {upsert_rows} "
+         f"ON CONFLICT (name, website, city, service) DO UPDATE SET review_count = EXCLUDED.review_count", False),
+        ("delete_stale_for_scope (id=in, 300)",
+         "DELETE FROM businesses WHERE id IN (" + ",".join(str(i) for i in range(50000, 50300)) + ")", False),
+        ("delete_supabase_city",
+         f"DELETE FROM businesses WHERE city = {city}", False),
+        ("site page read (anon, RLS)",
+         f"SELECT * FROM businesses WHERE city = {city} AND service = {service}", True),
+    ]
+
+def _nodes(plan: Dict[str, Any]) -> List[str]:
+    out = []
+    name = plan["Node Type"]
+    if plan.get("Index Name"):
+        name += f" [{plan['Index Name']}]"
+    if name not in ("Result", "Limit", "ModifyTable"):
+        out.append(name)
+    for child in plan.get("Plans", []):
+        out.extend(_nodes(child))
+    return out
+
+def explain(db: Psql, statement: str, as_anon: bool) -> Dict[str, Any]:
+    role = "SET LOCAL ROLE anon;\n" if as_anon else ""
+    try:
+        out = db.run(f"BEGIN;\n{role}EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement};\nROLLBACK;")
+    except RuntimeError as e:
+        return {"error": str(e).splitlines()[0]}
+    doc = json.loads(out)[0]
+    plan = doc["Plan"]
+    return {
+        "ms": doc["Execution Time"],
+        "buffers": plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0),
+        "plan": " > ".join(_nodes(plan)) or plan["Node Type"],
+    }
+
+def check_business_key(db: Psql) -> int:
+    cases = [
+        {"name": "  Acme   Handyman ", "website": "HTTPS://WWW.Acme.com//", "maps_url": None},
+        {"name": "Acme\tHandyman", "website": "http://acme.com", "maps_url": "  "},
+        {"name": "No Site LLC", "website": None, "maps_url": None},
+        {"name": "No Site LLC", "website": "   ", "maps_url": ""},
+        {"name": "Mapped", "website": "x.com", "maps_url": " HTTPS://www.google.com/maps/place/Mapped "},
+        {"name": None, "website": "www.only-site.com/", "maps_url": None},
+    ]
+    values = ", ".join(f"({_lit(c['name'])}, {_lit(c['website'])}, {_lit(c['maps_url'])}, 'Parity', 'check ' || {i})"
+                       for i, c in enumerate(cases))
+    out = db.run(f"""
+        BEGIN;
+        INSERT INTO businesses (name, website, maps_url, city, service) VALUES {values};
+        SELECT business_key FROM businesses WHERE city = 'Parity' ORDER BY service;
+        ROLLBACK;
+    """)
+    got = out.strip().split("\n")
+    failures = 0
+    for case, key in zip(cases, got):
+        want = business_key_for(case)
+        if key != want:
+            failures += 1
+            print(f"  MISMATCH {case}: db={key!r} python={want!r}")
+    print(f"business_key parity: {len(cases) - failures}/{len(cases)} rows match records.business_key_for")
+    return failures
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="EXPLAIN benchmark of supabase/migrations on synthetic data")
+    ap.add_argument("--dsn", default=None, help="libpq connection string (default: PG* env vars)")
+    ap.add_argument("--psql", default="psql", help="psql binary")
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--keep", action="store_true", help=f"leave schema {SCHEMA} in place")
+    args = ap.parse_args()
+
+    db = Psql(args.psql, args.dsn)
+    params = setup(db, args.rows)
+    print(f"{args.rows} synthetic rows in {SCHEMA}.businesses; sample scope {params['city']} / {params['service']}\n")
+    stmts = queries(params)
+    before = [explain(db, sql, anon) for _, sql, anon in stmts]
+    apply_rest(db)
+    after = [explain(db, sql, anon) for _, sql, anon in stmts]
+
+    for (label, _, _), b, a in zip(stmts, before, after):
+        print(label)
+        for tag, r in (("before", b), ("after", a)):
+            if "error" in r:
+                print(f"  {tag:<7} ERROR: {r['error']}")
+            else:
+                print(f"  {tag:<7} {r['ms']:>8.2f} ms {r['buffers']:>6} buffers  {r['plan']}")
+    failures = check_business_key(db)
+    if not args.keep:
+        db.run(f"DROP SCHEMA {SCHEMA} CASCADE;")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
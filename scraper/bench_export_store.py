@@ -0,0 +1,92 @@
+# scraper/bench_export_store.py
+# Disk use and artifact size over simulated nights: timestamped exports vs the content-addressed ExportStore
+# - synthetic cities x services x rows; each night a share of the scopes changes (--churn)
+# - legacy: per city a new city_backup_<ts>.jsonl.gz snapshot, deep + flat JSON per scope, nothing pruned;
+#   artifact = exports/*.json
+# - store: scope rows + city snapshots through ExportStore (retention + gc), flat JSON only when changed;
+#   artifact = *_flat.json + manifest.json
+# Everything is written to a temporary directory.
+#
+# Usage: python scraper/bench_export_store.py [--nights 60] [--cities 60] [--services 5] [--rows 20] [--churn 0.1]
+
+import argparse
+import gzip
+import json
+import random
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from export_store import ExportStore
+
+DAY = 86400
+
+def _du(paths) -> int:
+    return sum(p.stat().st_size for p in paths if p.is_file())
+
+def _scope_rows(city: str, service: str, rows: int, version: int) -> List[Dict]:
+    return [{
+        "name": f"{service.title()} Pro {city} {i}", "address": f"{i} Main St, {city}, TN", "phone": f"+1615555{i:04d}",
+        "website": f"https://{service.replace(' ', '')}-{i}.example.com/", "city": city, "service": service,
+        "maps_url": f"https://www.google.com/maps/place/{city}-{service}-{i}",
+        "review_count": 10 * i + version, "avg_rating": 4.5,
+    } for i in range(rows)]
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Export / snapshot disk use over simulated nights")
+    ap.add_argument("--nights", type=int, default=60)
+    ap.add_argument("--cities", type=int, default=60)
+    ap.add_argument("--services", type=int, default=5)
+    ap.add_argument("--rows", type=int, default=20)
+    ap.add_argument("--churn", type=float, default=0.1, help="share of scopes that change per night")
+    args = ap.parse_args()
+
+    rnd = random.Random(7)
+    cities = [f"City {c}" for c in range(args.cities)]
+    services = [f"service {s}" for s in range(args.services)]
+    versions: Dict[Tuple[str, str], int] = {(c, s): 0 for c in cities for s in services}
+    start = 1_760_000_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = Path(tmp) / "legacy"
+        flat_dir = Path(tmp) / "exports"
+        legacy.mkdir()
+        flat_dir.mkdir()
+        store = ExportStore(Path(tmp) / "store", gc_grace_s=0)
+        print(f"{args.cities} cities x {args.services} services x {args.rows} rows, churn {args.churn:.0%}/night\n")
+        print(f"{'night':>5} {'legacy disk MB':>15} {'legacy artifact kB':>19} {'store disk MB':>14} "
+              f"{'store artifact kB':>18} {'blobs':>6}")
+        for night in range(1, args.nights + 1):
+            now = start + night * DAY
+            for scope in versions:
+                if night > 1 and rnd.random() < args.churn:
+                    versions[scope] += 1
+            for city in cities:
+                slug = city.lower().replace(" ", "_")
+                city_rows = [r for s in services for r in _scope_rows(city, s, args.rows, versions[(city, s)])]
+                # legacy: a new timestamped snapshot every night, deep + flat rewritten
+                with gzip.open(legacy / f"city_backup_{slug}_{now}.jsonl.gz", "wt", encoding="utf-8") as fh:
+                    fh.writelines(json.dumps(r) + "\n" for r in city_rows)
+                # store: snapshot blob (reused when unchanged) + retention
+                store.put_snapshot(city, city_rows, now=now)
+                for s in services:
+                    rows = _scope_rows(city, s, args.rows, versions[(city, s)])
+                    text = json.dumps(rows, ensure_ascii=False, indent=2)
+                    sslug = s.replace(" ", "_")
+                    (legacy / f"{slug}_{sslug}_deep.json").write_text(text, encoding="utf-8")
+                    (legacy / f"{slug}_{sslug}_flat.json").write_text(text, encoding="utf-8")
+                    _, changed = store.put_scope(city, s, rows)
+                    flat = flat_dir / f"{slug}_{sslug}_flat.json"
+                    if changed or not flat.exists():
+                        flat.write_text(text, encoding="utf-8")
+            gc = store.gc(now=now)
+            if night in (1, 7, 14, 30) or night == args.nights or night % 30 == 0:
+                legacy_disk = _du(legacy.iterdir())
+                legacy_artifact = _du(legacy.glob("*.json"))
+                store_disk = gc["bytes"] + _du([store.root / "manifest.json"]) + _du(flat_dir.iterdir())
+                store_artifact = _du(flat_dir.iterdir()) + _du([store.root / "manifest.json"])
+                print(f"{night:>5} {legacy_disk / 1e6:>15.2f} {legacy_artifact / 1e3:>19.0f} {store_disk / 1e6:>14.2f} "
+                      f"{store_artifact / 1e3:>18.0f} {gc['blobs']:>6}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# scraper/bench_history.py
+# Size and "last 90 days of a scope" query latency: history.py files vs scanning nightly JSON snapshots
+# - synthetic cities x services x rows over N nights: ranks drift (adjacent swaps), businesses enter / leave,
+#   review counts grow, ratings move now and then
+# - snapshots: one gzip'd JSON Lines city snapshot per night (what backup_supabase_city kept before the store)
+# - history: one HistoryStore.append per scope per night
+# - query: per-business (day, rank, rating, reviews) series of one scope over the last 90 days; both paths
+#   must return the same series
+# Everything is written to a temporary directory.
+#
+# Usage: python scraper/bench_history.py [--nights 365] [--cities 20] [--services 5] [--rows 20]
+
+import argparse
+import gzip
+import json
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from history import HistoryStore, scope_series
+from records import business_key_for
+from supabase_reader import read_snapshot
+
+def _du(directory: Path) -> int:
+    return sum(p.stat().st_size for p in directory.rglob("*") if p.is_file())
+
+def _scan_snapshots(snap_dir: Path, slug: str, service: str, first: date, today: date) -> Dict[str, List[Tuple]]:
+    out: Dict[str, List[Tuple]] = {}
+    for path in sorted(snap_dir.glob(f"city_backup_{slug}_*.jsonl.gz")):
+        day = date.fromisoformat(path.name[len(f"city_backup_{slug}_"):][:10])
+        if not first < day <= today:
+            continue
+        rank = 0
+        for row in read_snapshot(path):
+            if row["service"] != service:
+                continue
+            rank += 1
+            out.setdefault(business_key_for(row), []).append((day, rank, row["avg_rating"], row["review_count"]))
+    return out
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="history.py vs JSON snapshot scans")
+    ap.add_argument("--nights", type=int, default=365)
+    ap.add_argument("--cities", type=int, default=20)
+    ap.add_argument("--services", type=int, default=5)
+    ap.add_argument("--rows", type=int, default=20)
+    ap.add_argument("--days", type=int, default=90)
+    ap.add_argument("--queries", type=int, default=20)
+    args = ap.parse_args()
+
+    rnd = random.Random(11)
+    cities = [f"City {c}" for c in range(args.cities)]
+    services = [f"service {s}" for s in range(args.services)]
+    next_id = 0
+    scopes: Dict[Tuple[str, str], List[Dict]] = {}
+    for city in cities:
+        for service in services:
+            scopes[(city, service)] = []
+            for _ in range(args.rows):
+                next_id += 1
+                scopes[(city, service)].append({
+                    "name": f"Biz {next_id}", "website": f"https://biz{next_id}.example.com/", "city": city,
+                    "service": service, "maps_url": f"https://www.google.com/maps/place/biz{next_id}",
+                    "review_count": rnd.randint(0, 400), "avg_rating": round(rnd.uniform(3.5, 5.0), 1),
+                })
+    start = date(2025, 1, 1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snap_dir = Path(tmp) / "snapshots"
+        snap_dir.mkdir()
+        hist = HistoryStore(Path(tmp) / "history")
+        t_write = 0.0
+        for night in range(args.nights):
+            day = start + timedelta(days=night)
+            for (city, service), rows in scopes.items():
+                for i in range(len(rows) - 1):
+                    if rnd.random() < 0.1:
+                        rows[i], rows[i + 1] = rows[i + 1], rows[i]
+                if rnd.random() < 0.05:
+                    next_id += 1
+                    rows[rnd.randrange(len(rows))] = {
+                        "name": f"Biz {next_id}", "website": f"https://biz{next_id}.example.com/", "city": city,
+                        "service": service, "maps_url": f"https://www.google.com/maps/place/biz{next_id}",
+                        "review_count": 0, "avg_rating": None,
+                    }
+                for r in rows:
+                    if rnd.random() < 0.3:
+                        r["review_count"] += 1
+                    if rnd.random() < 0.02:
+                        r["avg_rating"] = round(rnd.uniform(3.5, 5.0), 1)
+                t0 = time.perf_counter()
+                hist.append(city, service, rows, day=day)
+                t_write += time.perf_counter() - t0
+            for city in cities:
+                slug = city.lower().replace(" ", "_")
+                with gzip.open(snap_dir / f"city_backup_{slug}_{day.isoformat()}.jsonl.gz", "wt", encoding="utf-8") as fh:
+                    for service in services:
+                        fh.writelines(json.dumps(r) + "\n" for r in scopes[(city, service)])
+
+        today = start + timedelta(days=args.nights - 1)
+        first = today - timedelta(days=args.days)
+        snap_ms, hist_ms = [], []
+        for q in range(args.queries):
+            city, service = cities[q % len(cities)], services[q % len(services)]
+            t0 = time.perf_counter()
+            expected = _scan_snapshots(snap_dir, city.lower().replace(" ", "_"), service, first, today)
+            snap_ms.append((time.perf_counter() - t0) * 1000)
+            t0 = time.perf_counter()
+            got = scope_series(HistoryStore(hist.directory), city, service, args.days, today)  # cold: file read + decode
+            hist_ms.append((time.perf_counter() - t0) * 1000)
+            if got != expected:
+                raise SystemExit(f"series mismatch for {city} / {service}")
+
+        scopes_n = len(scopes)
+        print(f"{args.cities} cities x {args.services} services x {args.rows} rows, {args.nights} nights "
+              f"({scopes_n * args.nights * args.rows} observations)\n")
+        print(f"{'':<22}{'size MB':>9}{'bytes/obs':>11}{f'{args.days}-day query ms (median)':>28}")
+        for label, size, ms in (("JSON snapshots", _du(snap_dir), snap_ms), ("history.py", _du(hist.directory), hist_ms)):
+            print(f"{label:<22}{size / 1e6:>9.2f}{size / (scopes_n * args.nights * args.rows):>11.2f}"
+                  f"{statistics.median(ms):>28.2f}")
+        print(f"\nhistory append: {t_write / (scopes_n * args.nights) * 1000:.3f} ms per scope run | "
+              f"{args.queries} queries: identical series from both paths")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# scraper/bench_http_list.py
+# List search cost per query: browser-free HTTP fetch (http_list.py) vs the Playwright list path
+#
+# Offline (default): parse CPU time and peak Python memory on the saved response bodies in
+#   scraper/fixtures/http_list/, plus a page inflated to a realistic Maps payload size.
+# Live (--live): the same queries through both paths against google.com, reporting wall latency,
+#   CPU seconds (this process + browser processes) and peak RSS of the process tree.
+#
+# Usage (from the repo root): python scraper/bench_http_list.py [--iterations 200]
+#        python scraper/bench_http_list.py --live "handyman in Franklin, TN" "handyman near Brentwood, TN" [--runs 2]
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from governor import process_tree
+from http_list import FIXTURE_DIR, parse_search_html, search_places
+
+def _inflate(html: str, target_bytes: int) -> str:
+    """Pad the embedded state with inert filler strings until the page is ~target_bytes."""
+    marker = "window.APP_INITIALIZATION_STATE=["
+    idx = html.index(marker) + len(marker)
+    filler = json.dumps(["x" * 1000] * max(0, (target_bytes - len(html)) // 1005))
+    return html[:idx] + filler + "," + html[idx:]
+
+def bench_parse(iterations: int) -> None:
+    pages: Dict[str, str] = {p.name: p.read_text(encoding="utf-8") for p in sorted(FIXTURE_DIR.glob("*.html"))}
+    biggest = max(pages.values(), key=len)
+    pages["inflated_800kB"] = _inflate(biggest, 800_000)
+    print(f"{'page':<34}{'bytes':>10}{'places':>8}{'cpu ms/parse':>14}{'peak MB':>10}")
+    for name, html in pages.items():
+        gc.collect()
+        tracemalloc.start()
+        places = parse_search_html(html)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        t0 = time.process_time()
+        for _ in range(iterations):
+            parse_search_html(html)
+        cpu_ms = (time.process_time() - t0) * 1000 / iterations
+        print(f"{name:<34}{len(html):>10}{len(places):>8}{cpu_ms:>14.2f}{peak / 1e6:>10.2f}")
+
+class _RssSampler:
+    def __init__(self, interval_s: float = 0.05):
+        self.interval_s = interval_s
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak_kb = max(self.peak_kb, sum(rss for _, rss in process_tree(os.getpid()).values()))
+            self._stop.wait(self.interval_s)
+
+    def __enter__(self) -> "_RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+def _cpu_s() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)  # browser processes, once they have exited
+    return own.ru_utime + own.ru_stime + kids.ru_utime + kids.ru_stime
+
+def _measure(label: str, queries: List[str], runs: int, fn: Callable[[List[str]], List[float]]) -> None:
+    gc.collect()
+    cpu0 = _cpu_s()
+    with _RssSampler() as rss:
+        latencies = fn(queries * runs)
+    cpu = _cpu_s() - cpu0
+    n = len(latencies)
+    lat = sorted(latencies)
+    print(f"{label:<10} queries={n} latency p50={lat[n // 2]:.2f}s max={lat[-1]:.2f}s | "
+          f"cpu/query={cpu / n:.2f}s | peak RSS (process tree)={rss.peak_kb / 1024:.0f} MB")
+
+def _http_path(queries: List[str]) -> List[float]:
+    out = []
+    for q in queries:
+        t0 = time.perf_counter()
+        places = search_places(q)
+        out.append(time.perf_counter() - t0)
+        print(f"  http    {q!r}: {len(places or [])} places{'' if places else ' (would fall back)'}")
+    return out
+
+def _browser_path(queries: List[str]) -> List[float]:
+    import scraper as S
+    from playwright.async_api import async_playwright
+    from throttle import AimdThrottle
+    S.THROTTLE = AimdThrottle(initial_rate=100, max_rate=100)  # measure the page, not the pacing
+
+    async def run() -> List[float]:
+        out = []
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True)
+            context = await browser.new_context()
+            await S.block_requests_for_list(context)
+            for q in queries:
+                t0 = time.perf_counter()
+                page = await context.new_page()
+                try:
+                    urls, _ = await S._perform_search_to_list(page, q)
+                finally:
+                    await page.close()
+                out.append(time.perf_counter() - t0)
+                print(f"  browser {q!r}: {len(urls)} places")
+            await browser.close()
+        return out
+    return asyncio.run(run())
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="HTTP vs browser list search benchmark")
+    ap.add_argument("--iterations", type=int, default=200, help="offline parses per page")
+    ap.add_argument("--live", nargs="+", metavar="QUERY", help="run both paths against google.com")
+    ap.add_argument("--runs", type=int, default=1, help="live: repetitions of the query list")
+    args = ap.parse_args()
+    if not args.live:
+        bench_parse(args.iterations)
+        return
+    # HTTP first: RUSAGE_CHILDREN only grows once the browser processes have exited
+    _measure("http", args.live, args.runs, _http_path)
+    _measure("browser", args.live, args.runs, _browser_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# scraper/bench_records.py
+# Memory/CPU benchmark: legacy Dict[str, Any] rows vs slotted Business records
+# Pipeline measured per path: build rows -> local dedupe -> batch dedupe -> PostgREST payload -> export JSON
+#
+# Usage: python scraper/bench_records.py [--rows 200000]
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from records import Business, business_key_for, normalize_text, _parse_int, _parse_float
+
+_PAYLOAD_FIELDS = {"name", "address", "phone", "website", "city", "service", "state", "maps_url", "review_count", "avg_rating"}
+_TEXT_FIELDS = {"name", "address", "phone", "website", "city", "service", "state", "maps_url"}
+
+def _raw(i: int) -> Dict[str, Any]:
+    return {
+        "name": f"Handyman Pro {i % 5000}",
+        "address": f"{i} Main St, Franklin, TN 37064",
+        "phone": f"+1615{i:07d}",
+        "website": f"https://www.pro{i % 5000}.example.com/",
+        "city": "Franklin",
+        "service": "handyman",
+        "maps_url": f"https://www.google.com/maps/place/pro{i}",
+        "review_count": i % 300,
+        "avg_rating": 4.5,
+    }
+
+# ---------- legacy dict path (as shipped before records.py) ----------
+def _legacy_payload_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    payload = {k: row.get(k) for k in _PAYLOAD_FIELDS}
+    for k in _TEXT_FIELDS:
+        v = payload.get(k)
+        payload[k] = str(v).strip() if v is not None else ""
+    payload["review_count"] = _parse_int(payload.get("review_count"))
+    payload["avg_rating"] = _parse_float(payload.get("avg_rating"))
+    return payload
+
+def dict_path(n: int) -> int:
+    rows = []
+    for i in range(n):
+        r = _raw(i)
+        rows.append({
+            "name": r["name"], "address": r["address"], "phone": r["phone"], "website": r["website"],
+            "city": r["city"], "service": r["service"], "review_count": r["review_count"],
+            "avg_rating": r["avg_rating"], "state": "TN", "maps_url": r["maps_url"],
+        })
+    seen = set()
+    local = []
+    for b in rows:
+        pair = (normalize_text(b.get("service")), business_key_for(b))
+        if pair not in seen:
+            seen.add(pair)
+            local.append(b)
+    seen3 = set()
+    final = []
+    for b in local:
+        trip = ((b.get("city") or "").strip(), normalize_text(b.get("service")), business_key_for(b))
+        if trip not in seen3:
+            seen3.add(trip)
+            final.append(b)
+    payload = [_legacy_payload_row(b) for b in final]
+    exported = json.dumps(final, ensure_ascii=False)
+    return len(payload) + len(exported)
+
+# ---------- slotted record path ----------
+def record_path(n: int) -> int:
+    rows = []
+    for i in range(n):
+        r = _raw(i)
+        rows.append(Business(
+            name=r["name"], address=r["address"], phone=r["phone"], website=r["website"],
+            city=r["city"], service=r["service"], review_count=r["review_count"],
+            avg_rating=r["avg_rating"], maps_url=r["maps_url"],
+        ))
+    seen = set()
+    local = []
+    for b in rows:
+        pair = (normalize_text(b.service), b.business_key)
+        if pair not in seen:
+            seen.add(pair)
+            local.append(b)
+    seen3 = set()
+    final = []
+    for b in local:
+        trip = (b.city, normalize_text(b.service), b.business_key)
+        if trip not in seen3:
+            seen3.add(trip)
+            final.append(b)
+    payload = [b.to_payload() for b in final]
+    exported = json.dumps([b.to_export() for b in final], ensure_ascii=False)
+    return len(payload) + len(exported)
+
+def _resident_bytes_per_row(n: int) -> Dict[str, float]:
+    """Retained size of n built rows (what every stage holds between steps)."""
+    out = {}
+    for label, build in (
+        ("dict", lambda i: {**_raw(i), "state": "TN"}),
+        ("record", lambda i: Business(**_raw(i))),
+    ):
+        gc.collect()
+        tracemalloc.start()
+        rows = [build(i) for i in range(n)]
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del rows
+        out[label] = size / n
+    return out
+
+def _measure(fn: Callable[[int], int], n: int) -> Dict[str, float]:
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    fn(n)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Second, untraced run for CPU time (tracemalloc inflates timings)
+    gc.collect()
+    c0 = time.process_time()
+    fn(n)
+    cpu = time.process_time() - c0
+    return {"peak_mb": peak / 1e6, "traced_s": elapsed, "cpu_s": cpu}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark dict rows vs Business records.")
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    results: List[tuple] = []
+    for label, fn in (("dict", dict_path), ("record", record_path)):
+        m = _measure(fn, args.rows)
+        results.append((label, m))
+        print(f"[BENCH] {label:<6} rows={args.rows} peak={m['peak_mb']:.1f} MB cpu={m['cpu_s']:.2f}s")
+
+    per_row = _resident_bytes_per_row(args.rows)
+    print(f"[BENCH] resident bytes/row: dict={per_row['dict']:.0f} record={per_row['record']:.0f}")
+
+    d, r = results[0][1], results[1][1]
+    print(f"[BENCH] record vs dict: peak memory x{r['peak_mb'] / d['peak_mb']:.2f}, cpu x{r['cpu_s'] / d['cpu_s']:.2f}")
+
+if __name__ == "__main__":
+    main()
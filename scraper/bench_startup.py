@@ -0,0 +1,94 @@
+# scraper/bench_startup.py
+# Cold-start time of the entry points (fresh interpreter per run, wall clock until exit)
+# - non-browser commands (--help, --plan, uploader, fixture check, library import) must stay under --target-ms
+# - the Playwright import is reported separately: only browser paths pay it (requests and asyncio are
+#   imported eagerly: upload / list threads use requests, and LazyLoader is not thread-safe on 3.11)
+# - python -X importtime of `import scraper` lists the heaviest modules still loaded eagerly
+#
+# Usage (from the repo root): python scraper/bench_startup.py [--runs 7] [--target-ms 300]
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+_LIB = "import sys; sys.path.insert(0, 'scraper'); "
+
+# (label, argv, browser path?)
+COMMANDS: List[Tuple[str, List[str], bool]] = [
+    ("interpreter floor", ["-c", "pass"], False),
+    ("scraper.py --help", ["scraper/scraper.py", "--help"], False),
+    ("scraper.py --shard 1/4 --plan", ["scraper/scraper.py", "--shard", "1/4", "--plan"], False),
+    ("upload_to_supabase.py --help", ["scraper/upload_to_supabase.py", "--help"], False),
+    ("http_list.py --check-fixtures", ["scraper/http_list.py", "--check-fixtures"], False),
+    ("import scraper (library)", ["-c", _LIB + "import scraper"], False),
+    ("import records (library)", ["-c", _LIB + "import records"], False),
+    ("+ playwright.async_api", ["-c", _LIB + "import scraper; scraper.playwright_api.async_playwright"], True),
+]
+
+def time_command(argv: List[str], runs: int) -> List[float]:
+    out = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        proc = subprocess.run([sys.executable, *argv], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        out.append((time.perf_counter() - t0) * 1000)
+        if proc.returncode != 0:
+            raise SystemExit(f"{' '.join(argv)} failed: {proc.stderr.decode(errors='replace')[-400:]}")
+    return out
+
+def import_profile(top: int) -> List[Tuple[int, str]]:
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", _LIB + "import scraper"],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    rows: List[Tuple[int, str]] = []
+    pending: List[Tuple[int, str]] = []
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2]
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        # importtime prints children before their parent: keep the depth-1 lines seen since the last
+        # top-level import and use them once that import turns out to be scraper itself
+        if depth == 0:
+            if name.strip() == "scraper":
+                rows = pending
+            pending = []
+        elif depth == 1:
+            pending.append((int(parts[1]), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Entry point cold-start benchmark")
+    ap.add_argument("--runs", type=int, default=7)
+    ap.add_argument("--target-ms", type=float, default=300.0,
+                    help="budget for non-browser commands, on top of the interpreter floor")
+    args = ap.parse_args()
+    os.environ.setdefault("PYTHONDONTWRITEBYTECODE", "0")
+    time_command(["-c", _LIB + "import scraper, upload_to_supabase"], 1)  # warm .pyc and the page cache
+
+    floor = None
+    failures = 0
+    print(f"{'command':<32}{'median ms':>10}{'min ms':>9}{'over floor':>12}")
+    for label, argv, browser in COMMANDS:
+        samples = time_command(argv, args.runs)
+        med, low = statistics.median(samples), min(samples)
+        if floor is None:
+            floor = med
+            print(f"{label:<32}{med:>10.0f}{low:>9.0f}")
+            continue
+        over = med - floor
+        verdict = "" if browser else ("  ok" if over <= args.target_ms else "  OVER TARGET")
+        failures += 0 if browser or over <= args.target_ms else 1
+        print(f"{label:<32}{med:>10.0f}{low:>9.0f}{over:>12.0f}{verdict}")
+    print("\nimport scraper — heaviest direct imports (cumulative µs):")
+    for us, name in import_profile(8):
+        print(f"  {us:>8}  {name}")
+    print(f"\n[RESULT] non-browser commands within {args.target_ms:.0f} ms of the floor: "
+          f"{'yes' if not failures else f'no ({failures} over)'}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
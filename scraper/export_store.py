@@ -0,0 +1,181 @@
+# scraper/export_store.py
+# Content-addressed store for scope exports and city snapshots (scraper/store/, cached across nights in CI)
+# - rows are canonicalized (Business.to_export(), sorted keys, compact) and hashed; the sha1 of that text
+#   names a gzip'd JSON Lines blob, so an unchanged scope or city is stored once however often it is written
+# - manifest.json: current blob of every (city, service) export and the retained snapshots of every city
+# - snapshot retention per city: the last N, plus the newest of each of the last D days and W ISO weeks
+# - gc() deletes blobs nothing references any more (after a grace period, so a concurrent writer is safe)
+#   and legacy timestamped city_backup_* files older than the weekly horizon
+# Blobs are read back with supabase_reader.read_snapshot().
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from records import Business
+
+MANIFEST = "manifest.json"
+BLOB_SUFFIX = ".jsonl.gz"
+
+def canonical_line(row: Any) -> str:
+    return json.dumps(Business.from_row(row).to_export(), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+def _scope_key(city: str, service: str) -> str:
+    return f"{city}|{service}"
+
+def retained(snapshots: List[Dict[str, Any]], keep_last: int, keep_daily: int, keep_weekly: int) -> List[Dict[str, Any]]:
+    """Snapshots kept by the policy, newest first (the same snapshot may satisfy several rules)."""
+    ordered = sorted(snapshots, key=lambda s: s["taken_at"], reverse=True)
+    keep = {id(s) for s in ordered[:keep_last]}
+    for rule, limit in (("%Y-%m-%d", keep_daily), ("%G-W%V", keep_weekly)):
+        seen = set()
+        for s in ordered:
+            bucket = datetime.fromtimestamp(s["taken_at"], timezone.utc).strftime(rule)
+            if bucket not in seen and len(seen) < limit:
+                seen.add(bucket)
+                keep.add(id(s))
+    return [s for s in ordered if id(s) in keep]
+
+class ExportStore:
+    def __init__(self, root: Path, keep_last: int = 3, keep_daily: int = 7, keep_weekly: int = 4,
+                 gc_grace_s: float = 3600.0):
+        self.root = root
+        self.keep_last = keep_last
+        self.keep_daily = keep_daily
+        self.keep_weekly = keep_weekly
+        self.gc_grace_s = gc_grace_s
+        self.stats = {"blobs_written": 0, "blobs_reused": 0, "bytes_written": 0}
+
+    def blob_path(self, digest: str) -> Path:
+        return self.root / "blobs" / digest[:2] / f"{digest}{BLOB_SUFFIX}"
+
+    def put_rows(self, rows: Iterable[Any]) -> Tuple[str, int]:
+        """Stream rows into a blob; returns (sha1, row count). An existing blob is left as it is."""
+        tmp_dir = self.root / "blobs"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        tmp = tmp_dir / f".{os.getpid()}.{time.time_ns()}.tmp"
+        h = hashlib.sha1()
+        count = 0
+        try:
+            with open(tmp, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0) as gz:
+                for row in rows:
+                    line = (canonical_line(row) + "\n").encode("utf-8")
+                    h.update(line)
+                    gz.write(line)
+                    count += 1
+            digest = h.hexdigest()
+            path = self.blob_path(digest)
+            if path.exists():
+                tmp.unlink()
+                os.utime(path)  # recently used: outside the gc grace period of a concurrent gc
+                self.stats["blobs_reused"] += 1
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp.replace(path)
+                self.stats["blobs_written"] += 1
+                self.stats["bytes_written"] += path.stat().st_size
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return digest, count
+
+    # ---------- manifest ----------
+    def manifest(self) -> Dict[str, Any]:
+        try:
+            return json.loads((self.root / MANIFEST).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {"scopes": {}, "snapshots": {}}
+        except ValueError as e:
+            logging.warning(f"[STORE] unreadable {self.root / MANIFEST}, starting a new one: {e}")
+            return {"scopes": {}, "snapshots": {}}
+
+    def _update(self, change: Callable[[Dict[str, Any]], None]) -> None:
+        # Re-read right before writing: per-city processes / shards may share the store
+        manifest = self.manifest()
+        change(manifest)
+        manifest["updated_at"] = datetime.now(timezone.utc).isoformat()
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / f"{MANIFEST}.{os.getpid()}.{time.time_ns()}.tmp"
+        tmp.write_text(json.dumps(manifest, ensure_ascii=False, sort_keys=True, separators=(",", ":")), encoding="utf-8")
+        tmp.replace(self.root / MANIFEST)
+
+    # ---------- scopes / snapshots ----------
+    def put_scope(self, city: str, service: str, rows: Iterable[Any]) -> Tuple[str, bool]:
+        """Record a scope's export rows; returns (sha1, changed since the previous export)."""
+        digest, count = self.put_rows(rows)
+        previous = self.manifest()["scopes"].get(_scope_key(city, service), {}).get("sha1")
+        if digest != previous:
+            def change(m: Dict[str, Any]) -> None:
+                m["scopes"][_scope_key(city, service)] = {
+                    "city": city, "service": service, "sha1": digest, "rows": count, "saved_at": int(time.time()),
+                }
+            self._update(change)
+        return digest, digest != previous
+
+    def put_snapshot(self, city: str, rows: Iterable[Any], now: Optional[float] = None) -> Path:
+        """Store a city snapshot, apply the retention policy to the city, return the blob path."""
+        digest, count = self.put_rows(rows)
+        taken_at = int(now if now is not None else time.time())
+        dropped: List[Dict[str, Any]] = []
+
+        def change(m: Dict[str, Any]) -> None:
+            current = m["snapshots"].get(city, []) + [{"sha1": digest, "rows": count, "taken_at": taken_at}]
+            kept = retained(current, self.keep_last, self.keep_daily, self.keep_weekly)
+            dropped.extend(s for s in current if s not in kept)
+            m["snapshots"][city] = kept
+        self._update(change)
+        if dropped:
+            logging.info(f"[STORE] {city}: {len(dropped)} snapshot(s) past retention")
+        return self.blob_path(digest)
+
+    # ---------- cleanup ----------
+    def referenced(self) -> set:
+        m = self.manifest()
+        refs = {s["sha1"] for s in m["scopes"].values()}
+        refs.update(s["sha1"] for snaps in m["snapshots"].values() for s in snaps)
+        return refs
+
+    def gc(self, legacy_dir: Optional[Path] = None, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        Delete unreferenced blobs (and legacy city_backup_* files older than the weekly horizon from `now`);
+        returns counts and bytes.
+        """
+        now = now if now is not None else time.time()
+        refs = self.referenced()
+        out = {"blobs": 0, "bytes": 0, "removed": 0, "freed": 0}
+        for path in sorted((self.root / "blobs").glob(f"*/*{BLOB_SUFFIX}")):
+            st = path.stat()
+            if path.name[: -len(BLOB_SUFFIX)] in refs or time.time() - st.st_mtime < self.gc_grace_s:
+                out["blobs"] += 1
+                out["bytes"] += st.st_size
+                continue
+            path.unlink(missing_ok=True)
+            out["removed"] += 1
+            out["freed"] += st.st_size
+        if legacy_dir is not None and legacy_dir.exists():
+            horizon = now - max(self.keep_weekly, 1) * 7 * 86400
+            for path in legacy_dir.glob("city_backup_*"):
+                st = path.stat()
+                if st.st_mtime < horizon:
+                    path.unlink(missing_ok=True)
+                    out["removed"] += 1
+                    out["freed"] += st.st_size
+
+        def change(m: Dict[str, Any]) -> None:
+            m["stats"] = {"blobs": out["blobs"], "bytes": out["bytes"]}
+        self._update(change)
+        return out
+
+    def describe(self, gc: Optional[Dict[str, int]] = None) -> str:
+        line = (f"{self.stats['blobs_written']} blobs written ({self.stats['bytes_written'] / 1e3:.0f} kB), "
+                f"{self.stats['blobs_reused']} unchanged")
+        if gc is not None:
+            line += (f" | store {gc['blobs']} blobs, {gc['bytes'] / 1e6:.1f} MB | pruned {gc['removed']} "
+                     f"({gc['freed'] / 1e6:.1f} MB)")
+        return line
@@ -1,49 +1,207 @@
 # scraper/flatten_reviews.py
+# Batch flattener for legacy *_deep exports -> *_flat.json (the rows upload_to_supabase.py and --merge-shards read)
+# - scraper.py no longer writes deep exports (its flat files and scraper/store blobs are already export rows),
+#   so this only converts deep files kept from older runs or produced by other tools
+# - discovers every *_deep.json / *_deep.jsonl / *_deep.jsonl.gz under the given files / directories
+# - both row shapes: nested reviews {rating, count} and the later flat avg_rating / review_count;
+#   output rows are records.Business.to_export() (same columns as scraper.py's own flat files)
+# - streaming I/O: rows are decoded one at a time and written one per line, never a whole file in memory
+# - up to date = output newer than its input, or input unchanged by hash since the last flatten
+#   (hashes in scraper/state/flatten.json; survives checkouts / cache restores that reset mtimes)
+# - files are spread over a process pool; reports files/s and rows/s
+#
+# Usage (from the repo root): python scraper/flatten_reviews.py [PATH ...] [--workers N] [--force]
 
+import argparse
+import gzip
+import hashlib
 import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional, Tuple
 
-INPUT_PATH = "scraper/exports/franklin_handyman_deep.json"
-OUTPUT_PATH = "scraper/exports/franklin_handyman_flat.json"
+from records import Business
 
-def flatten_business(b):
-    flat = {
-        "name": b.get("name", ""),
-        "website": b.get("website", ""),
-        "phone": b.get("phone", ""),
-        "address": b.get("address", ""),
-        "city": b.get("city", ""),
-        "service": b.get("service", ""),
-    }
+EXPORT_DIR = Path("scraper/exports")
+STATE_PATH = Path("scraper/state/flatten.json")
+DEEP_SUFFIXES = ("_deep.json", "_deep.jsonl", "_deep.jsonl.gz")
+READ_CHUNK = 1 << 16
 
-    # Flatten reviews
-    reviews = b.get("reviews", {})
-    rating = reviews.get("rating")
-    count = reviews.get("count")
+def flatten_business(b: Dict[str, Any]) -> Dict[str, Any]:
+    """Export row for either deep shape; the nested reviews block only fills fields the row lacks."""
+    reviews = b.get("reviews")
+    if isinstance(reviews, dict):
+        b = dict(b)
+        if b.get("avg_rating") is None:
+            b["avg_rating"] = reviews.get("rating")
+        if b.get("review_count") is None:
+            b["review_count"] = reviews.get("count")
+    return Business.from_row(b).to_export()
 
-    flat["review_count"] = count if isinstance(count, int) else 0
+def flat_path_for(path: Path) -> Path:
+    for suffix in DEEP_SUFFIXES:
+        if path.name.endswith(suffix):
+            return path.with_name(path.name[: -len(suffix)] + "_flat.json")
+    raise ValueError(f"not a deep export: {path}")
 
-    try:
-        flat["avg_rating"] = round(float(rating), 2) if rating else None
-    except:
-        flat["avg_rating"] = None
+def discover(paths: Iterable[Path]) -> List[Path]:
+    found = set()
+    for p in paths:
+        if p.is_dir():
+            found.update(f for suffix in DEEP_SUFFIXES for f in p.rglob(f"*{suffix}"))
+        elif p.name.endswith(DEEP_SUFFIXES):
+            found.add(p)
+    return sorted(found)
 
-    return flat
+def _iter_json_array(fh: IO[str]) -> Iterator[Dict[str, Any]]:
+    """Elements of a top-level JSON array, decoded incrementally (READ_CHUNK characters at a time)."""
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+    started = False
+    while True:
+        # Skip whitespace and separators; top up the buffer when it runs dry
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            chunk = fh.read(READ_CHUNK)
+            buf, pos, eof = chunk, 0, not chunk
+        if pos >= len(buf):
+            if started:
+                raise ValueError("unterminated JSON array")
+            return
+        if not started:
+            if buf[pos] != "[":
+                raise ValueError("expected a JSON array")
+            started, pos = True, pos + 1
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+            # A value ending exactly at the buffer edge may be a cut-off number: decode it again with more input
+            complete = eof or end < len(buf)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            chunk = fh.read(READ_CHUNK)
+            buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+            continue
+        yield value
+        pos = end
 
-def main():
-    if not os.path.exists(INPUT_PATH):
-        print(f"[ERROR] Input file not found: {INPUT_PATH}")
+def iter_deep_rows(path: Path) -> Iterator[Dict[str, Any]]:
+    if path.name.endswith(".json"):
+        with open(path, "r", encoding="utf-8-sig") as fh:
+            yield from _iter_json_array(fh)
         return
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
+
+def _sha1(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def flatten_file(path: Path, out: Path) -> int:
+    """Stream path -> out (a JSON array, one row per line), written atomically. Returns the row count."""
+    tmp = out.with_name(out.name + ".tmp")
+    count = 0
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write("[")
+        for row in iter_deep_rows(path):
+            fh.write(",\n" if count else "\n")
+            fh.write(json.dumps(flatten_business(row), ensure_ascii=False))
+            count += 1
+        fh.write("\n]\n")
+    tmp.replace(out)
+    return count
+
+def process(job: Tuple[str, Optional[str], bool]) -> Dict[str, Any]:
+    """Worker: (input path, sha1 from the last flatten, force) -> what was done."""
+    src, known_sha1, force = Path(job[0]), job[1], job[2]
+    out = flat_path_for(src)
+    result: Dict[str, Any] = {"path": job[0], "rows": 0}
+    try:
+        if not force and out.exists() and out.stat().st_mtime_ns >= src.stat().st_mtime_ns:
+            return {**result, "status": "fresh"}
+        digest = _sha1(src)
+        result["sha1"] = digest
+        if not force and out.exists() and digest == known_sha1:
+            return {**result, "status": "same-hash"}
+        result["rows"] = flatten_file(src, out)
+        return {**result, "status": "flattened"}
+    except (OSError, ValueError) as e:
+        return {**result, "status": "error", "error": str(e)}
 
-    with open(INPUT_PATH, "r", encoding="utf-8") as f:
-        data = json.load(f)
+def _load_state() -> Dict[str, str]:
+    try:
+        return json.loads(STATE_PATH.read_text(encoding="utf-8")).get("sha1", {})
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _save_state(hashes: Dict[str, str]) -> None:
+    try:
+        STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp = STATE_PATH.with_name(STATE_PATH.name + ".tmp")
+        tmp.write_text(json.dumps({"sha1": hashes}, indent=1, sort_keys=True), encoding="utf-8")
+        tmp.replace(STATE_PATH)
+    except OSError as e:
+        print(f"[WARN] could not save {STATE_PATH}: {e}")
 
-    flattened = [flatten_business(b) for b in data]
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Flatten legacy *_deep exports into *_flat.json")
+    ap.add_argument("paths", nargs="*", type=Path, default=[EXPORT_DIR], help=f"files or directories (default {EXPORT_DIR})")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--force", action="store_true", help="re-flatten even when the output is up to date")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    files = discover(args.paths)
+    if not files:
+        print(f"[FLATTEN] no *_deep exports under {', '.join(map(str, args.paths))} "
+              f"(scraper.py writes *_flat.json directly; nothing to do)")
+        return
+    hashes = _load_state()
+    jobs = [(str(f), hashes.get(str(f)), args.force) for f in files]
+    workers = max(1, min(args.workers, len(jobs)))
+    if workers == 1:
+        results = [process(job) for job in jobs]
+    else:
+        # Many small scope files: hand them out in chunks so the pool is not all IPC
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(process, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    elapsed = max(time.perf_counter() - t0, 1e-9)
 
-    with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
-        json.dump(flattened, f, indent=2)
+    counts: Dict[str, int] = {}
+    rows = 0
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+        rows += r["rows"]
+        if r.get("sha1") and r["status"] != "error":
+            hashes[r["path"]] = r["sha1"]
+        if r["status"] == "error":
+            print(f"[ERROR] {r['path']}: {r['error']}")
+    _save_state(hashes)
 
-    print(f"[SUCCESS] Flattened {len(flattened)} businesses → saved to: {OUTPUT_PATH}")
+    done = counts.get("flattened", 0)
+    print(f"[FLATTEN] {len(files)} files: {done} flattened, "
+          f"{counts.get('fresh', 0) + counts.get('same-hash', 0)} up to date "
+          f"({counts.get('same-hash', 0)} by hash), {counts.get('error', 0)} errors | {workers} workers")
+    print(f"[FLATTEN] {rows} rows in {elapsed:.2f}s — {len(files) / elapsed:.0f} files/s, "
+          f"{done / elapsed:.0f} flattened files/s, {rows / elapsed:.0f} rows/s")
+    if counts.get("error"):
+        raise SystemExit(1)
 
 if __name__ == "__main__":
     main()
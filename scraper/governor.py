@@ -0,0 +1,197 @@
+# scraper/governor.py
+# Resource governor for browser work
+# - samples RSS and CPU of this process and every descendant (Playwright driver + Chromium) from /proc
+# - grants / revokes detail-page slots between min and max: fewer when memory or CPU runs hot, more when idle
+# - asks for a browser restart when the browser's own footprint crosses a threshold (caller restarts between scopes)
+# - summary() gives peak / average use for the run summary
+# Linux only (/proc); elsewhere it holds the minimum slot count and never restarts.
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_KB = (os.sysconf("SC_PAGE_SIZE") // 1024) if hasattr(os, "sysconf") else 4
+
+def _read_stat(pid: int) -> Optional[Tuple[int, int, int]]:
+    """(ppid, cpu ticks, rss kB) from /proc/<pid>/stat, or None if the process is gone."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as fh:
+            fields = fh.read().rsplit(b")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    # fields[0] is state (stat field 3): ppid=4, utime=14, stime=15, rss=24 (pages)
+    return int(fields[1]), int(fields[11]) + int(fields[12]), int(fields[21]) * _PAGE_KB
+
+def process_tree(root: int) -> Dict[int, Tuple[int, int]]:
+    """{pid: (cpu ticks, rss kB)} for root and all its descendants."""
+    stats: Dict[int, Tuple[int, int, int]] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return {}
+    for entry in entries:
+        if entry.isdigit():
+            st = _read_stat(int(entry))
+            if st is not None:
+                stats[int(entry)] = st
+    children: Dict[int, List[int]] = {}
+    for pid, (ppid, _, _) in stats.items():
+        children.setdefault(ppid, []).append(pid)
+    out: Dict[int, Tuple[int, int]] = {}
+    stack = [root]
+    while stack:
+        pid = stack.pop()
+        if pid in stats:
+            out[pid] = stats[pid][1:]
+        stack.extend(children.get(pid, []))
+    return out
+
+def total_memory_mb() -> Optional[float]:
+    try:
+        with open("/proc/meminfo", "r") as fh:
+            for line in fh:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+class ResourceGovernor:
+    """
+    Adjustable page-slot pool. slot() blocks while `slots` pages are already in use.
+    mem_limit_mb bounds the whole tree (0 = 70% of RAM, read on the first sample); above
+    high_water x limit a slot is revoked, below low_water x limit (and CPU under cpu_high) one is granted back.
+    """
+
+    def __init__(self, min_slots: int = 1, max_slots: int = 3, mem_limit_mb: float = 0,
+                 restart_browser_mb: float = 1500, cpu_high: float = 0.85,
+                 high_water: float = 0.85, low_water: float = 0.6, interval_s: float = 1.0):
+        self.min_slots = max(1, min_slots)
+        self.max_slots = max(self.min_slots, max_slots)
+        self.mem_limit_mb = mem_limit_mb
+        self.restart_browser_mb = restart_browser_mb
+        self.cpu_high = cpu_high
+        self.high_water = high_water
+        self.low_water = low_water
+        self.interval_s = interval_s
+        self.enabled = os.path.isdir("/proc")
+        self.slots = self.min_slots
+        self.in_use = 0
+        self._cond: Optional[asyncio.Condition] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last: Optional[Tuple[float, Dict[int, int]]] = None
+        self._pid = os.getpid()
+        self._ncpu = os.cpu_count() or 1
+        self.stats = {"samples": 0, "rss_sum_mb": 0.0, "rss_peak_mb": 0.0, "browser_peak_mb": 0.0,
+                      "py_peak_mb": 0.0, "cpu_sum": 0.0, "cpu_peak": 0.0, "grants": 0, "revokes": 0,
+                      "restarts": 0, "slots_peak": self.slots}
+        self.browser_mb = 0.0
+
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    @asynccontextmanager
+    async def slot(self):
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self.in_use < self.slots)
+            self.in_use += 1
+        try:
+            yield
+        finally:
+            async with cond:
+                self.in_use -= 1
+                cond.notify_all()
+
+    def sample(self) -> Optional[Dict[str, float]]:
+        """Take one measurement and adjust slots. Returns the measurement (None without /proc)."""
+        if not self.enabled:
+            return None
+        tree = process_tree(self._pid)
+        if not tree:
+            return None
+        if not self.mem_limit_mb:
+            self.mem_limit_mb = 0.7 * (total_memory_mb() or 4096)
+        now = time.monotonic()
+        ticks = {pid: t for pid, (t, _) in tree.items()}
+        py_mb = tree.get(self._pid, (0, 0))[1] / 1024
+        rss_mb = sum(rss for _, rss in tree.values()) / 1024
+        self.browser_mb = rss_mb - py_mb
+        cpu = 0.0
+        if self._last is not None:
+            t_prev, prev = self._last
+            # Only processes alive in both samples: exited ones would make the delta negative
+            used = sum(max(0, t - prev[pid]) for pid, t in ticks.items() if pid in prev)
+            cpu = used / _CLK_TCK / max(1e-6, now - t_prev) / self._ncpu
+        self._last = (now, ticks)
+
+        s = self.stats
+        s["samples"] += 1
+        s["rss_sum_mb"] += rss_mb
+        s["rss_peak_mb"] = max(s["rss_peak_mb"], rss_mb)
+        s["browser_peak_mb"] = max(s["browser_peak_mb"], self.browser_mb)
+        s["py_peak_mb"] = max(s["py_peak_mb"], py_mb)
+        s["cpu_sum"] += cpu
+        s["cpu_peak"] = max(s["cpu_peak"], cpu)
+
+        old = self.slots
+        if rss_mb > self.high_water * self.mem_limit_mb or cpu > self.cpu_high:
+            self.slots = max(self.min_slots, self.slots - 1)
+        elif rss_mb < self.low_water * self.mem_limit_mb and cpu < self.cpu_high * 0.7:
+            self.slots = min(self.max_slots, self.slots + 1)
+        if self.slots != old:
+            s["grants" if self.slots > old else "revokes"] += 1
+            s["slots_peak"] = max(s["slots_peak"], self.slots)
+            logging.info(f"[GOVERNOR] page slots {old} -> {self.slots} (rss {rss_mb:.0f} MB, cpu {cpu * 100:.0f}%)")
+            if self.slots > old and self._cond is not None:
+                asyncio.get_running_loop().create_task(self._wake())
+        return {"rss_mb": rss_mb, "browser_mb": self.browser_mb, "py_mb": py_mb, "cpu": cpu}
+
+    async def _wake(self) -> None:
+        async with self._condition():
+            self._condition().notify_all()
+
+    @property
+    def should_restart_browser(self) -> bool:
+        return self.enabled and self.restart_browser_mb > 0 and self.browser_mb > self.restart_browser_mb
+
+    def note_restart(self) -> None:
+        self.stats["restarts"] += 1
+        self.browser_mb = 0.0
+        self._last = None
+
+    async def _run(self) -> None:
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval_s)
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def summary(self) -> str:
+        s = self.stats
+        if not s["samples"]:
+            return "no samples (/proc unavailable)"
+        return (f"rss avg {s['rss_sum_mb'] / s['samples']:.0f} MB / peak {s['rss_peak_mb']:.0f} MB "
+                f"(browser peak {s['browser_peak_mb']:.0f}, python peak {s['py_peak_mb']:.0f}) | "
+                f"cpu avg {s['cpu_sum'] / s['samples'] * 100:.0f}% / peak {s['cpu_peak'] * 100:.0f}% of {self._ncpu} cores | "
+                f"slots {self.min_slots}-{self.max_slots}, peak {s['slots_peak']}, +{s['grants']}/-{s['revokes']} | "
+                f"browser restarts {s['restarts']}")
@@ -0,0 +1,295 @@
+# scraper/history.py
+# Rank / rating / review-count history per scope (append-only, one small file per (city, service))
+# - one block per scope run, appended when the scope finishes: run day, then three columns in rank order
+#   (rank = position in the scope's export): business key id | avg_rating | review_count
+# - business keys (records.business_key_for) are dictionary-encoded per file; a block carries the keys it
+#   sees for the first time, with a display name
+# - every column value is a zigzag varint delta (key id vs the previous row, rating x10 / review count vs the
+#   business's previous observation), so a quiet night costs about one byte per column per business
+# - reading a scope is one sequential decode of its file; scope_series() / scope_changes() answer
+#   "how did this scope move over the last N days"
+# Files: <dir>/<city>__<service>.hist (scraper/store/history, cached with the export store in CI)
+#
+# Usage (from the repo root): python scraper/history.py CITY SERVICE [--days 90]
+
+import argparse
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from records import business_key_for
+
+MAGIC = b"HIST1\n"
+EPOCH = date(1970, 1, 1)
+
+Run = Tuple[date, List[Tuple[str, Optional[float], Optional[int]]]]  # (day, [(key, rating, reviews)] in rank order)
+
+# ---------- varints ----------
+def _put(buf: bytearray, n: int) -> None:
+    while n >= 0x80:
+        buf.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+def _put_z(buf: bytearray, n: int) -> None:
+    _put(buf, (n << 1) ^ (n >> 63))
+
+def _get(data: bytes, pos: int) -> Tuple[int, int]:
+    n = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+def _get_z(data: bytes, pos: int) -> Tuple[int, int]:
+    n, pos = _get(data, pos)
+    return (n >> 1) ^ -(n & 1), pos
+
+def _put_str(buf: bytearray, s: str) -> None:
+    raw = s.encode("utf-8")
+    _put(buf, len(raw))
+    buf += raw
+
+def _get_str(data: bytes, pos: int) -> Tuple[str, int]:
+    n, pos = _get(data, pos)
+    return data[pos:pos + n].decode("utf-8"), pos + n
+
+# Stored values: 0 = missing, else rating x10 + 1 / count + 1
+def _enc_rating(v: Any) -> int:
+    return 0 if v is None else int(round(float(v) * 10)) + 1
+
+def _enc_count(v: Any) -> int:
+    return 0 if v is None else int(v) + 1
+
+class _ScopeFile:
+    """Decoded state of one scope file: what the next appended block is encoded against."""
+
+    def __init__(self) -> None:
+        self.keys: List[str] = []
+        self.names: Dict[str, str] = {}
+        self.ids: Dict[str, int] = {}
+        self.last_rating: List[int] = []
+        self.last_count: List[int] = []
+        self.last_day = 0
+        self.runs: List[Tuple[int, List[Tuple[int, int, int]]]] = []  # (day number, [(id, rating, count)])
+
+    def decode(self, data: bytes) -> int:
+        """Replay every block; returns the length of the intact prefix (a torn last append is dropped)."""
+        if not data.startswith(MAGIC):
+            raise ValueError("not a history file")
+        pos = len(MAGIC)
+        while pos < len(data):
+            try:
+                size, start = _get(data, pos)
+            except IndexError:
+                break
+            end = start + size
+            if end > len(data):
+                break
+            self._decode_block(data, start)
+            pos = end
+        return pos
+
+    def _decode_block(self, data: bytes, pos: int) -> None:
+        delta, pos = _get_z(data, pos)
+        day = self.last_day + delta
+        n_new, pos = _get(data, pos)
+        for _ in range(n_new):
+            key, pos = _get_str(data, pos)
+            name, pos = _get_str(data, pos)
+            self._add_key(key, name)
+        n, pos = _get(data, pos)
+        cols: List[List[int]] = []
+        for _ in range(3):
+            col = []
+            for _ in range(n):
+                v, pos = _get_z(data, pos)
+                col.append(v)
+            cols.append(col)
+        rows = []
+        prev_id = -1
+        for d_id, d_rating, d_count in zip(*cols):
+            kid = prev_id + 1 + d_id
+            prev_id = kid
+            self.last_rating[kid] += d_rating
+            self.last_count[kid] += d_count
+            rows.append((kid, self.last_rating[kid], self.last_count[kid]))
+        self.runs.append((day, rows))
+        self.last_day = day
+
+    def _add_key(self, key: str, name: str) -> int:
+        self.ids[key] = len(self.keys)
+        self.keys.append(key)
+        self.names[key] = name
+        self.last_rating.append(0)
+        self.last_count.append(0)
+        return self.ids[key]
+
+    def encode(self, day: int, rows: Sequence[Any]) -> bytes:
+        new = bytearray()
+        n_new = 0
+        ids: List[int] = []
+        ratings: List[int] = []
+        counts: List[int] = []
+        seen = set()
+        for row in rows:
+            key = business_key_for(row)
+            if key in seen:
+                continue  # a key holds one rank per run
+            seen.add(key)
+            kid = self.ids.get(key)
+            if kid is None:
+                kid = self._add_key(key, row.get("name") or "")
+                _put_str(new, key)
+                _put_str(new, self.names[key])
+                n_new += 1
+            ids.append(kid)
+            ratings.append(_enc_rating(row.get("avg_rating")))
+            counts.append(_enc_count(row.get("review_count")))
+
+        body = bytearray()
+        _put_z(body, day - self.last_day)
+        _put(body, n_new)
+        body += new
+        _put(body, len(ids))
+        prev_id = -1
+        for kid in ids:
+            _put_z(body, kid - prev_id - 1)
+            prev_id = kid
+        for kid, v in zip(ids, ratings):
+            _put_z(body, v - self.last_rating[kid])
+            self.last_rating[kid] = v
+        for kid, v in zip(ids, counts):
+            _put_z(body, v - self.last_count[kid])
+            self.last_count[kid] = v
+        self.runs.append((day, [(kid, r, c) for kid, r, c in zip(ids, ratings, counts)]))
+        self.last_day = day
+        block = bytearray()
+        _put(block, len(body))
+        return bytes(block + body)
+
+class HistoryStore:
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._open: Dict[Tuple[str, str], _ScopeFile] = {}
+
+    def path(self, city: str, service: str) -> Path:
+        slug = "__".join(part.lower().replace(" ", "_").replace("/", "_") for part in (city, service))
+        return self.directory / f"{slug}.hist"
+
+    def _load(self, city: str, service: str) -> _ScopeFile:
+        scope = self._open.get((city, service))
+        if scope is None:
+            scope = _ScopeFile()
+            path = self.path(city, service)
+            try:
+                data = path.read_bytes()
+            except FileNotFoundError:
+                data = b""
+            if data:
+                intact = scope.decode(data)
+                if intact < len(data):
+                    with open(path, "r+b") as fh:  # later appends must follow the last complete block
+                        fh.truncate(intact)
+            self._open[(city, service)] = scope
+        return scope
+
+    def append(self, city: str, service: str, rows: Sequence[Any], day: Optional[date] = None) -> int:
+        """Append one run of the scope (rows in rank order); returns the bytes written."""
+        day = day or datetime.now(timezone.utc).date()
+        scope = self._load(city, service)
+        path = self.path(city, service)
+        block = scope.encode((day - EPOCH).days, rows)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "ab") as fh:
+            if fh.tell() == 0:
+                fh.write(MAGIC)
+            fh.write(block)  # one write per run: a crash can only tear the last block
+        return len(block)
+
+    def runs(self, city: str, service: str, days: Optional[int] = None, today: Optional[date] = None) -> Iterator[Run]:
+        """Runs of the scope, oldest first; several runs on one day collapse to the last one."""
+        scope = self._load(city, service)
+        first = ((today or datetime.now(timezone.utc).date()) - EPOCH).days - days if days else None
+        by_day: Dict[int, List[Tuple[int, int, int]]] = {}
+        for day, rows in scope.runs:
+            if first is None or day > first:
+                by_day[day] = rows
+        for day in sorted(by_day):
+            yield EPOCH + timedelta(days=day), [
+                (scope.keys[kid], (r - 1) / 10 if r else None, c - 1 if c else None) for kid, r, c in by_day[day]
+            ]
+
+    def names(self, city: str, service: str) -> Dict[str, str]:
+        return self._load(city, service).names
+
+def scope_series(store: HistoryStore, city: str, service: str, days: int = 90,
+                 today: Optional[date] = None) -> Dict[str, List[Tuple[date, int, Optional[float], Optional[int]]]]:
+    """business_key -> [(day, rank, avg_rating, review_count)] for the days it was listed."""
+    out: Dict[str, List[Tuple[date, int, Optional[float], Optional[int]]]] = {}
+    for day, rows in store.runs(city, service, days, today):
+        for rank, (key, rating, reviews) in enumerate(rows, start=1):
+            out.setdefault(key, []).append((day, rank, rating, reviews))
+    return out
+
+def scope_changes(store: HistoryStore, city: str, service: str, days: int = 90,
+                  today: Optional[date] = None) -> Dict[str, Any]:
+    """First vs last run in the window: who entered / left, rank moves, rating and review changes."""
+    runs = list(store.runs(city, service, days, today))
+    if not runs:
+        return {"runs": 0, "rows": []}
+    series = scope_series(store, city, service, days, today)
+    names = store.names(city, service)
+    first_day, first_rows = runs[0]
+    last_day, last_rows = runs[-1]
+    first_rank = {key: rank for rank, (key, _, _) in enumerate(first_rows, start=1)}
+    last_keys = {key for key, _, _ in last_rows}
+    rows = []
+    for key, points in series.items():
+        first, last = points[0], points[-1]
+        rows.append({
+            "business_key": key,
+            "name": names.get(key, ""),
+            "rank_from": first_rank.get(key),
+            "rank_to": last[1] if key in last_keys else None,
+            "best_rank": min(p[1] for p in points),
+            "days_listed": len(points),
+            "rating_from": first[2],
+            "rating_to": last[2],
+            "reviews_gained": (last[3] - first[3]) if last[3] is not None and first[3] is not None else None,
+        })
+    rows.sort(key=lambda r: (r["rank_to"] is None, r["rank_to"] or r["best_rank"]))
+    return {
+        "runs": len(runs),
+        "from": first_day.isoformat(),
+        "to": last_day.isoformat(),
+        "entered": sum(1 for r in rows if r["rank_from"] is None and r["rank_to"] is not None),
+        "left": sum(1 for r in rows if r["rank_from"] is not None and r["rank_to"] is None),
+        "rows": rows,
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="How a scope's ranking changed over the last N days")
+    ap.add_argument("city")
+    ap.add_argument("service")
+    ap.add_argument("--days", type=int, default=90)
+    ap.add_argument("--dir", type=Path, default=Path("scraper/store/history"))
+    args = ap.parse_args()
+
+    report = scope_changes(HistoryStore(args.dir), args.city, args.service, args.days)
+    if not report["runs"]:
+        print(f"[HISTORY] no runs of {args.city} / {args.service} in the last {args.days} days")
+        return
+    print(f"[HISTORY] {args.city} / {args.service}: {report['runs']} runs {report['from']} .. {report['to']} | "
+          f"entered {report['entered']}, left {report['left']}")
+    fmt = lambda v: "-" if v is None else str(v)
+    print(f"{'rank':>9} {'best':>4} {'days':>4} {'rating':>9} {'reviews+':>8}  name")
+    for r in report["rows"]:
+        print(f"{fmt(r['rank_from']):>4}->{fmt(r['rank_to']):<4} {r['best_rank']:>4} {r['days_listed']:>4} "
+              f"{fmt(r['rating_from']):>4}>{fmt(r['rating_to']):<4} {fmt(r['reviews_gained']):>8}  {r['name']}")
+
+if __name__ == "__main__":
+    main()
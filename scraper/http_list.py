@@ -0,0 +1,145 @@
+# scraper/http_list.py
+# Browser-free Maps list search
+# - one GET of /maps/search/<query> on a pooled requests.Session (no Chromium page, no app boot, no scrolling)
+# - results are read from the embedded APP_INITIALIZATION_STATE: every ")]}'"-prefixed JSON string inside
+#   it is decoded and walked for place arrays ([10] = feature id 0x..:0x.., [11] = name, [78] = place id)
+# - anything unexpected (consent/CAPTCHA page, changed payload) returns None -> caller uses Playwright
+# - offline fixtures: scraper/fixtures/http_list/<name>.html + <name>.json (python scraper/http_list.py --check-fixtures)
+
+from __future__ import annotations
+
+import json
+import re
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import quote, quote_plus
+
+import requests
+
+from page_state import OK, classify
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "fixtures" / "http_list"
+
+_STATE_RE = re.compile(r"window\.APP_INITIALIZATION_STATE\s*=\s*")
+_FEATURE_ID = re.compile(r"^0x[0-9a-f]+:0x[0-9a-f]+$", re.I)
+_XSSI = ")]}'"
+_HEADERS = {
+    "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                   "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"),
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+_local = threading.local()
+
+def _session() -> requests.Session:
+    """One pooled session per thread (requests.Session is not safe to share across threads)."""
+    s = getattr(_local, "session", None)
+    if s is None:
+        s = requests.Session()
+        s.headers.update(_HEADERS)
+        # Pre-accepted consent, otherwise EU egress IPs get the consent interstitial
+        s.cookies.set("CONSENT", "YES+cb", domain=".google.com")
+        adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=4)
+        s.mount("https://", adapter)
+        _local.session = s
+    return s
+
+def _initial_state(html: str) -> Optional[Any]:
+    m = _STATE_RE.search(html)
+    if not m:
+        return None
+    try:
+        value, _ = json.JSONDecoder().raw_decode(html, m.end())
+    except ValueError:
+        return None
+    return value
+
+def _payloads(node: Any) -> Iterator[Any]:
+    """Decode every XSSI-prefixed JSON string nested anywhere in node."""
+    stack = [node]
+    while stack:
+        cur = stack.pop()
+        if isinstance(cur, list):
+            stack.extend(reversed(cur))
+        elif isinstance(cur, str) and cur.startswith(_XSSI):
+            try:
+                yield json.loads(cur[len(_XSSI):])
+            except ValueError:
+                continue
+
+def _places(node: Any) -> Iterator[List[Any]]:
+    """Place arrays in document order: lists whose [10] is a feature id and [11] a name."""
+    stack = [node]
+    while stack:
+        cur = stack.pop()
+        if not isinstance(cur, list):
+            continue
+        if (len(cur) > 11 and isinstance(cur[10], str) and _FEATURE_ID.match(cur[10])
+                and isinstance(cur[11], str) and cur[11].strip()):
+            yield cur
+            continue
+        stack.extend(reversed(cur))
+
+def _place_url(name: str, feature_id: str) -> str:
+    return f"https://www.google.com/maps/place/{quote_plus(name)}/data=!4m2!3m1!1s{feature_id}"
+
+def parse_search_html(html: str, limit: int = 10) -> List[Dict[str, str]]:
+    """[{feature_id, place_id, name, url}] in result order (deduplicated); [] when nothing parses."""
+    state = _initial_state(html)
+    if state is None:
+        return []
+    out: List[Dict[str, str]] = []
+    seen = set()
+    for payload in _payloads(state):
+        for place in _places(payload):
+            fid = place[10].lower()
+            if fid in seen:
+                continue
+            seen.add(fid)
+            place_id = place[78] if len(place) > 78 and isinstance(place[78], str) else ""
+            name = place[11].strip()
+            out.append({"feature_id": fid, "place_id": place_id, "name": name, "url": _place_url(name, fid)})
+            if len(out) >= limit:
+                return out
+    return out
+
+def search_places(query: str, limit: int = 10, timeout: float = 20.0) -> Optional[List[Dict[str, str]]]:
+    """
+    Fetch and parse one Maps search. None means "use the browser": request failed, landed on a
+    consent/CAPTCHA/blocked page, or the payload did not contain any place.
+    """
+    url = f"https://www.google.com/maps/search/{quote(query)}?hl=en"
+    try:
+        resp = _session().get(url, timeout=timeout)
+    except requests.RequestException:
+        return None
+    if resp.status_code != 200 or classify(resp.url, resp.text) != OK:
+        return None
+    return parse_search_html(resp.text, limit) or None
+
+def check_fixtures(directory: Path = FIXTURE_DIR) -> int:
+    """Parse every <name>.html fixture and compare with <name>.json (expected feature ids + names)."""
+    failures = 0
+    files = sorted(directory.glob("*.html"))
+    for path in files:
+        expected = json.loads(path.with_suffix(".json").read_text(encoding="utf-8"))
+        got = [{"feature_id": p["feature_id"], "name": p["name"]}
+               for p in parse_search_html(path.read_text(encoding="utf-8"), limit=expected.get("limit", 10))]
+        ok = got == expected["places"]
+        failures += 0 if ok else 1
+        print(f"[FIXTURE] {path.name}: {len(got)} places {'ok' if ok else 'MISMATCH'}")
+        if not ok:
+            print(f"          expected {expected['places']}\n          got      {got}")
+    print(f"[RESULT] {len(files) - failures}/{len(files)} fixtures parsed correctly")
+    return 1 if failures or not files else 0
+
+if __name__ == "__main__":
+    if "--check-fixtures" in sys.argv:
+        sys.exit(check_fixtures())
+    if len(sys.argv) > 1 and not sys.argv[1].startswith("-"):
+        for p in search_places(" ".join(sys.argv[1:])) or []:
+            print(f"{p['feature_id']}\t{p['name']}\t{p['url']}")
+        sys.exit(0)
+    print("usage: python scraper/http_list.py --check-fixtures | <query>")
@@ -0,0 +1,66 @@
+# scraper/list_cache.py
+# List fingerprints: skip scopes whose top-N did not change since the last run
+# - fingerprint = hash of the ordered place IDs parsed from the list's detail URLs
+# - per scope, the final rows of the last complete scrape are cached with that fingerprint
+# - same fingerprint + cache younger than the TTL -> reuse the rows, no detail pages, no DB write
+# - one small JSON file per scope under scraper/state/list_cache/ (safe for parallel shards)
+
+import hashlib
+import json
+import logging
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+_FEATURE_ID = re.compile(r"!1s(0x[0-9a-f]+:0x[0-9a-f]+)", re.I)
+_PLACE_ID = re.compile(r"!19s(ChIJ[^!?&/]+)")
+
+def place_id_from_url(url: str) -> str:
+    """Stable ID of a Maps place URL: feature id (0x..:0x..), else place id, else the URL without query."""
+    m = _FEATURE_ID.search(url or "") or _PLACE_ID.search(url or "")
+    if m:
+        return m.group(1).lower()
+    return (url or "").split("?", 1)[0].rstrip("/")
+
+def fingerprint(urls: Sequence[str]) -> str:
+    ids = "\n".join(place_id_from_url(u) for u in urls)
+    return hashlib.sha1(ids.encode("utf-8")).hexdigest()
+
+class ListCache:
+    def __init__(self, directory: Path, ttl_s: float):
+        self.directory = directory
+        self.ttl_s = ttl_s
+
+    def _path(self, scope: Tuple[str, str]) -> Path:
+        slug = "_".join(part.lower().replace(" ", "_") for part in scope)
+        return self.directory / f"{slug}.json"
+
+    def lookup(self, scope: Tuple[str, str], fp: str) -> Optional[List[Dict[str, Any]]]:
+        """Cached rows if the fingerprint matches and the entry is within TTL, else None."""
+        if self.ttl_s <= 0:
+            return None
+        path = self._path(scope)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logging.warning(f"[LIST CACHE] ignoring unreadable {path}: {e}")
+            return None
+        if entry.get("fingerprint") != fp or time.time() - entry.get("saved_at", 0) > self.ttl_s:
+            return None
+        return entry.get("rows") or None
+
+    def store(self, scope: Tuple[str, str], fp: str, rows: List[Dict[str, Any]]) -> None:
+        if self.ttl_s <= 0:
+            return
+        path = self._path(scope)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_text(json.dumps({"fingerprint": fp, "saved_at": int(time.time()), "rows": rows},
+                                      ensure_ascii=False), encoding="utf-8")
+            tmp.replace(path)
+        except OSError as e:
+            logging.warning(f"[LIST CACHE] could not store {path}: {e}")
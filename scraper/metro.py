@@ -0,0 +1,66 @@
+# scraper/metro.py
+# Metro-level search consolidation (scraper.py --metro-consolidate / METRO_CONSOLIDATE=true)
+# - one wide list query per (metro, service) ("{service} near {metro}, TN", a longer result list); every
+#   candidate's detail page is opened once
+# - candidates go to the target whose name matches the locality of their address ("..., Franklin, TN 37064"),
+#   in metro result order, at most top-N per target
+# - targets with fewer than the minimum fill fall back to their usual per-city query; detail pages the metro
+#   pass already opened are reused there instead of being navigated again
+# - MetroStats: list queries and detail navigations per metro vs the per-city plan (its detail pages estimated
+#   from the refresh history), for the run summary
+
+import re
+from dataclasses import replace
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+_STATE_ZIP = re.compile(r"^[A-Z]{2}(\s+\d{5}(-\d{4})?)?$")
+_ALIASES = {"mt": "mount", "mt.": "mount", "st": "saint", "st.": "saint"}
+
+def normalize_locality(name: str) -> str:
+    words = re.sub(r"\s+", " ", (name or "").strip().lower()).split(" ")
+    return " ".join(_ALIASES.get(w, w) for w in words if w)
+
+def locality_of(address: str) -> str:
+    """Normalized city of a Maps address: the part right before "ST 12345" ("" when there is none)."""
+    parts = [p.strip() for p in (address or "").split(",")]
+    for i in range(len(parts) - 1, 0, -1):
+        if _STATE_ZIP.match(parts[i]):
+            return normalize_locality(parts[i - 1])
+    return ""
+
+def assign_to_targets(candidates: Iterable[Any], targets: Sequence[str], per_target: int) -> Dict[str, List[Any]]:
+    """Target name -> copies of its candidates (city set to the target), metro rank order, capped."""
+    by_locality = {normalize_locality(t): t for t in targets}
+    out: Dict[str, List[Any]] = {t: [] for t in targets}
+    for biz in candidates:
+        target = by_locality.get(locality_of(biz.address))
+        if target is not None and len(out[target]) < per_target:
+            out[target].append(replace(biz, city=target))
+    return out
+
+class MetroStats:
+    """Per metro: what consolidation issued vs what the per-city plan would have."""
+
+    FIELDS = ("scopes", "filled", "fallback", "list_queries", "list_queries_per_city",
+              "detail_pages", "detail_pages_per_city", "reused")
+
+    def __init__(self) -> None:
+        self.metros: Dict[str, Dict[str, float]] = {}
+
+    def add(self, metro: str, **counts: float) -> None:
+        row = self.metros.setdefault(metro, {k: 0 for k in self.FIELDS})
+        for key, value in counts.items():
+            row[key] += value
+
+    @staticmethod
+    def format_row(row: Dict[str, float]) -> str:
+        return (f"{row['filled']:.0f}/{row['scopes']:.0f} scopes filled, {row['fallback']:.0f} per-city fallbacks | "
+                f"list queries {row['list_queries']:.0f} vs {row['list_queries_per_city']:.0f} "
+                f"(saved {row['list_queries_per_city'] - row['list_queries']:.0f}) | "
+                f"detail pages {row['detail_pages']:.0f} vs ~{row['detail_pages_per_city']:.0f} "
+                f"(saved ~{row['detail_pages_per_city'] - row['detail_pages']:.0f}, {row['reused']:.0f} reused)")
+
+    def total(self) -> Optional[Dict[str, float]]:
+        if not self.metros:
+            return None
+        return {k: sum(row[k] for row in self.metros.values()) for k in self.FIELDS}
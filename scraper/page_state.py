@@ -0,0 +1,150 @@
+# scraper/page_state.py
+# Fast page-state classifier for Google Maps navigations
+# - runs right after goto(): recognizes consent walls, CAPTCHA / "unusual traffic", hard blocks and empty shells
+# - non-OK states raise BlockedPageError so the city short-circuits instead of waiting out selector timeouts
+# - BlockBackoff turns repeated blocks into a run-wide pause (and eventually a stop)
+# - offline fixtures: scraper/fixtures/page_states/<state>_*.html  (python scraper/page_state.py --check-fixtures)
+
+import asyncio
+import logging
+import re
+import sys
+import time
+from pathlib import Path
+
+OK = "ok"
+CONSENT = "consent"
+CAPTCHA = "captcha"
+BLOCKED = "blocked"
+EMPTY = "empty"
+STATES = (OK, CONSENT, CAPTCHA, BLOCKED, EMPTY)
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "fixtures" / "page_states"
+
+# Markers are matched where they can't come from user content: URLs and form/ids on the raw HTML, markup
+# with scripts/styles removed, and phrases on the visible text (only title/h1 on a rendered Maps page,
+# whose text includes reviews and descriptions that may quote them)
+_CONSENT_URL = re.compile(r"^https?://consent\.google\.[a-z.]+/", re.I)
+_CONSENT_HTML = ('action="https://consent.google.',)
+_CONSENT_TEXT = (
+    "before you continue to google",
+    "we use cookies and data to",
+)
+_CAPTCHA_URL = re.compile(r"^https?://(www\.)?google\.[a-z.]+/sorry/", re.I)
+_CAPTCHA_HTML = ('id="captcha-form"',)
+_CAPTCHA_MARKUP = ('class="g-recaptcha',)
+_CAPTCHA_TEXT = (
+    "unusual traffic from your computer network",
+    "our systems have detected unusual traffic",
+)
+_BLOCKED_TEXT = (
+    "429. that’s an error",
+    "429. that's an error",
+    "403. that’s an error",
+    "403. that's an error",
+    "too many requests",
+    "your client does not have permission to get url",
+)
+_CODE_RE = re.compile(r"<(script|style)\b.*?</\1>", re.S | re.I)
+_TAG_RE = re.compile(r"<[^>]+>")
+_HEADLINE_RE = re.compile(r"<(title|h1)\b[^>]*>(.*?)</\1>", re.S | re.I)
+_APP_MARKERS = ("app_initialization_state", "/maps/", "maps.gstatic.com")
+_APP_STATE = "app_initialization_state"
+
+class BlockedPageError(RuntimeError):
+    """Navigation landed on a consent / CAPTCHA / blocked / empty page instead of Maps content."""
+
+    def __init__(self, state: str, url: str):
+        super().__init__(f"{state} page at {url}")
+        self.state = state
+        self.url = url
+
+def classify(url: str, html: str) -> str:
+    """Classify a page from its final URL and HTML. Pure (no browser), used for fixtures too."""
+    url = url or ""
+    low = (html or "").lower()
+    markup = _CODE_RE.sub(" ", low)
+    visible = " ".join(_TAG_RE.sub(" ", markup).split())
+    if _APP_STATE in low:
+        visible = " ".join(" ".join(_TAG_RE.sub(" ", m[1]).split()) for m in _HEADLINE_RE.findall(markup))
+    if (_CAPTCHA_URL.search(url) or any(m in low for m in _CAPTCHA_HTML)
+            or any(m in markup for m in _CAPTCHA_MARKUP) or any(m in visible for m in _CAPTCHA_TEXT)):
+        return CAPTCHA
+    if _CONSENT_URL.search(url) or any(m in markup for m in _CONSENT_HTML) or any(m in visible for m in _CONSENT_TEXT):
+        return CONSENT
+    if any(m in visible for m in _BLOCKED_TEXT):
+        return BLOCKED
+    if len(_TAG_RE.sub(" ", markup).split()) < 3 and not any(m in low for m in _APP_MARKERS):
+        return EMPTY
+    return OK
+
+async def check_page_state(page) -> str:
+    """Classify the live page right after navigation; raises BlockedPageError for anything but OK."""
+    try:
+        html = await page.content()
+    except Exception:
+        # Page still navigating; let the normal selector waits decide
+        return OK
+    state = classify(page.url, html)
+    if state != OK:
+        raise BlockedPageError(state, page.url)
+    return state
+
+class BlockBackoff:
+    """
+    Run-wide reaction to block signals: each consecutive block doubles the pause taken
+    before the next city (base..max seconds); a successful city resets it. After
+    abort_after consecutive blocks the run should stop instead of burning more requests.
+    """
+
+    def __init__(self, base_s: float = 30.0, max_s: float = 600.0, abort_after: int = 5):
+        self.base_s = base_s
+        self.max_s = max_s
+        self.abort_after = abort_after
+        self.consecutive = 0
+        self.total = 0
+        self.by_state = {}
+        self._resume_at = 0.0
+
+    def record_block(self, state: str) -> float:
+        self.consecutive += 1
+        self.total += 1
+        self.by_state[state] = self.by_state.get(state, 0) + 1
+        delay = min(self.max_s, self.base_s * (2 ** (self.consecutive - 1)))
+        self._resume_at = time.monotonic() + delay
+        logging.warning(f"[BACKOFF] {state} page ({self.consecutive} in a row) -> pausing {delay:.0f}s before next city")
+        return delay
+
+    def record_ok(self) -> None:
+        self.consecutive = 0
+
+    @property
+    def should_abort(self) -> bool:
+        return self.abort_after > 0 and self.consecutive >= self.abort_after
+
+    async def wait(self) -> None:
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+def check_fixtures(directory: Path = FIXTURE_DIR) -> int:
+    """Classify every <state>_*.html fixture and compare with its filename prefix."""
+    failures = 0
+    files = sorted(directory.glob("*.html"))
+    for path in files:
+        expected = path.name.split("_", 1)[0]
+        html = path.read_text(encoding="utf-8")
+        # First line of each fixture is an HTML comment holding the final URL
+        m = re.match(r"<!--\s*url:\s*(\S+)\s*-->", html)
+        got = classify(m.group(1) if m else "", html)
+        status = "ok" if got == expected else "MISMATCH"
+        if got != expected:
+            failures += 1
+        print(f"[FIXTURE] {path.name}: expected={expected} got={got} {status}")
+    print(f"[RESULT] {len(files) - failures}/{len(files)} fixtures classified correctly")
+    return 1 if failures or not files else 0
+
+if __name__ == "__main__":
+    if "--check-fixtures" in sys.argv:
+        sys.exit(check_fixtures())
+    print("usage: python scraper/page_state.py --check-fixtures")
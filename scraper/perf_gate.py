@@ -0,0 +1,372 @@
+# scraper/perf_gate.py
+# Performance regression report: a fixed offline workload, compared against scraper/perf_baseline.json
+# (report-only, run by hand: the I/O-bound upload stages still fail about 1 run in 15 on a loaded box,
+# so it is not wired into CI)
+# - parse:   Maps list pages (fixtures/http_list) through http_list.parse_search_html + page_state.classify
+# - dedupe:  synthetic rows through scraper.py's local + batch-level dedupe
+# - upload:  scraper.upload_businesses_chunked and upload_to_supabase.process_scope against an in-process
+#            PostgREST stub with a fixed per-request delay (no network)
+# - replay:  optional (--recording DIR): scraper.py --replay DIR in a subprocess (needs Chromium)
+# Per stage: throughput (median over --repeat runs after a warm-up), p50 / p95 op latency (median of the
+# per-repetition percentiles, so one slow repetition cannot move them), peak traced memory (a separate
+# tracemalloc pass, so tracing never skews the timings). CPU-bound stages are scaled by a calibration loop
+# timed around every repetition, so a baseline recorded on one box holds on another; the upload stages wait
+# on sockets and threads, are not scaled and get wider tolerances (STAGE_TOLERANCE).
+# A metric regresses when it is worse than the baseline by more than its tolerance; a stage that regresses
+# is measured again (--confirm times) and only a regression seen in every attempt sets exit status 1.
+#
+# Usage (from the repo root):
+#   python scraper/perf_gate.py                 # compare with the baseline (exit 1 on a confirmed regression)
+#   python scraper/perf_gate.py --update        # re-record the baseline after an intended change
+#                                               # (per-metric median of --update-passes full passes)
+
+import argparse
+import gc
+import json
+import logging
+import os
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+HERE = Path(__file__).resolve().parent
+BASELINE_PATH = HERE / "perf_baseline.json"
+STUB_DELAY_S = 0.002
+# Worse-than-baseline allowance per metric kind (the baseline file may override these)
+DEFAULT_TOLERANCE = {"throughput": 0.20, "p50_ms": 0.25, "p95_ms": 0.35, "peak_kb": 0.15}
+# I/O-bound stages: scheduling of the upload pool and the stub's server threads dominates their spread
+STAGE_TOLERANCE = {
+    "upload_city": {"throughput": 0.35, "p50_ms": 0.40, "p95_ms": 0.60},
+    "upload_scopes": {"throughput": 0.35, "p50_ms": 0.40, "p95_ms": 0.60},
+}
+CPU_STAGES = {"parse", "dedupe"}
+REFERENCE_MS = 25.0  # CPU-stage numbers are reported as if calibrate() took this long
+
+# ---------- PostgREST stub ----------
+class _Table:
+    def __init__(self) -> None:
+        self.rows: Dict[int, Dict[str, Any]] = {}
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _match(row: Dict[str, Any], q: Dict[str, List[str]]) -> bool:
+        for col, values in q.items():
+            if col in ("select", "order", "limit", "on_conflict"):
+                continue
+            op, _, arg = values[0].partition(".")
+            if op == "eq" and str(row.get(col)) != arg:
+                return False
+            if op == "gt" and not row.get(col, 0) > int(arg):
+                return False
+            if op == "in" and str(row.get(col)) not in arg.strip("()").split(","):
+                return False
+        return True
+
+def _stub_handler(table: _Table):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def _reply(self, status: int, body: Any = None) -> None:
+            data = b"" if body is None else json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _query(self) -> Dict[str, List[str]]:
+            return parse_qs(urlsplit(self.path).query)
+
+        def do_GET(self) -> None:
+            time.sleep(STUB_DELAY_S)
+            q = self._query()
+            with table.lock:
+                rows = [r for _, r in sorted(table.rows.items()) if _Table._match(r, q)]
+            rows = rows[: int(q.get("limit", ["1000"])[0])]
+            cols = q.get("select", ["*"])[0].split(",")
+            self._reply(200, rows if cols == ["*"] else [{c: r.get(c) for c in cols} for r in rows])
+
+        def do_POST(self) -> None:
+            time.sleep(STUB_DELAY_S)
+            if "/rest/v1/businesses" not in self.path:
+                return self._reply(404)
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            upsert = "on_conflict" in self._query()
+            out = []
+            with table.lock:
+                index = {(r.get("name"), r.get("website"), r.get("city"), r.get("service")): i
+                         for i, r in table.rows.items()} if upsert else {}
+                for row in body:
+                    key = (row.get("name"), row.get("website"), row.get("city"), row.get("service"))
+                    rid = index.get(key)
+                    if rid is None:
+                        rid, table.next_id = table.next_id, table.next_id + 1
+                    table.rows[rid] = {**row, "id": rid}
+                    out.append(table.rows[rid])
+            self._reply(201, out if "return=representation" in (self.headers.get("Prefer") or "") else None)
+
+        def do_DELETE(self) -> None:
+            time.sleep(STUB_DELAY_S)
+            q = self._query()
+            with table.lock:
+                for rid in [i for i, r in table.rows.items() if _Table._match(r, q)]:
+                    del table.rows[rid]
+            self._reply(204)
+
+        def do_PATCH(self) -> None:
+            time.sleep(STUB_DELAY_S)
+            self._reply(204)
+    return Handler
+
+# ---------- workload ----------
+def _synthetic_rows(n: int, cities: int = 20, services: int = 5) -> List[Dict[str, Any]]:
+    """Deterministic rows; every 7th repeats an earlier business (different casing / trailing slash)."""
+    rows = []
+    for i in range(n):
+        j = i - 3 if i % 7 == 0 and i >= 3 else i
+        rows.append({
+            "name": f"Handyman Pro {j}" if i == j else f"  HANDYMAN pro {j} ",
+            "address": f"{j} Main St, Franklin, TN 37064",
+            "phone": f"+1615{j:07d}",
+            "website": f"https://www.pro{j}.example.com" + ("/" if i != j else ""),
+            "city": f"City {j % cities}",
+            "service": f"service {j % services}",
+            "review_count": j % 300,
+            "avg_rating": 4.5,
+        })
+    return rows
+
+class Workload:
+    def __init__(self, recording: Optional[Path], replay_city: Optional[str]):
+        sys.path.insert(0, str(HERE))
+        logging.disable(logging.CRITICAL)  # the pipeline's INFO lines are not part of the measurement
+        import http_list
+        import page_state
+        import scraper as S
+        import upload_to_supabase as U
+        from records import Business
+        self.http_list, self.page_state, self.S, self.U, self.Business = http_list, page_state, S, U, Business
+        self.pages = [(p.name, p.read_text(encoding="utf-8")) for p in sorted((HERE / "fixtures" / "http_list").glob("*.html"))]
+        self.rows = _synthetic_rows(20000)
+        self.recording = recording
+        self.replay_city = replay_city
+
+        self.table = _Table()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _stub_handler(self.table))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{self.server.server_port}"
+        S.SUPABASE_URL = base
+        U.SUPABASE_URL = base
+        U.SERVICE_KEY = "perf-gate"  # enables the stale-row delete path
+
+    def close(self) -> None:
+        self.server.shutdown()
+
+    def stages(self) -> Dict[str, Callable[[], Tuple[int, List[float]]]]:
+        out = {"parse": self.parse, "dedupe": self.dedupe, "upload_city": self.upload_city,
+               "upload_scopes": self.upload_scopes}
+        if self.recording is not None:
+            out["replay"] = self.replay
+        return out
+
+    # Each stage returns (items processed, per-op latencies in seconds)
+    def parse(self) -> Tuple[int, List[float]]:
+        lat = []
+        for _ in range(20):
+            for name, html in self.pages:
+                t0 = time.perf_counter()
+                self.page_state.classify(f"https://www.google.com/maps/search/{name}", html)
+                self.http_list.parse_search_html(html, limit=20)
+                lat.append(time.perf_counter() - t0)
+        return len(lat), lat
+
+    def dedupe(self) -> Tuple[int, List[float]]:
+        lat = []
+        records = [self.Business.from_row(r) for r in self.rows]
+        for start in range(0, len(records), 2000):
+            t0 = time.perf_counter()
+            self.S.deduplicate_local(records[start:start + 2000])
+            lat.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        self.S.deduplicate_across_all_rows(records)
+        lat.append(time.perf_counter() - t0)
+        return len(records), lat
+
+    def upload_city(self) -> Tuple[int, List[float]]:
+        with self.table.lock:
+            self.table.rows.clear()
+        self.S._UPLOAD_BATCHER = None  # every repetition starts from the configured chunk size
+        rows = [self.Business.from_row(r) for r in self.rows[:5000]]
+        lat = []
+        sent = 0
+        for start in range(0, len(rows), 250):  # twenty cities' worth per repetition
+            t0 = time.perf_counter()
+            sent += self.S.upload_businesses_chunked(rows[start:start + 250])
+            lat.append(time.perf_counter() - t0)
+        return sent, lat
+
+    def upload_scopes(self) -> Tuple[int, List[float]]:
+        lat = []
+        n = 0
+        for scope in range(20):
+            city, service = f"City {scope}", "handyman"
+            rows = [{**r, "city": city, "service": service, "name": f"{r['name']} {scope}"} for r in self.rows[scope * 20:scope * 20 + 20]]
+            t0 = time.perf_counter()
+            self.U.process_scope(city, service, rows, pin_supported=True, apply_deletes=True)
+            lat.append(time.perf_counter() - t0)
+            n += len(rows)
+        return n, lat
+
+    def replay(self) -> Tuple[int, List[float]]:
+        cmd = [sys.executable, str(HERE / "scraper.py"), "--replay", str(self.recording), "--scrape-only"]
+        if self.replay_city:
+            cmd += ["--only-city", self.replay_city]
+        t0 = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=HERE.parent, capture_output=True, text=True,
+                              env={**os.environ, "EXPORT_STORE_DIR": str(HERE / "state" / "perf_gate_store")})
+        if proc.returncode != 0:
+            raise RuntimeError(f"replay run failed: {proc.stderr.strip().splitlines()[-1:]}")
+        pages = len(re.findall(r"\[SUCCESS\] Scraped", proc.stderr))
+        return max(pages, 1), [time.perf_counter() - t0]
+
+def calibrate() -> float:
+    """ms for a fixed pure-Python loop (dict / str / int work, like the CPU stages); best of 3."""
+    samples = []
+    for _ in range(3):
+        t0 = time.perf_counter()
+        d: Dict[str, int] = {}
+        for i in range(50_000):
+            k = f"k{i % 5000}"
+            d[k] = d.get(k, 0) + (i & 7)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return min(samples)
+
+def _pct(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+def measure(workload: Workload, repeat: int, only: Optional[set] = None) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name, stage in workload.stages().items():
+        if only is not None and name not in only:
+            continue
+        stage()  # warm-up: imports, caches, connection pools
+        rates, p50s, p95s = [], [], []
+        for _ in range(repeat if name != "replay" else max(1, repeat // 3)):
+            gc.collect()
+            # Shared runners change speed from one second to the next: CPU-bound stages are timed between
+            # two calibration runs and scaled to the reference speed, one repetition at a time
+            before = calibrate() if name in CPU_STAGES else REFERENCE_MS
+            t0 = time.perf_counter()
+            items, ops = stage()
+            elapsed = time.perf_counter() - t0
+            speed = (before + calibrate()) / 2 / REFERENCE_MS if name in CPU_STAGES else 1.0
+            rates.append(items / elapsed * speed)
+            p50s.append(_pct(ops, 0.50) / speed)
+            p95s.append(_pct(ops, 0.95) / speed)
+        gc.collect()
+        tracemalloc.start()
+        stage()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = {
+            "throughput": round(statistics.median(rates), 1),
+            "p50_ms": round(statistics.median(p50s) * 1000, 3),
+            "p95_ms": round(statistics.median(p95s) * 1000, 3),
+            "peak_kb": round(peak / 1024, 1),
+        }
+        if name == "replay":
+            results[name]["peak_kb"] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss, 1)
+    return results
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: Dict[str, float],
+            stage_tolerance: Optional[Dict[str, Dict[str, float]]] = None) -> List[str]:
+    """Lines describing every metric; regressions start with 'REGRESSION'."""
+    lines = []
+    for stage, metrics in current["stages"].items():
+        base = baseline["stages"].get(stage)
+        if base is None:
+            lines.append(f"new        {stage}: no baseline")
+            continue
+        for metric, value in metrics.items():
+            ref = base.get(metric)
+            if not ref:
+                continue
+            change = (value - ref) / ref
+            worse = -change if metric == "throughput" else change
+            tol = (stage_tolerance or {}).get(stage, {}).get(metric, tolerance.get(metric, 0.2))
+            tag = "REGRESSION" if worse > tol else ("improved  " if worse < -tol else "ok        ")
+            lines.append(f"{tag} {stage:<14} {metric:<10} {value:>12.3f} vs {ref:>12.3f} ({change:+.1%}, tolerance {tol:.0%})")
+    return lines
+
+def write_baseline(path: Path, stages: Dict[str, Dict[str, float]]) -> None:
+    """Store measured stages; tolerances already in the file are kept."""
+    previous = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+    current = {
+        "reference_ms": REFERENCE_MS,
+        "python": sys.version.split()[0],
+        "stages": stages,
+        "tolerance": previous.get("tolerance", DEFAULT_TOLERANCE),
+        "stage_tolerance": previous.get("stage_tolerance", STAGE_TOLERANCE),
+    }
+    path.write_text(json.dumps(current, indent=2) + "\n", encoding="utf-8")
+    print(f"[PERF] baseline written to {path}")
+    for stage, metrics in stages.items():
+        print(f"  {stage:<14} " + "  ".join(f"{k}={v}" for k, v in metrics.items()))
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Offline performance regression report")
+    ap.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    ap.add_argument("--update", action="store_true", help="write the measured numbers as the new baseline")
+    ap.add_argument("--repeat", type=int, default=11)
+    ap.add_argument("--update-passes", type=int, default=3, help="with --update: full passes to take the median of")
+    ap.add_argument("--confirm", type=int, default=2, help="re-measure a regressed stage this many times before failing")
+    ap.add_argument("--recording", type=Path, default=None, help="also time scraper.py --replay DIR (needs Chromium)")
+    ap.add_argument("--replay-city", default=None, help="with --recording: --only-city for the replayed run")
+    args = ap.parse_args()
+
+    workload = Workload(args.recording, args.replay_city)
+    try:
+        if args.update or not args.baseline.exists():
+            passes = [measure(workload, args.repeat) for _ in range(max(1, args.update_passes))]
+            # One lucky pass must not become the bar every later run is held to
+            stages = {name: {metric: round(statistics.median(p[name][metric] for p in passes), 3) for metric in metrics}
+                      for name, metrics in passes[0].items()}
+            write_baseline(args.baseline, stages)
+            return
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        tolerance = {**DEFAULT_TOLERANCE, **baseline.get("tolerance", {})}
+        stage_tolerance = {**STAGE_TOLERANCE, **baseline.get("stage_tolerance", {})}
+        stages = measure(workload, args.repeat)
+        lines = compare({"stages": stages}, baseline, tolerance, stage_tolerance)
+        for attempt in range(args.confirm):
+            regressed = {l.split()[1] for l in lines if l.startswith("REGRESSION")}
+            if not regressed:
+                break
+            print(f"[PERF] re-measuring {', '.join(sorted(regressed))} ({attempt + 1}/{args.confirm})")
+            again = compare({"stages": measure(workload, args.repeat, only=regressed)}, baseline, tolerance,
+                            stage_tolerance)
+            retried = {l.split()[1] for l in again}
+            lines = [l for l in lines if l.split()[1] not in retried] + again
+    finally:
+        workload.close()
+
+    for line in lines:
+        print(line)
+    regressions = [l for l in lines if l.startswith("REGRESSION")]
+    print(f"[RESULT] {len(regressions)} regression(s) beyond tolerance")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# scraper/records.py
+# Compact business record shared by the scraper, the exports and the Supabase writers
+# - __slots__ dataclass: no per-row __dict__, fixed attribute layout
+# - business_key cached on first use (mirrors the DB generated column)
+# - to_payload()/to_export() build wire dicts straight from the slots (one dict per row, no copies)
+# - get()/[] keep the old dict-style call sites working
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+STATE_VALUE = "TN"
+
+# Columns the scraper writes to the businesses table (order is the payload key order)
+PAYLOAD_FIELDS: Tuple[str, ...] = (
+    "name", "address", "phone", "website", "city", "service", "state", "maps_url", "review_count", "avg_rating",
+)
+# Same columns plus the optional pin_rank (only present when set)
+EXPORT_FIELDS: Tuple[str, ...] = PAYLOAD_FIELDS + ("pin_rank",)
+
+_TEXT_FIELDS = ("name", "address", "phone", "website", "city", "service", "state", "maps_url")
+
+def normalize_text(s: Optional[str]) -> str:
+    if not s:
+        return ""
+    return re.sub(r"\s+", " ", s.strip()).lower()
+
+def _normalize_website_for_key(website: Optional[str]) -> str:
+    """
+    Mirror the DB's normalization used inside business_key:
+    - strip protocol and 'www.'
+    - strip trailing slash
+    - lower-case
+    - return '' if missing (the caller will convert to 'no-site')
+    """
+    if not website:
+        return ""
+    u = website.strip()
+    u = re.sub(r"^https?://", "", u, flags=re.I)
+    u = re.sub(r"^www\.", "", u, flags=re.I)
+    u = u.rstrip("/")
+    return u.lower()
+
+def url_has_domain(url: Optional[str], domain: str) -> bool:
+    """True if domain occurs in url once scheme and 'www.' are stripped (case-insensitive)."""
+    if not url:
+        return False
+    u = re.sub(r"^https?://", "", normalize_text(url))
+    u = re.sub(r"^www\.", "", u)
+    return domain.lower() in u
+
+def business_key_for(row: Any) -> str:
+    """
+    EXACT mirror of the DB's generated business_key:
+      case when maps_url present -> lower(trim(maps_url))
+      else lower(name with collapsed whitespace) + '|' + normalized website (or 'no-site')
+    Accepts a Business or a plain dict row.
+    """
+    maps_url = (row.get("maps_url") or "").strip()
+    if maps_url:
+        return maps_url.lower()
+    name_norm = normalize_text(row.get("name"))  # collapses internal whitespace + lower
+    site_norm = _normalize_website_for_key(row.get("website"))
+    return f"{name_norm}|{(site_norm or 'no-site')}"
+
+def _parse_int(val: Any) -> Optional[int]:
+    if val is None:
+        return None
+    if isinstance(val, int):
+        return val
+    if isinstance(val, float):
+        return int(val)
+    if isinstance(val, str):
+        digits = re.sub(r"[^\d]", "", val)
+        return int(digits) if digits else None
+    return None
+
+def _parse_float(val: Any) -> Optional[float]:
+    if val is None:
+        return None
+    if isinstance(val, (int, float)):
+        return float(val)
+    if isinstance(val, str):
+        try:
+            return float(val.strip())
+        except ValueError:
+            m = re.match(r"\s*(\d+(?:\.\d+)?)", val)
+            return float(m.group(1)) if m else None
+    return None
+
+@dataclass(slots=True)
+class Business:
+    name: str = ""
+    address: str = ""
+    phone: str = ""
+    website: str = ""
+    city: str = ""
+    service: str = ""
+    state: str = STATE_VALUE
+    maps_url: str = ""
+    review_count: Optional[int] = None
+    avg_rating: Optional[float] = None
+    pin_rank: Optional[int] = None
+    _key: Optional[str] = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "Business":
+        """Build a normalized record from a loose dict (export file, DB snapshot, legacy code)."""
+        if isinstance(row, cls):
+            return row
+        vals = {}
+        for k in _TEXT_FIELDS:
+            v = row.get(k)
+            vals[k] = str(v).strip() if v is not None else ""
+        if not vals["state"]:
+            vals["state"] = STATE_VALUE
+        return cls(
+            review_count=_parse_int(row.get("review_count")),
+            avg_rating=_parse_float(row.get("avg_rating")),
+            pin_rank=_parse_int(row.get("pin_rank")),
+            **vals,
+        )
+
+    @property
+    def business_key(self) -> str:
+        """Computed on first read; records are treated as final once dedupe starts."""
+        key = self._key
+        if key is None:
+            key = self._key = business_key_for(self)
+        return key
+
+    # --- dict-style access for call sites written against Dict[str, Any] rows ---
+    def get(self, name: str, default: Any = None) -> Any:
+        if name in EXPORT_FIELDS:
+            return getattr(self, name)
+        return default
+
+    def __getitem__(self, name: str) -> Any:
+        if name not in EXPORT_FIELDS:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in EXPORT_FIELDS
+
+    # --- serialization ---
+    def to_payload(self, fields: Iterable[str] = PAYLOAD_FIELDS) -> Dict[str, Any]:
+        """PostgREST row: exactly the requested columns, values already normalized."""
+        return {k: getattr(self, k) for k in fields}
+
+    def to_export(self) -> Dict[str, Any]:
+        """Export row: payload columns, plus pin_rank when it was assigned."""
+        out = self.to_payload()
+        if self.pin_rank is not None:
+            out["pin_rank"] = self.pin_rank
+        return out
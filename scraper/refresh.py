@@ -0,0 +1,203 @@
+# scraper/refresh.py
+# Churn-aware refresh scheduling for (city, service) scopes
+# - after each upload the fresh top-N is compared with the rows it replaced (membership, rank order,
+#   rating / review-count changes) and folded into a per-scope churn EWMA
+# - priority = churn x days since the last scrape: volatile scopes come up nightly, stable ones every few days
+# - a nightly page budget picks the highest-priority scopes; never-seen and overdue scopes go first (most
+#   overdue first) but stay within the budget too, the rest of them wait for the next night
+# - the night's selection is stored with the history (refresh.json), so per-city processes share one budget
+
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+Scope = Tuple[str, str]  # (city, service)
+
+_DAY_S = 86400.0
+
+def scope_id(scope: Scope) -> str:
+    return f"{scope[0]}|{scope[1]}"
+
+def change_score(old: Sequence[Any], new: Sequence[Any]) -> Dict[str, float]:
+    """
+    Compare two ordered top-N lists of records (anything with business_key / review_count / avg_rating).
+    Every component is in [0, 1]; score weights membership changes highest.
+    """
+    old_keys = [r.business_key for r in old]
+    new_keys = [r.business_key for r in new]
+    union = set(old_keys) | set(new_keys)
+    if not union:
+        return {"membership": 0.0, "rank": 0.0, "metrics": 0.0, "score": 0.0}
+    common = set(old_keys) & set(new_keys)
+    membership = 1.0 - len(common) / len(union)
+    old_pos = {k: i for i, k in enumerate(old_keys)}
+    new_pos = {k: i for i, k in enumerate(new_keys)}
+    rank = sum(1 for k in common if old_pos[k] != new_pos[k]) / len(common) if common else 1.0
+    old_by_key = {r.business_key: r for r in old}
+    moved = 0
+    for r in new:
+        prev = old_by_key.get(r.business_key)
+        if prev is not None and (prev.review_count != r.review_count or prev.avg_rating != r.avg_rating):
+            moved += 1
+    metrics = moved / len(common) if common else 1.0
+    score = 0.5 * membership + 0.3 * rank + 0.2 * metrics
+    return {"membership": round(membership, 3), "rank": round(rank, 3), "metrics": round(metrics, 3), "score": round(score, 3)}
+
+class RefreshScheduler:
+    """
+    Per-scope history: last_scraped (epoch s), pages (EWMA navigations per scrape),
+    churn (EWMA change score) and observations. Updated from the scrape loop and the upload thread.
+    """
+
+    def __init__(self, state_path: Optional[Path] = None, max_age_days: float = 7.0,
+                 min_churn: float = 0.05, alpha: float = 0.4, default_pages: float = 12.0):
+        self.state_path = state_path
+        self.max_age_days = max_age_days
+        self.min_churn = min_churn
+        self.alpha = alpha
+        self.default_pages = default_pages
+        self.scopes: Dict[str, Dict[str, float]] = {}
+        self._touched: set = set()
+        self._plan: Dict[str, Any] = {}
+        self._plan_dirty = False
+        self._lock = threading.Lock()
+
+    def _ewma(self, prev: Optional[float], value: float) -> float:
+        return value if prev is None else prev + self.alpha * (value - prev)
+
+    def record_scrape(self, scope: Scope, pages: int, now: Optional[float] = None) -> None:
+        with self._lock:
+            st = self.scopes.setdefault(scope_id(scope), {})
+            self._touched.add(scope_id(scope))
+            st["last_scraped"] = now if now is not None else time.time()
+            st["pages"] = round(self._ewma(st.get("pages"), pages), 2)
+
+    def record_change(self, scope: Scope, old: Sequence[Any], new: Sequence[Any]) -> Dict[str, float]:
+        change = change_score(old, new)
+        with self._lock:
+            st = self.scopes.setdefault(scope_id(scope), {})
+            self._touched.add(scope_id(scope))
+            st["churn"] = round(self._ewma(st.get("churn"), change["score"]), 4)
+            st["observations"] = st.get("observations", 0) + 1
+        return change
+
+    def pages(self, scope: Scope) -> float:
+        known = [s["pages"] for s in self.scopes.values() if "pages" in s]
+        fallback = sum(known) / len(known) if known else self.default_pages
+        return self.scopes.get(scope_id(scope), {}).get("pages", fallback)
+
+    def age_days(self, scope: Scope, now: float) -> Optional[float]:
+        last = self.scopes.get(scope_id(scope), {}).get("last_scraped")
+        return None if last is None else max(0.0, (now - last) / _DAY_S)
+
+    def priority(self, scope: Scope, now: float) -> float:
+        st = self.scopes.get(scope_id(scope), {})
+        age = self.age_days(scope, now)
+        if age is None or "churn" not in st or age >= self.max_age_days:
+            return float("inf")
+        return max(self.min_churn, st["churn"]) * age
+
+    def _overdue_key(self, scope: Scope, now: float) -> Tuple[int, float]:
+        """Order among infinite-priority scopes: never scraped first, then the longest since a scrape."""
+        age = self.age_days(scope, now)
+        return (0, 0.0) if age is None else (1, -age)
+
+    def _expected_changes(self, scope: Scope, now: float) -> float:
+        """churn x age, finite also for never-seen / overdue scopes (unknown churn counts as 1)."""
+        st = self.scopes.get(scope_id(scope), {})
+        age = self.age_days(scope, now)
+        return max(self.min_churn, st.get("churn", 1.0)) * (self.max_age_days if age is None else age)
+
+    def select(self, scopes: Sequence[Scope], page_budget: int, now: Optional[float] = None) -> Tuple[List[Scope], Dict[str, Any]]:
+        """
+        Highest-priority scopes that fit page_budget (in plan order), plus a report of what the
+        budget saved and the freshness lag it leaves on the deferred scopes. Never-seen and overdue
+        scopes rank first (most overdue first) but are held to the budget like the others.
+        """
+        now = now if now is not None else time.time()
+        ranked = sorted(scopes, key=lambda s: (-self.priority(s, now), self._overdue_key(s, now), scope_id(s)))
+        chosen, used = set(), 0.0
+        for s in ranked:
+            cost = self.pages(s)
+            if used + cost <= page_budget:
+                chosen.add(s)
+                used += cost
+        deferred = [s for s in scopes if s not in chosen]
+        ages = [self.age_days(s, now) or 0.0 for s in deferred]
+        report = {
+            "scopes": len(scopes),
+            "selected": len(chosen),
+            "deferred": len(deferred),
+            "pages_full": round(sum(self.pages(s) for s in scopes)),
+            "pages_planned": round(used),
+            "lag_mean_days": round(sum(ages) / len(ages), 2) if ages else 0.0,
+            "lag_max_days": round(max(ages), 2) if ages else 0.0,
+            # Expected changes left unseen tonight: churn x age over the deferred scopes
+            "missed_changes": round(sum(self._expected_changes(s, now) for s in deferred), 2),
+            "overdue_deferred": sum(1 for s in deferred if self.priority(s, now) == float("inf")),
+        }
+        return [s for s in scopes if s in chosen], report
+
+    def nightly_plan(self, scopes: Sequence[Scope], page_budget: int,
+                     now: Optional[float] = None) -> Tuple[List[Scope], Dict[str, Any], bool]:
+        """
+        select() once per UTC day and budget, then reuse the stored plan, so per-city processes
+        of the same night share one budget instead of each re-planning after the others ran.
+        Returns (selected, report, newly_planned).
+        """
+        now = now if now is not None else time.time()
+        key = f"{time.strftime('%Y-%m-%d', time.gmtime(now))}|{page_budget}|{len(scopes)}"
+        with self._lock:
+            plan = dict(self._plan)
+        if plan.get("key") == key:
+            selected = {tuple(s.split("|", 1)) for s in plan["selected"]}
+            return [s for s in scopes if s in selected], plan["report"], False
+        selected, report = self.select(scopes, page_budget, now)
+        with self._lock:
+            self._plan = {"key": key, "selected": [scope_id(s) for s in selected], "report": report}
+            self._plan_dirty = True
+        return selected, report, True
+
+    def load(self) -> None:
+        if not self.state_path or not self.state_path.exists():
+            return
+        try:
+            data = json.loads(self.state_path.read_text(encoding="utf-8"))
+            self.scopes = {k: dict(v) for k, v in data.get("scopes", {}).items()}
+            self._plan = data.get("plan", {})
+        except Exception as e:
+            logging.warning(f"[REFRESH] ignoring unreadable state {self.state_path}: {e}")
+
+    def save(self) -> None:
+        if not self.state_path or not (self._touched or self._plan_dirty):
+            return
+        try:
+            # Re-read so parallel runs (shards, per-city processes) only overwrite the scopes they touched
+            current: Dict[str, Any] = {}
+            if self.state_path.exists():
+                try:
+                    current = json.loads(self.state_path.read_text(encoding="utf-8"))
+                except ValueError:
+                    current = {}
+            scopes = current.get("scopes", {})
+            with self._lock:
+                scopes.update({k: self.scopes[k] for k in self._touched})
+                plan = self._plan if self._plan_dirty else current.get("plan", {})
+                payload = json.dumps({"saved_at": int(time.time()), "scopes": scopes, "plan": plan}, sort_keys=True)
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.state_path.with_name(f"{self.state_path.name}.{time.time_ns()}.tmp")
+            tmp.write_text(payload, encoding="utf-8")
+            tmp.replace(self.state_path)
+        except OSError as e:
+            logging.warning(f"[REFRESH] could not persist history: {e}")
+
+def format_report(r: Dict[str, Any]) -> str:
+    saved = r["pages_full"] - r["pages_planned"]
+    pct = (saved / r["pages_full"] * 100) if r["pages_full"] else 0.0
+    return (f"{r['selected']}/{r['scopes']} scopes, ~{r['pages_planned']}/{r['pages_full']} pages "
+            f"(saved ~{saved}, {pct:.0f}%) | deferred {r['deferred']}: lag mean {r['lag_mean_days']}d, "
+            f"max {r['lag_max_days']}d, expected missed changes {r['missed_changes']}"
+            f"{', overdue ' + str(r['overdue_deferred']) if r.get('overdue_deferred') else ''}")
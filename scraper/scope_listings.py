@@ -0,0 +1,132 @@
+# scraper/scope_listings.py
+# Pre-built listing documents for the site build (table scope_listings, see scope_listings.sql)
+# - one row per (city, service): slugs, the ordered card rows (pin_rank, then scrape rank), a content hash, a version
+# - the compact manifest (slugs + hash, no listing) is what getStaticPaths reads; each page reads one document
+# - publish_city() rewrites only scopes whose hash changed (version + 1) and drops scopes the city no longer has
+# - the table missing (404) disables publishing for the rest of the run; the site falls back to `businesses`
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import re
+import unicodedata
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+import requests
+
+LISTING_TABLE = "scope_listings"
+DEFAULT_PIN_RANK = 100  # same default the uploader assigns to every non-pinned row
+
+# Fields a listing card needs (src/components/BusinessCard.js plus what the pages may show)
+LISTING_FIELDS: Tuple[str, ...] = (
+    "name", "address", "phone", "website", "maps_url", "review_count", "avg_rating",
+)
+
+_TABLE_MISSING = False
+
+def slugify(s: str) -> str:
+    """Same slugs as src/scripts/generate-sitemap.js (and the page URLs)."""
+    s = unicodedata.normalize("NFKD", s or "")
+    s = s.replace("&", " and ")
+    s = re.sub(r"['’]", "", s).lower()
+    s = re.sub(r"[^a-z0-9]+", "-", s)
+    return s.strip("-")
+
+def _get(row: Any, name: str) -> Any:
+    return row.get(name) if hasattr(row, "get") else getattr(row, name, None)
+
+def listing_rows(rows: Sequence[Any]) -> List[Dict[str, Any]]:
+    """Card rows ordered by pin_rank (missing = DEFAULT_PIN_RANK), then their order in `rows`; rank is 1-based."""
+    def pin(row: Any) -> int:
+        value = _get(row, "pin_rank")
+        return DEFAULT_PIN_RANK if value is None else int(value)
+    ordered = sorted(enumerate(rows), key=lambda pair: (pin(pair[1]), pair[0]))
+    out = []
+    for rank, (_, row) in enumerate(ordered, start=1):
+        card = {f: _get(row, f) for f in LISTING_FIELDS}
+        card["pin_rank"] = pin(row)
+        card["rank"] = rank
+        out.append(card)
+    return out
+
+def build_listing(city: str, service: str, rows: Sequence[Any]) -> Dict[str, Any]:
+    cards = listing_rows(rows)
+    body = json.dumps(cards, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return {
+        "city": city,
+        "service": service,
+        "city_slug": slugify(city),
+        "service_slug": slugify(service),
+        "listing": cards,
+        "row_count": len(cards),
+        "content_hash": hashlib.sha1(body.encode("utf-8")).hexdigest(),
+    }
+
+def group_by_service(rows: Iterable[Any]) -> Dict[str, List[Any]]:
+    """{service: rows} keeping the incoming (rank) order inside each service."""
+    out: Dict[str, List[Any]] = {}
+    for row in rows:
+        out.setdefault(_get(row, "service") or "", []).append(row)
+    return out
+
+def publish_city(base_url: str, headers: Dict[str, str], city: str, rows_by_service: Dict[str, Sequence[Any]],
+                 replace_city: bool = True, session: Optional[requests.Session] = None,
+                 timeout: int = 60) -> Optional[Tuple[int, int, int]]:
+    """
+    Upsert the listing of every service in rows_by_service whose content hash changed.
+    With replace_city, listings of services the city no longer has are deleted.
+    Returns (written, unchanged, dropped), or None when the table is missing or a request failed.
+    """
+    global _TABLE_MISSING
+    if _TABLE_MISSING or not base_url:
+        return None
+    http = session or requests
+    url = f"{base_url}/rest/v1/{LISTING_TABLE}"
+    try:
+        resp = http.get(url, headers=headers, timeout=timeout,
+                        params={"city": f"eq.{city}", "select": "service,content_hash,version"})
+        if resp.status_code == 404:
+            _TABLE_MISSING = True
+            logging.warning(f"[LISTINGS] table {LISTING_TABLE} not found — listing snapshots disabled "
+                            f"(apply scope_listings.sql)")
+            return None
+        resp.raise_for_status()
+        existing = {r["service"]: r for r in resp.json()}
+
+        now = datetime.now(timezone.utc).isoformat()
+        changed = []
+        for service, rows in rows_by_service.items():
+            if not service or not rows:
+                continue
+            doc = build_listing(city, service, rows)
+            prev = existing.get(service)
+            if prev is not None and prev.get("content_hash") == doc["content_hash"]:
+                continue
+            doc["version"] = (prev.get("version") or 0) + 1 if prev else 1
+            doc["updated_at"] = now
+            changed.append(doc)
+        if changed:
+            resp = http.post(url, params={"on_conflict": "city,service"}, timeout=timeout,
+                             headers={**headers, "Content-Type": "application/json",
+                                      "Prefer": "resolution=merge-duplicates,return=minimal"},
+                             data=json.dumps(changed, ensure_ascii=False).encode("utf-8"))
+            resp.raise_for_status()
+
+        gone = sorted(set(existing) - set(rows_by_service)) if replace_city else []
+        if gone:
+            services = ",".join(f'"{s}"' for s in gone)
+            resp = http.delete(f"{url}?city=eq.{quote(city)}&service=in.({quote(services)})",
+                               headers=headers, timeout=timeout)
+            resp.raise_for_status()
+    except (requests.RequestException, ValueError, KeyError) as e:
+        logging.error(f"[LISTINGS] {city}: could not publish listing snapshots: {e}")
+        return None
+
+    written = len(changed)
+    unchanged = sum(1 for s, rows in rows_by_service.items() if s and rows) - written
+    logging.info(f"[LISTINGS] {city}: {written} written, {unchanged} unchanged, {len(gone)} dropped")
+    return written, unchanged, len(gone)
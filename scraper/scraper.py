@@ -5,48 +5,136 @@
 # - Services loaded from env or scraper/services_seed.json
 # - Local + batch dedupe mirrors DB generated column
 # - Per-city upload with snapshot and auto-restore on failure
+# - Importable without side effects: logging, export dir and the city seed are set up on first use,
+#   Playwright loads only on the browser paths
+
+from __future__ import annotations
 
 import asyncio
 import json
 import logging
 import os
+import queue
 import re
+import sys
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Dict, Any, List, Optional, Set, Tuple
+from typing import Dict, Any, Iterable, List, Optional, Set, Sized, Tuple
+from dataclasses import replace
+from functools import lru_cache
 from urllib.parse import quote
 
-from dotenv import load_dotenv
-from playwright.async_api import async_playwright, TimeoutError as PWTimeout
 import requests
 import argparse
 
+from batching import AdaptiveBatcher, format_summary, iter_chunks
+from page_state import BlockBackoff, BlockedPageError, check_page_state
+from throttle import AimdThrottle
+from timeouts import Deadline, TimeoutLearner
+from sharding import DurationHistory, Job, assign_shards, fold_shard_state, parse_shard
+from refresh import RefreshScheduler, format_report as format_refresh_report
+from list_cache import ListCache, fingerprint, place_id_from_url
+from scope_listings import group_by_service, publish_city
+from http_list import search_places
+from governor import ResourceGovernor
+from export_store import ExportStore
+from history import HistoryStore
+from traffic import TrafficRecorder, TrafficReplayer
+from tail_sampler import TailSampler
+from metro import MetroStats, assign_to_targets
+from records import Business, PAYLOAD_FIELDS, STATE_VALUE, business_key_for, normalize_text, url_has_domain
+from supabase_reader import iter_rows, read_snapshot
+from settings import env, lazy_import, service_key, supabase_headers, supabase_key, supabase_url
+
+playwright_api = lazy_import("playwright.async_api")  # browser paths only
+
 # ------------------------
 # Configuration
 # ------------------------
-load_dotenv(dotenv_path=".env.local")
-
-SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+# Settings come from the environment, then .env.local (see settings.py)
+SUPABASE_URL = supabase_url()
 
 # ------ CHANGE #1: prefer service role key if present; fall back to anon ------
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-SUPABASE_KEY = SUPABASE_SERVICE_ROLE_KEY or os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+SUPABASE_SERVICE_ROLE_KEY = service_key()
+SUPABASE_KEY = supabase_key()
 # ------------------------------------------------------------------------------
 
-SUPABASE_TABLE = os.getenv("SUPABASE_TABLE", "businesses")
+SUPABASE_TABLE = env("SUPABASE_TABLE", "businesses")
 
 EXPORT_DIR = Path("scraper/exports")
-EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+STATE_DIR = Path("scraper/state")  # learned run-to-run state (not committed; cached in CI)
+# Content-addressed exports + city snapshots (see export_store.py; cached in CI like STATE_DIR)
+EXPORT_STORE_DIR = Path(env("EXPORT_STORE_DIR", "scraper/store"))
+SNAPSHOT_KEEP_LAST = int(env("SNAPSHOT_KEEP_LAST", "3"))
+SNAPSHOT_KEEP_DAILY = int(env("SNAPSHOT_KEEP_DAILY", "7"))
+SNAPSHOT_KEEP_WEEKLY = int(env("SNAPSHOT_KEEP_WEEKLY", "4"))
 
 TOP_N_RESULTS = 10
 LIST_TIMEOUT_MS = 15000
 DETAIL_NAME_TIMEOUT_MS = 30000
 AFTER_NAV_NETWORK_IDLE_MS = 2500
 SCROLL_STEPS_MAX = 12
-SCROLL_STEP_PAUSE_MS = 900
-CITY_WATCHDOG_SECONDS = 180
-BETWEEN_CITIES_DELAY_S = 2.5
+SCROLL_STEP_PAUSE_MS = 900  # max wait per scroll step; returns early once new cards render
+CITY_WATCHDOG_SECONDS = 180  # soft deadline per city/service: stop early and keep what was parsed
+CITY_WATCHDOG_GRACE_S = 30   # hard backstop past the deadline (only a single hung call gets this far)
+DEADLINE_MIN_DETAIL_S = 8    # don't open another detail page with less than this left
+DEADLINE_TIGHT_S = 30        # below this, optional waits (networkidle, info panel) are skipped
+# Churn-aware refresh: nightly navigation budget across all scopes (0 = scrape everything) and the
+# age after which a scope is refreshed regardless of how stable it has been
+REFRESH_PAGE_BUDGET = int(env("REFRESH_PAGE_BUDGET", "0"))
+REFRESH_MAX_AGE_DAYS = float(env("REFRESH_MAX_AGE_DAYS", "7"))
+# Churn only feeds the refresh scheduler: without a budget the RPC replace doesn't read the city first
+REFRESH_CHURN = REFRESH_PAGE_BUDGET > 0  # follows --page-budget
+# Same ordered place IDs as the last complete scrape within this many hours -> reuse its rows,
+# skip the detail pages and the DB write (0 disables)
+LIST_CACHE_TTL_H = float(env("LIST_CACHE_TTL_H", "48"))
+# AIMD pacing shared by list + detail navigations (replaces fixed between-page/city sleeps)
+THROTTLE_INITIAL_RATE = float(env("THROTTLE_INITIAL_RATE", "0.5"))  # req/s on a cold start
+THROTTLE_MIN_RATE = float(env("THROTTLE_MIN_RATE", "0.05"))
+THROTTLE_MAX_RATE = float(env("THROTTLE_MAX_RATE", "2.0"))
+THROTTLE_SLOW_S = float(env("THROTTLE_SLOW_S", "10"))  # navigation slower than this counts as pushback
+# Hedged list search: start the "near" query on a second page if "in" has no cards after this
+# delay; first variant with cards wins, the other is cancelled. Negative = serial in-then-near.
+LIST_HEDGE_DELAY_MS = int(env("LIST_HEDGE_DELAY_MS", "5000"))
+# Try list searches over plain HTTP first (see http_list.py); falls back to a Playwright page
+LIST_HTTP_FETCH = (env("LIST_HTTP_FETCH", "false").strip().lower() != "false")  # default OFF
+# Resource governor: detail pages in flight scale between min and max with process-tree RSS / CPU
+GOVERNOR_MIN_PAGES = int(env("GOVERNOR_MIN_PAGES", "1"))
+GOVERNOR_MAX_PAGES = int(env("GOVERNOR_MAX_PAGES", "1"))  # default 1 = one detail page at a time, as before
+GOVERNOR_MEM_LIMIT_MB = float(env("GOVERNOR_MEM_LIMIT_MB", "0"))  # 0 = 70% of RAM
+GOVERNOR_BROWSER_RESTART_MB = float(env("GOVERNOR_BROWSER_RESTART_MB", "1500"))  # 0 = never restart
+# Consent / CAPTCHA / blocked pages: pause before the next city (doubling), stop after N in a row
+BLOCK_BACKOFF_BASE_S = float(env("BLOCK_BACKOFF_BASE_S", "30"))
+BLOCK_BACKOFF_MAX_S = float(env("BLOCK_BACKOFF_MAX_S", "600"))
+BLOCK_ABORT_AFTER = int(env("BLOCK_ABORT_AFTER", "5"))
+
+# Tail sampling of detail pages (timings + network buffer kept only for failed / slowest pages)
+TAIL_TRACE_DIR = EXPORT_DIR / "traces"
+TAIL_PERCENTILE = float(env("TAIL_PERCENTILE", "0.95"))
+TAIL_MIN_S = float(env("TAIL_MIN_S", "5"))         # an ok page faster than this is never sampled
+TAIL_TOP_K = int(env("TAIL_TOP_K", "20"))           # slowest pages listed in the run's index.json
+TAIL_MAX_SAVED = int(env("TAIL_MAX_SAVED", "40"))   # sample files per run
+TAIL_PLAYWRIGHT_TRACES = (env("TAIL_PLAYWRIGHT_TRACES", "false").strip().lower() != "false")  # default OFF
+
+# Metro consolidation: one wide list query per (metro, service), per-city queries only for under-filled targets
+METRO_CONSOLIDATE = (env("METRO_CONSOLIDATE", "false").strip().lower() != "false")  # default OFF
+METRO_LIST_LIMIT = int(env("METRO_LIST_LIMIT", "60"))  # max candidates read from the wide list
+METRO_MIN_FILL = int(env("METRO_MIN_FILL", "5"))       # fewer places assigned -> the target runs its own query
+# With --only-city the wide search must leave room for the city's own fallback inside the per-city job timeout
+METRO_ONLY_CITY_BUDGET_S = float(env("METRO_ONLY_CITY_BUDGET_S", "360"))
+# Selector / navigation waits learned from run history: (cold-start ms, floor ms, cap ms) per step.
+# The budget is a high percentile of past latencies x headroom, clamped to [floor, cap].
+WAIT_BUDGETS = {
+    "list_goto": (60000, 15000, 60000),
+    "list_idle": (AFTER_NAV_NETWORK_IDLE_MS, 500, AFTER_NAV_NETWORK_IDLE_MS),
+    "list_cards": (LIST_TIMEOUT_MS, 5000, LIST_TIMEOUT_MS),
+    "detail_goto": (60000, 15000, 60000),
+    "detail_idle": (AFTER_NAV_NETWORK_IDLE_MS, 500, AFTER_NAV_NETWORK_IDLE_MS),
+    "detail_name": (DETAIL_NAME_TIMEOUT_MS, 5000, DETAIL_NAME_TIMEOUT_MS),
+    "detail_info": (5000, 1000, 5000),  # only used when the info panel has not rendered yet
+}
 
 BLOCK_RESOURCE_TYPES = {"image", "font", "media"}
 BLOCK_URL_PATTERNS = [
@@ -58,21 +146,79 @@ BLOCK_URL_PATTERNS = [
 ]
 
 HANDYMAN_TN_DOMAIN_KEY = "handyman-tn.com"
-SUPABASE_CHUNK_SIZE = 500
-
-STATE_VALUE = "TN"
+SUPABASE_CHUNK_SIZE = 500                                           # starting rows per chunk (adapts at runtime)
+UPLOAD_CHUNK_MIN_ROWS = int(env("UPLOAD_CHUNK_MIN_ROWS", "25"))
+UPLOAD_CHUNK_MAX_ROWS = int(env("UPLOAD_CHUNK_MAX_ROWS", "2000"))
+UPLOAD_CHUNK_MAX_BYTES = int(env("UPLOAD_CHUNK_MAX_BYTES", "1000000"))
+UPLOAD_TARGET_LATENCY_S = float(env("UPLOAD_TARGET_LATENCY_S", "5"))
+UPLOAD_MAX_IN_FLIGHT = int(env("UPLOAD_MAX_IN_FLIGHT", "3"))  # concurrent chunk POSTs per city
+UPLOAD_QUEUE_MAX = int(env("UPLOAD_QUEUE_MAX", "2"))          # finished cities waiting for upload
+UPLOAD_CONFLICT_COLUMNS = "name,website,city,service"        # unique key used when a retry must be idempotent
+UPLOAD_RETRY_ATTEMPTS = int(env("UPLOAD_RETRY_ATTEMPTS", "4"))   # resends of a single row on 429 / 5xx / timeout
+UPLOAD_RETRY_BASE_S = float(env("UPLOAD_RETRY_BASE_S", "1"))     # backoff before a resend, doubled per attempt
+UPLOAD_RETRY_MAX_S = float(env("UPLOAD_RETRY_MAX_S", "30"))      # cap on that backoff (and on Retry-After)
+
+# City replace strategy: "rpc" (server-side, see businesses_replace_city.sql), "client"
+# (snapshot -> delete -> upload -> restore), or "auto" (rpc, falling back to client if not deployed)
+CITY_REPLACE_MODE = env("CITY_REPLACE_MODE", "auto").strip().lower()
+CITY_REPLACE_RPC = env("CITY_REPLACE_RPC", "replace_city_businesses")
 
 LOGGING_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
-logging.basicConfig(level=logging.INFO, format=LOGGING_FORMAT, datefmt="%Y-%m-%d %H:%M:%S")
-
-# Load cities
-with open("scraper/cities_seed.json", "r", encoding="utf-8") as f:
-    CITY_CONFIG = json.load(f)
+CITY_SEED_PATH = Path("scraper/cities_seed.json")
 
 GLOBAL_SEEN: Set[Tuple[str, str]] = set()
-
-def _now_ts() -> str:
-    return datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+LIST_STATS: List[Dict[str, Any]] = []  # one entry per (city, service) list search
+LIST_FETCH_STATS = {"http": 0, "browser_fallback": 0, "http_s": 0.0}
+PAGE_COUNTS = {"list_queries": 0, "detail_pages": 0, "reused": 0}  # navigations, for the metro report
+METRO_PLACES: Dict[str, Business] = {}  # place id -> detail parsed by this service's metro passes
+METRO_STATS = MetroStats()
+PARTIAL_SCOPES: Dict[str, Set[str]] = {}  # city -> services cut short by the deadline
+DEFERRED_SCOPES: Dict[str, Set[str]] = {}  # city -> services not refreshed tonight (page budget)
+UNCHANGED_SCOPES: Dict[str, Set[str]] = {}  # city -> services whose list fingerprint matched the cache
+UNCHANGED_PAGES_SKIPPED = 0
+BLOCK_BACKOFF = BlockBackoff(BLOCK_BACKOFF_BASE_S, BLOCK_BACKOFF_MAX_S, BLOCK_ABORT_AFTER)
+THROTTLE = AimdThrottle(
+    initial_rate=THROTTLE_INITIAL_RATE,
+    min_rate=THROTTLE_MIN_RATE,
+    max_rate=THROTTLE_MAX_RATE,
+    slow_s=THROTTLE_SLOW_S,
+    state_path=STATE_DIR / "throttle.json",
+)
+WAIT_TIMEOUTS = TimeoutLearner(WAIT_BUDGETS, state_path=STATE_DIR / "timeouts.json")
+DURATIONS = DurationHistory(STATE_DIR / "durations.json")  # per (city, service) seconds, weights --shard
+REFRESH = RefreshScheduler(STATE_DIR / "refresh.json", max_age_days=REFRESH_MAX_AGE_DAYS)
+LIST_CACHE = ListCache(STATE_DIR / "list_cache", ttl_s=LIST_CACHE_TTL_H * 3600)
+GOVERNOR = ResourceGovernor(
+    min_slots=GOVERNOR_MIN_PAGES,
+    max_slots=GOVERNOR_MAX_PAGES,
+    mem_limit_mb=GOVERNOR_MEM_LIMIT_MB,
+    restart_browser_mb=GOVERNOR_BROWSER_RESTART_MB,
+)
+EXPORT_STORE = ExportStore(
+    EXPORT_STORE_DIR,
+    keep_last=SNAPSHOT_KEEP_LAST,
+    keep_daily=SNAPSHOT_KEEP_DAILY,
+    keep_weekly=SNAPSHOT_KEEP_WEEKLY,
+)
+HISTORY = HistoryStore(EXPORT_STORE_DIR / "history")  # per-scope rank / rating / review-count series
+TRAFFIC: Optional[Any] = None  # TrafficRecorder / TrafficReplayer with --record / --replay
+TAIL = TailSampler(
+    TAIL_TRACE_DIR,
+    percentile=TAIL_PERCENTILE,
+    min_s=TAIL_MIN_S,
+    top_k=TAIL_TOP_K,
+    max_saved=TAIL_MAX_SAVED,
+    playwright_traces=TAIL_PLAYWRIGHT_TRACES,
+)
+
+@lru_cache(maxsize=None)
+def city_config() -> List[Dict[str, Any]]:
+    """Metros and their targets from the city seed, read once on first use."""
+    with open(CITY_SEED_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def configure_logging() -> None:
+    logging.basicConfig(level=logging.INFO, format=LOGGING_FORMAT, datefmt="%Y-%m-%d %H:%M:%S")
 
 def _append_summary_line(line: str) -> None:
     """Append a single line to the GitHub job summary, if available."""
@@ -88,7 +234,7 @@ def _append_summary_line(line: str) -> None:
 # Services (multi-service, env or seed file)
 # ------------------------
 def _services_from_env() -> Optional[List[str]]:
-    raw = (os.getenv("SERVICES") or "").strip()
+    raw = (env("SERVICES") or "").strip()
     if not raw:
         return None
     # Try JSON array first
@@ -131,43 +277,28 @@ def get_services() -> List[str]:
 # ------------------------
 # Utility helpers
 # ------------------------
-def normalize_text(s: Optional[str]) -> str:
-    if not s:
-        return ""
-    return re.sub(r"\s+", " ", s.strip()).lower()
-
 def is_handyman_tn(url: Optional[str]) -> bool:
-    if not url:
-        return False
-    u = normalize_text(url)
-    u = re.sub(r"^https?://", "", u)
-    u = re.sub(r"^www\.", "", u)
-    return HANDYMAN_TN_DOMAIN_KEY in u
+    return url_has_domain(url, HANDYMAN_TN_DOMAIN_KEY)
 
-def promote_handyman_tn(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def promote_handyman_tn(records: List[Business]) -> List[Business]:
     featured = [r for r in records if is_handyman_tn(r.get("website"))]
     non_featured = [r for r in records if not is_handyman_tn(r.get("website"))]
     return featured + non_featured
 
 # ---------- SEO PIN: keep our brand first for selected cities (OFF by default) ----------
-PIN_ENABLE = (os.getenv("PIN_ENABLE", "false").strip().lower() != "false")  # default OFF
-PIN_DOMAIN = os.getenv("PIN_DOMAIN", "handyman-tn.com").strip().lower()
-PIN_FORCE_TOP_CITIES = {c.strip() for c in os.getenv("PIN_FORCE_TOP_CITIES", "Franklin,Brentwood").split(",") if c.strip()}
-PIN_NAME = os.getenv("PIN_NAME", "HANDYMAN-TN LLC")
-PIN_WEBSITE = os.getenv("PIN_WEBSITE", "https://www.handyman-tn.com")
-PIN_MAPS_URL = os.getenv("PIN_MAPS_URL", "")  # optional
-PIN_PHONE = os.getenv("PIN_PHONE", "")        # optional
-PIN_ADDRESS = os.getenv("PIN_ADDRESS", "")    # optional
+PIN_ENABLE = (env("PIN_ENABLE", "false").strip().lower() != "false")  # default OFF
+PIN_DOMAIN = env("PIN_DOMAIN", "handyman-tn.com").strip().lower()
+PIN_FORCE_TOP_CITIES = {c.strip() for c in env("PIN_FORCE_TOP_CITIES", "Franklin,Brentwood").split(",") if c.strip()}
+PIN_NAME = env("PIN_NAME", "HANDYMAN-TN LLC")
+PIN_WEBSITE = env("PIN_WEBSITE", "https://www.handyman-tn.com")
+PIN_MAPS_URL = env("PIN_MAPS_URL", "")  # optional
+PIN_PHONE = env("PIN_PHONE", "")        # optional
+PIN_ADDRESS = env("PIN_ADDRESS", "")    # optional
 
 def _is_pin_domain(url: Optional[str]) -> bool:
-    if not url:
-        return False
-    u = url.lower().strip()
-    u = re.sub(r"^https?://", "", u)
-    u = re.sub(r"^www\.", "", u)
-    return PIN_DOMAIN in u
+    return url_has_domain(url, PIN_DOMAIN)
 
-def ensure_pinned_top(records: List[Dict[str, Any]], city: str, service: str) -> List[Dict[str, Any]]:
+def ensure_pinned_top(records: List[Business], city: str, service: str) -> List[Business]:
     """
     Guarantee exactly one pinned row at index 0 for selected cities.
     1) If an item with PIN_DOMAIN exists -> move it to front.
@@ -189,60 +320,38 @@ def ensure_pinned_top(records: List[Dict[str, Any]], city: str, service: str) ->
             return records
 
     # Inject minimal row if nothing to promote
-    injected = {
-        "name": PIN_NAME,
-        "address": PIN_ADDRESS,
-        "phone": PIN_PHONE,
-        "website": PIN_WEBSITE,
-        "city": city,
-        "service": service,
-        "state": STATE_VALUE,
-        "maps_url": PIN_MAPS_URL,  # OK if blank
-        "review_count": None,
-        "avg_rating": None,
-    }
+    injected = Business(
+        name=PIN_NAME,
+        address=PIN_ADDRESS,
+        phone=PIN_PHONE,
+        website=PIN_WEBSITE,
+        city=city,
+        service=service,
+        state=STATE_VALUE,
+        maps_url=PIN_MAPS_URL,  # OK if blank
+    )
     records.insert(0, injected)
     logging.info(f"[PIN] Injected for {city} / {service} (none found)")
     return records
 # ---------- /SEO PIN ----------
 
 # ---------- DB-mirrored local fingerprint & dedupe ----------
-def _normalize_website_for_key(website: Optional[str]) -> str:
-    """
-    Mirror the DB's normalization used inside business_key:
-    - strip protocol and 'www.'
-    - strip trailing slash
-    - lower-case
-    - return '' if missing (the caller will convert to 'no-site')
-    """
-    if not website:
-        return ""
-    u = website.strip()
-    u = re.sub(r"^https?://", "", u, flags=re.I)
-    u = re.sub(r"^www\.", "", u, flags=re.I)
-    u = u.rstrip("/")
-    return u.lower()
-
-def _business_key_for_local(row: Dict[str, Any]) -> str:
+def _business_key_for_local(row: Any) -> str:
     """
-    EXACT mirror of the DB's generated business_key:
-      case when maps_url present -> lower(trim(maps_url))
-      else lower(name with collapsed whitespace) + '|' + normalized website (or 'no-site')
+    EXACT mirror of the DB's generated business_key (see records.business_key_for).
+    Business records cache the key, so repeated dedupe passes compute it once per row.
     """
-    maps_url = (row.get("maps_url") or "").strip()
-    if maps_url:
-        return maps_url.lower()
-    name_norm = normalize_text(row.get("name"))  # collapses internal whitespace + lower
-    site_norm = _normalize_website_for_key(row.get("website"))
-    return f"{name_norm}|{(site_norm or 'no-site')}"
+    if isinstance(row, Business):
+        return row.business_key
+    return business_key_for(row)
 
-def deduplicate_local(businesses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def deduplicate_local(businesses: List[Business]) -> List[Business]:
     """
     Deduplicate in-memory using the same fingerprint the DB uses (business_key),
     and include service in the key to keep per-service rows distinct (DB unique is on city, service, business_key).
     """
     seen: Set[Tuple[str, str]] = set()
-    unique: List[Dict[str, Any]] = []
+    unique: List[Business] = []
     for b in businesses:
         service = normalize_text(b.get("service"))
         key = _business_key_for_local(b)
@@ -255,13 +364,13 @@ def deduplicate_local(businesses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
 # ---------- /DB-mirrored ----------
 
 # ---------- Batch-level dedupe across all rows ----------
-def deduplicate_across_all_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def deduplicate_across_all_rows(rows: List[Business]) -> List[Business]:
     """
     Final safety net: remove duplicates across *all* rows being uploaded.
     Mirrors DB unique (city, service, business_key).
     """
     seen: Set[Tuple[str, str, str]] = set()
-    out: List[Dict[str, Any]] = []
+    out: List[Business] = []
     for r in rows:
         city = (r.get("city") or "").strip()      # keep exact case; DB uses text
         service = normalize_text(r.get("service"))
@@ -277,7 +386,7 @@ def deduplicate_across_all_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, An
     return out
 # ---------- /Batch-level ----------
 
-def add_to_global_seen(businesses: List[Dict[str, Any]]) -> None:
+def add_to_global_seen(businesses: List[Business]) -> None:
     for b in businesses:
         website = normalize_text(b.get("website"))
         name = normalize_text(b.get("name"))
@@ -288,64 +397,45 @@ def is_globally_seen(name: str, website: str) -> bool:
         return False
     return (normalize_text(name), normalize_text(website)) in GLOBAL_SEEN
 
-def _parse_int(val: Any) -> Optional[int]:
-    if val is None:
-        return None
-    if isinstance(val, int):
-        return val
-    if isinstance(val, float):
-        return int(val)
-    if isinstance(val, str):
-        digits = re.sub(r"[^\d]", "", val)
-        return int(digits) if digits else None
-    return None
-
-def _parse_float(val: Any) -> Optional[float]:
-    if val is None:
-        return None
-    if isinstance(val, (int, float)):
-        return float(val)
-    if isinstance(val, str):
-        try:
-            return float(val.strip())
-        except ValueError:
-            m = re.match(r"\s*(\d+(?:\.\d+)?)", val)
-            return float(m.group(1)) if m else None
-    return None
-
 # ------------------------
 # Supabase helpers (city-scoped snapshot & restore)
 # ------------------------
 def _sb_headers(json_mode: bool = False) -> Dict[str, str]:
-    h = {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-    }
-    if json_mode:
-        h["Content-Type"] = "application/json"
-    return h
-
-def backup_supabase_city(city: str) -> List[Dict[str, Any]]:
-    """Snapshot ONLY one city's rows before we delete that city."""
-    headers = _sb_headers()
-    url = f"{SUPABASE_URL}/rest/v1/{SUPABASE_TABLE}?city=eq.{quote(city)}&select=*"
+    return supabase_headers(json_mode)
+
+_HTTP: Optional[requests.Session] = None
+
+def _http_session() -> requests.Session:
+    """Pooled connections shared by concurrent chunk uploads."""
+    global _HTTP
+    if _HTTP is None:
+        _HTTP = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(4, UPLOAD_MAX_IN_FLIGHT))
+        _HTTP.mount("https://", adapter)
+        _HTTP.mount("http://", adapter)
+    return _HTTP
+
+def backup_supabase_city(city: str) -> Optional[Path]:
+    """
+    Snapshot ONLY one city's rows before we delete that city.
+    Pages through the city by id (never truncated by PostgREST max-rows), selects only the
+    columns a restore writes back, and streams them into EXPORT_STORE (an unchanged city
+    reuses its blob; old snapshots are pruned by the retention policy).
+    Returns the snapshot path, or None if the snapshot could not be taken.
+    """
+    rows = iter_rows(
+        SUPABASE_URL, SUPABASE_TABLE, _sb_headers(),
+        filters={"city": f"eq.{city}"},
+        columns=PAYLOAD_FIELDS,
+        session=_http_session(),
+    )
     try:
-        resp = requests.get(url, headers=headers, timeout=60)
-        resp.raise_for_status()
-        rows = resp.json()
-        if not isinstance(rows, list):
-            logging.error(f"[CITY BACKUP] {city}: unexpected response shape")
-            return []
-        ts = _now_ts()
-        city_slug = city.lower().replace(" ", "_")
-        path = EXPORT_DIR / f"city_backup_{city_slug}_{ts}.json"
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(rows, f, ensure_ascii=False, indent=2)
-        logging.info(f"[CITY BACKUP] {city}: {len(rows)} rows -> {path}")
-        return rows
-    except requests.RequestException as e:
-        logging.error(f"[CITY BACKUP] {city}: network error: {e}")
-        return []
+        path = EXPORT_STORE.put_snapshot(city, rows)
+    except (requests.RequestException, ValueError, OSError) as e:
+        logging.error(f"[CITY BACKUP] {city}: snapshot failed: {e}")
+        return None
+    logging.info(f"[CITY BACKUP] {city}: snapshot -> {path}")
+    return path
 
 def delete_supabase_city(city: str) -> bool:
     """Delete all rows for a specific city."""
@@ -358,64 +448,163 @@ def delete_supabase_city(city: str) -> bool:
     logging.error(f"[SUPABASE] Failed to delete: {resp.status_code} {resp.text}")
     return False
 
-def _normalize_payload_row(row: Dict[str, Any]) -> Dict[str, Any]:
-    # Select only the columns that exist in the database table
-    fields = {"name", "address", "phone", "website", "city", "service", "state", "maps_url", "review_count", "avg_rating"}
-    payload = {k: row.get(k) for k in fields}
-
-    # normalize strings
-    for k in {"name", "address", "phone", "website", "city", "service", "state", "maps_url"}:
-        v = payload.get(k)
-        payload[k] = str(v).strip() if v is not None else ""
-
-    # numeric parsing
-    payload["review_count"] = _parse_int(payload.get("review_count"))
-    payload["avg_rating"] = _parse_float(payload.get("avg_rating"))
-    return payload
+def _normalize_payload_row(row: Any) -> Dict[str, Any]:
+    # Business records are already normalized; snapshot dicts are normalized once here.
+    # Only the columns that exist in the database table are selected.
+    return Business.from_row(row).to_payload()
+
+def _encode_row(row: Any) -> bytes:
+    """Serialize one row once (compact separators, UTF-8); chunks are joined from these bytes."""
+    return json.dumps(_normalize_payload_row(row), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+_UPLOAD_BATCHER: Optional[AdaptiveBatcher] = None
+
+def upload_batcher() -> AdaptiveBatcher:
+    """Run-wide chunk-size controller, so later cities start from the size learned earlier."""
+    global _UPLOAD_BATCHER
+    if _UPLOAD_BATCHER is None:
+        _UPLOAD_BATCHER = AdaptiveBatcher(
+            start_rows=SUPABASE_CHUNK_SIZE,
+            min_rows=UPLOAD_CHUNK_MIN_ROWS,
+            max_rows=UPLOAD_CHUNK_MAX_ROWS,
+            max_bytes=UPLOAD_CHUNK_MAX_BYTES,
+            target_latency_s=UPLOAD_TARGET_LATENCY_S,
+            name="upload",
+        )
+    return _UPLOAD_BATCHER
+
+def _retry_delay_s(status: Optional[int], retry_after: Optional[str], attempt: int) -> float:
+    """Backoff before resending after a 429 / 5xx / timeout: the server's Retry-After on 429, else exponential."""
+    if status == 429 and retry_after and retry_after.strip().isdigit():
+        return min(UPLOAD_RETRY_MAX_S, float(retry_after))
+    return min(UPLOAD_RETRY_MAX_S, UPLOAD_RETRY_BASE_S * (2 ** attempt))
+
+def _post_chunk(label: str, rows: List[bytes], headers: Dict[str, str], batcher: AdaptiveBatcher,
+                upsert: bool = False, attempt: int = 0) -> None:
+    """
+    POST one chunk. 413/414 (body too large, nothing written) split the chunk in half and resend
+    each half as before. Timeouts / 5xx / 429 may have committed the rows, so after a backoff the
+    halves are resent as an upsert on the business columns (idempotent, never a 23505 on rows that
+    did land); a single row is resent that way up to UPLOAD_RETRY_ATTEMPTS times.
+    Anything else (e.g. 409 duplicate) raises for the caller's city restore.
+    """
+    body = b"[" + b",".join(rows) + b"]"
+    status: Optional[int] = None
+    retry_after: Optional[str] = None
+    details = ""
+    t0 = time.perf_counter()
+    if upsert:
+        headers = {**headers, "Prefer": "resolution=merge-duplicates,return=minimal"}
+    try:
+        resp = _http_session().post(
+            f"{SUPABASE_URL}/rest/v1/{SUPABASE_TABLE}",
+            params={"on_conflict": UPLOAD_CONFLICT_COLUMNS} if upsert else None,
+            headers=headers,
+            data=body,
+            timeout=120,
+        )
+        status = resp.status_code
+        ok = resp.ok
+        details = "" if ok else resp.text
+        retry_after = resp.headers.get("Retry-After")
+    except requests.RequestException as e:
+        ok = False
+        details = str(e)
+    batcher.record(len(rows), len(body), time.perf_counter() - t0, ok=ok, status=status)
+    if ok:
+        return
+    if batcher.is_retryable(status) and batcher.is_too_large(status) and len(rows) > 1:
+        mid = len(rows) // 2
+        batcher.note_split()
+        logging.warning(f"[UPLOAD] chunk {label}: {status} on {len(rows)} rows -> splitting in two")
+        _post_chunk(f"{label}a", rows[:mid], headers, batcher, upsert, attempt)
+        _post_chunk(f"{label}b", rows[mid:], headers, batcher, upsert, attempt)
+        return
+    if batcher.is_retryable(status) and not batcher.is_too_large(status) and (len(rows) > 1 or attempt < UPLOAD_RETRY_ATTEMPTS):
+        # The server is struggling (or the request timed out): back off before sending anything again
+        delay = _retry_delay_s(status, retry_after, attempt)
+        what = "splitting in two" if len(rows) > 1 else f"retry {attempt + 1}/{UPLOAD_RETRY_ATTEMPTS}"
+        logging.warning(f"[UPLOAD] chunk {label}: {status or 'no response'} on {len(rows)} rows -> {what} "
+                        f"in {delay:.1f}s" + ("" if upsert else " (resent as upsert)"))
+        time.sleep(delay)
+        if len(rows) == 1:
+            _post_chunk(label, rows, headers, batcher, True, attempt + 1)
+            return
+        mid = len(rows) // 2
+        batcher.note_split()
+        _post_chunk(f"{label}a", rows[:mid], headers, batcher, True, attempt + 1)
+        _post_chunk(f"{label}b", rows[mid:], headers, batcher, True, attempt + 1)
+        return
+    # Propagate with details for higher-level recovery
+    raise RuntimeError(f"[UPLOAD] failed chunk {label}: {status or ''} {details}".rstrip())
 
-def upload_businesses_chunked(businesses: List[Dict[str, Any]]) -> None:
-    if not businesses:
+def upload_businesses_chunked(businesses: Iterable[Any], max_in_flight: int = UPLOAD_MAX_IN_FLIGHT) -> int:
+    """
+    Insert rows in adaptively sized chunks (see upload_batcher) with up to max_in_flight POSTs
+    outstanding. The next chunk is serialized while earlier ones are on the wire. On the first
+    chunk that fails even after splitting, no further chunks are sent and the error is raised
+    (callers restore the city). Accepts any iterable (e.g. a streamed snapshot); returns rows sent.
+    """
+    total = len(businesses) if isinstance(businesses, Sized) else "?"
+    if total == 0:
         logging.info("[UPLOAD] Nothing to upload.")
-        return
+        return 0
     # ------ CHANGE #2: use minimal return to avoid follow-up SELECT under RLS ------
     headers = {**_sb_headers(json_mode=True), "Prefer": "return=minimal"}
     # ------------------------------------------------------------------------------
-    total = len(businesses)
+    batcher = upload_batcher()
     sent = 0
-    for i in range(0, total, SUPABASE_CHUNK_SIZE):
-        chunk = businesses[i : i + SUPABASE_CHUNK_SIZE]
-        payload = [_normalize_payload_row(b) for b in chunk]
-        try:
-            resp = requests.post(
-                f"{SUPABASE_URL}/rest/v1/{SUPABASE_TABLE}",
-                headers=headers,
-                json=payload,
-                timeout=120,
-            )
-            resp.raise_for_status()
-        except requests.RequestException as e:
-            # Propagate with details for higher-level recovery
-            details = e.response.text if getattr(e, "response", None) is not None else str(e)
-            raise RuntimeError(f"[UPLOAD] failed chunk {i//SUPABASE_CHUNK_SIZE}: {details}") from e
-        sent += len(chunk)
-        logging.info(f"[UPLOAD] {sent}/{total} inserted")
-
-def restore_supabase_city(city: str, backup_rows: List[Dict[str, Any]]) -> None:
-    """Restore ONLY one city's rows from a just-taken snapshot."""
+    failure: Optional[BaseException] = None
+
+    def _drain(done) -> None:
+        nonlocal sent, failure
+        for fut in done:
+            err = fut.exception()
+            if err is not None:
+                failure = failure or err
+                continue
+            sent += pending_sizes.pop(fut)
+            logging.info(f"[UPLOAD] {sent}/{total} inserted (next chunk size {batcher.rows})")
+
+    pending_sizes: Dict[Any, int] = {}
+    chunks = iter_chunks((_encode_row(b) for b in businesses), batcher)
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight), thread_name_prefix="upload-chunk") as pool:
+        for index, chunk in enumerate(chunks):
+            fut = pool.submit(_post_chunk, str(index), chunk, headers, batcher)
+            pending_sizes[fut] = len(chunk)
+            if len(pending_sizes) >= max(1, max_in_flight):
+                done, _ = wait(list(pending_sizes), return_when=FIRST_COMPLETED)
+                _drain(done)
+            if failure:
+                break
+        done, _ = wait(list(pending_sizes))
+        _drain(done)
+    if failure:
+        raise failure
+    return sent
+
+def restore_supabase_city(city: str, snapshot: Optional[Path]) -> None:
+    """Restore ONLY one city's rows from a just-taken snapshot (streamed back from disk)."""
     logging.warning(f"[RESTORE] City={city}: attempting city-scoped restore...")
-    if not backup_rows:
+    rows = read_snapshot(snapshot) if snapshot else iter(())
+    first = next(rows, None)
+    if first is None:
         logging.warning(f"[RESTORE] City={city}: no snapshot; leaving city empty.")
         return
     if not delete_supabase_city(city):
         logging.error(f"[RESTORE] City={city}: could not clear partial rows before restore.")
         return
     try:
-        upload_businesses_chunked(backup_rows)
-        logging.warning(f"[RESTORE] City={city}: restore completed ({len(backup_rows)} rows).")
+        restored = upload_businesses_chunked(_chain_first(first, rows))
+        logging.warning(f"[RESTORE] City={city}: restore completed ({restored} rows).")
         _append_summary_line(f"- **RESTORED** city **{city}** from snapshot after upload failure.")
     except Exception as e:
         logging.error(f"[RESTORE] City={city}: restore failed: {e}")
 
+def _chain_first(first: Any, rest: Iterable[Any]) -> Iterable[Any]:
+    yield first
+    yield from rest
+
 # ------------------------
 # Playwright helpers
 # ------------------------
@@ -428,9 +617,18 @@ async def block_requests_for_list(context) -> None:
         for pat in BLOCK_URL_PATTERNS:
             if re.search(pat, url):
                 return await route.abort()
-        return await route.continue_()
+        return await route.fallback()  # next handler (--record / --replay), else the network
     await context.route("**/*", route_handler)
 
+async def new_context(browser):
+    """browser.new_context(), routed through the recorder / replayer when one is active."""
+    if TRAFFIC is None:
+        return await browser.new_context()
+    # Service-worker fetches bypass context routes; blocking them keeps every request on the tap
+    context = await browser.new_context(service_workers="block")
+    await context.route("**/*", TRAFFIC.handle)
+    return context
+
 async def wait_for_any(page, selectors: List[str], timeout_ms: int) -> Optional[str]:
     end = time.time() + (timeout_ms / 1000.0)
     while time.time() < end:
@@ -450,9 +648,16 @@ async def scroll_list_with_growth(page) -> None:
     last_count = 0
     for _ in range(SCROLL_STEPS_MAX):
         await page.keyboard.press("End")
-        await page.wait_for_timeout(SCROLL_STEP_PAUSE_MS)
-        cards = await page.query_selector_all("a.hfpxzc, a[role='link'][href*='/place/']")
-        count = len(cards)
+        # Poll for growth instead of a fixed pause: fast when Maps is responsive,
+        # still bounded by SCROLL_STEP_PAUSE_MS when the feed has stopped growing
+        end = time.time() + SCROLL_STEP_PAUSE_MS / 1000.0
+        count = last_count
+        while True:
+            cards = await page.query_selector_all("a.hfpxzc, a[role='link'][href*='/place/']")
+            count = len(cards)
+            if count > last_count or time.time() >= end:
+                break
+            await asyncio.sleep(0.1)
         if count <= last_count:
             break
         last_count = count
@@ -460,111 +665,174 @@ async def scroll_list_with_growth(page) -> None:
 # ------------------------
 # Core scraping logic
 # ------------------------
-async def parse_detail(page, url: str, city: str, service: str) -> Optional[Dict[str, Any]]:
-    business = {
-        "name": "",
-        "address": "",
-        "phone": "",
-        "website": "",
-        "city": city,
-        "service": service,
-        "review_count": None,
-        "avg_rating": None,
-        "state": STATE_VALUE,
-        "maps_url": "",
-    }
+# Every optional field in one round trip, instead of a query (or a blocking wait) per field
+_DETAIL_SNAPSHOT_JS = """
+() => {
+  const q = (sel) => document.querySelector(sel);
+  const attr = (el, name) => (el && el.getAttribute(name)) || "";
+  const text = (el) => (el && el.textContent) || "";
+  const nameEl = q("h1.DUwDvf") || q("h1[role='heading']");
+  const addrAlt = q('div.Io6YTe:has(span[aria-label="Address"])');
+  const site = q('a[data-item-id="authority"]') || q('a[data-tooltip="Open website"]');
+  let rating = q('span[role="img"][aria-label*="stars"]');
+  if (!rating) {
+    rating = Array.from(document.querySelectorAll('span[aria-hidden="true"]'))
+      .find((el) => text(el).includes(".")) || null;
+  }
+  return {
+    name: text(nameEl),
+    address_aria: attr(q('button[data-item-id="address"]'), "aria-label"),
+    address_alt: text(addrAlt),
+    phone_href: attr(q('a[href^="tel:"]'), "href"),
+    website: attr(site, "href"),
+    reviews_aria: attr(q('span[aria-label$="reviews"]'), "aria-label"),
+    rating_text: attr(rating, "aria-label") || text(rating),
+    info_rows: document.querySelectorAll("button[data-item-id], a[data-item-id]").length,
+  };
+}
+"""
+
+async def _learned_wait(step: str, wait, required: bool = False, deadline: Optional[Deadline] = None) -> bool:
+    """
+    Run wait(timeout_ms) under the learned budget for step (clamped to the deadline, if any) and
+    record how long it took. Returns False on timeout, or re-raises it when the step is required.
+    """
+    budget = WAIT_TIMEOUTS.timeout_ms(step)
+    if deadline is not None:
+        budget = deadline.clamp_ms(budget)
+        if budget <= 0:
+            # Out of time; Playwright treats timeout=0 as "wait forever", so never pass it through
+            if required:
+                raise playwright_api.TimeoutError(f"{step}: scope deadline reached")
+            return False
+    t0 = time.time()
     try:
-        await page.goto(url, wait_until="domcontentloaded", timeout=60000)
-        try:
-            await page.wait_for_load_state("networkidle", timeout=AFTER_NAV_NETWORK_IDLE_MS)
-        except PWTimeout:
-            pass
+        await wait(budget)
+    except playwright_api.TimeoutError:
+        WAIT_TIMEOUTS.observe(step, budget, timed_out=True)
+        if required:
+            raise
+        return False
+    WAIT_TIMEOUTS.observe(step, (time.time() - t0) * 1000)
+    return True
 
-        # Canonical Maps URL after navigation
-        business["maps_url"] = page.url
+def _apply_detail_snapshot(business: Business, snap: Dict[str, Any]) -> None:
+    business.name = (snap.get("name") or "").strip()
 
-        try:
-            await page.wait_for_selector("h1.DUwDvf, h1[role='heading']", timeout=DETAIL_NAME_TIMEOUT_MS)
-        except PWTimeout:
-            logging.warning(f"[DETAIL] Name selector timeout on {url}")
-            return None
+    aria = snap.get("address_aria") or ""
+    if aria:
+        business.address = aria.replace("Address: ", "").strip()
+    if not business.address and snap.get("address_alt"):
+        business.address = re.sub(r"^\s*Address:\s*", "", snap["address_alt"].strip()).strip()
+
+    href = snap.get("phone_href") or ""
+    if href:
+        business.phone = href.replace("tel:", "").strip()
+
+    business.website = (snap.get("website") or "").strip()
 
-        name_el = await page.query_selector("h1.DUwDvf") or await page.query_selector("h1[role='heading']")
-        if name_el:
-            business["name"] = (await name_el.text_content() or "").strip()
-
-        addr_el = await page.query_selector('button[data-item-id="address"]')
-        if addr_el:
-            aria = await addr_el.get_attribute("aria-label") or ""
-            if aria:
-                business["address"] = aria.replace("Address: ", "").strip()
-        if not business["address"]:
-            alt = await page.query_selector('div.Io6YTe:has(span[aria-label="Address"])')
-            if alt:
-                txt = (await alt.text_content() or "").strip()
-                business["address"] = re.sub(r"^\s*Address:\s*", "", txt)
+    digits = re.sub(r"[^\d]", "", snap.get("reviews_aria") or "")
+    if digits:
+        try:
+            business.review_count = int(digits)
+        except ValueError:
+            pass
 
+    rating = snap.get("rating_text") or ""
+    rating_text = (rating.split(" ")[0] if rating else "").strip()
+    if re.fullmatch(r"\d+(\.\d+)?", rating_text):
         try:
-            tel_el = await page.wait_for_selector('a[href^="tel:"]', timeout=5000)
-            href = await tel_el.get_attribute("href") if tel_el else ""
-            if href:
-                business["phone"] = href.replace("tel:", "").strip()
-        except PWTimeout:
+            business.avg_rating = float(rating_text)
+        except ValueError:
             pass
 
-        site_el = await page.query_selector('a[data-item-id="authority"]') \
-                 or await page.query_selector('a[data-tooltip="Open website"]')
-        if site_el:
-            site = await site_el.get_attribute("href") or ""
-            business["website"] = site.strip()
-
-        count_el = await page.query_selector('span[aria-label$="reviews"]')
-        if count_el:
-            aria = await count_el.get_attribute("aria-label") or ""
-            digits = re.sub(r"[^\d]", "", aria)
-            if digits:
-                try:
-                    business["review_count"] = int(digits)
-                except ValueError:
-                    pass
-
-        rating_el = await page.query_selector('span[role="img"][aria-label*="stars"]') \
-                    or await page.query_selector('span[aria-hidden="true"]:has-text(".")')
-        if rating_el:
-            aria = await rating_el.get_attribute("aria-label") or (await rating_el.text_content() or "")
-            rating_text = (aria.split(" ")[0] if aria else "").strip()
-            if re.fullmatch(r"\d+(\.\d+)?", rating_text):
-                try:
-                    business["avg_rating"] = float(rating_text)
-                except ValueError:
-                    pass
+async def parse_detail(page, url: str, city: str, service: str, deadline: Optional[Deadline] = None) -> Optional[Business]:
+    business = Business(city=city, service=service)
+    t_place = time.time()
+    sample = TAIL.begin(page, url, city, service)  # step timings; kept only if this page ends up in the tail
+    PAGE_COUNTS["detail_pages"] += 1
+    try:
+        await THROTTLE.acquire()
+        sample.mark("throttle")
+        t_nav = time.time()
+        await _learned_wait("detail_goto", lambda ms: page.goto(url, wait_until="domcontentloaded", timeout=ms),
+                            required=True, deadline=deadline)
+        sample.mark("goto")
+        await check_page_state(page)  # consent / CAPTCHA / blocked -> BlockedPageError, no selector waits
+        sample.mark("state")
+        if deadline is None or not deadline.tight:
+            await _learned_wait("detail_idle", lambda ms: page.wait_for_load_state("networkidle", timeout=ms),
+                                deadline=deadline)
+            sample.mark("idle")
+
+        # Canonical Maps URL after navigation
+        business.maps_url = page.url
+
+        if not await _learned_wait("detail_name", lambda ms: page.wait_for_selector("h1.DUwDvf, h1[role='heading']", timeout=ms),
+                                   deadline=deadline):
+            sample.mark("name")
+            sample.outcome = "timeout"
+            logging.warning(f"[DETAIL] Name selector timeout on {url}")
+            THROTTLE.on_timeout()
+            return None
+        sample.mark("name")
+        THROTTLE.on_success(time.time() - t_nav)
+
+        snap = await page.evaluate(_DETAIL_SNAPSHOT_JS)
+        sample.mark("snapshot")
+        if not snap.get("info_rows") and not snap.get("phone_href") and (deadline is None or not deadline.tight):
+            # Heading is up but the info panel is not: one learned wait for it, then re-read
+            if await _learned_wait("detail_info", lambda ms: page.wait_for_selector(
+                    "button[data-item-id], a[data-item-id], a[href^='tel:']", timeout=ms), deadline=deadline):
+                snap = await page.evaluate(_DETAIL_SNAPSHOT_JS)
+            sample.mark("info")
+        _apply_detail_snapshot(business, snap)
 
         # Global seen: skip exact name+website repeats across this service run (non-brand)
-        if business["name"] and business["website"]:
-            if not is_handyman_tn(business["website"]) and is_globally_seen(business["name"], business["website"]):
-                logging.info(f"[SKIP DUP-GLOBAL] {business['name']} ({business['website']})")
+        if business.name and business.website:
+            if not is_handyman_tn(business.website) and is_globally_seen(business.name, business.website):
+                sample.outcome = "dup"
+                logging.info(f"[SKIP DUP-GLOBAL] {business.name} ({business.website})")
                 return None
 
-        logging.info(f"[SUCCESS] Scraped: {business.get('name','(no name)')}")
+        sample.outcome = "ok"
+        logging.info(f"[SUCCESS] Scraped: {business.name or '(no name)'}")
         return business
+    except BlockedPageError as e:
+        sample.outcome, sample.error = "blocked", str(e)
+        raise
     except Exception as e:
+        sample.outcome, sample.error = ("timeout" if isinstance(e, playwright_api.TimeoutError) else "error"), str(e)
+        if isinstance(e, playwright_api.TimeoutError):
+            THROTTLE.on_timeout()
         logging.error(f"[ERROR] Detail scrape failed for {url}: {e}")
         return None
+    finally:
+        WAIT_TIMEOUTS.observe("detail_total", (time.time() - t_place) * 1000)
+        TAIL.finish(sample)
 
-async def _perform_search_to_list(page, query: str) -> Tuple[List[str], bool]:
+async def _perform_search_to_list(page, query: str, limit: int = TOP_N_RESULTS) -> Tuple[List[str], bool]:
     search_url = f"https://www.google.com/maps/search/{quote(query)}"
-    await page.goto(search_url, wait_until="domcontentloaded", timeout=60000)
+    await THROTTLE.acquire()
+    t_nav = time.time()
     try:
-        await page.wait_for_load_state("networkidle", timeout=AFTER_NAV_NETWORK_IDLE_MS)
-    except PWTimeout:
-        pass
-
-    appeared = await wait_for_any(page, ["a.hfpxzc", "a[role='link'][href*='/place/']"], LIST_TIMEOUT_MS)
+        await _learned_wait("list_goto", lambda ms: page.goto(search_url, wait_until="domcontentloaded", timeout=ms), required=True)
+    except playwright_api.TimeoutError:
+        THROTTLE.on_timeout()
+        raise
+    await check_page_state(page)
+    await _learned_wait("list_idle", lambda ms: page.wait_for_load_state("networkidle", timeout=ms))
+
+    budget = WAIT_TIMEOUTS.timeout_ms("list_cards")
+    t_cards = time.time()
+    appeared = await wait_for_any(page, ["a.hfpxzc", "a[role='link'][href*='/place/']"], budget)
+    WAIT_TIMEOUTS.observe("list_cards", budget if not appeared else (time.time() - t_cards) * 1000, timed_out=not appeared)
     if appeared:
+        THROTTLE.on_success(time.time() - t_nav)
         await scroll_list_with_growth(page)
         cards = await page.query_selector_all("a.hfpxzc, a[role='link'][href*='/place/']")
         detail_urls: List[str] = []
-        for card in cards[:TOP_N_RESULTS]:
+        for card in cards[:limit]:
             href = await card.get_attribute("href")
             if not href:
                 continue
@@ -579,23 +847,161 @@ async def _perform_search_to_list(page, query: str) -> Tuple[List[str], bool]:
 
     return ([], False)
 
-async def scrape_city(context, browser, target_city: str, target_county: str, service: str) -> List[Dict[str, Any]]:
+async def _search_variant(list_context, query: str, limit: int = TOP_N_RESULTS) -> Tuple[List[str], bool, float]:
+    """Run one list query on its own page; errors count as 'no results'. Returns (urls, found_list, seconds)."""
+    t0 = time.time()
+    PAGE_COUNTS["list_queries"] += 1
+    if LIST_HTTP_FETCH:
+        await THROTTLE.acquire()
+        t_http = time.time()
+        places = await asyncio.to_thread(search_places, query, limit)
+        LIST_FETCH_STATS["http_s"] += time.time() - t_http
+        if places:
+            THROTTLE.on_success(time.time() - t_http)
+            LIST_FETCH_STATS["http"] += 1
+            return [p["url"] for p in places], True, time.time() - t0
+        LIST_FETCH_STATS["browser_fallback"] += 1
+        logging.info(f"[LIST] '{query}': HTTP payload not usable, using the browser")
+    page = await list_context.new_page()
+    try:
+        urls, found = await _perform_search_to_list(page, query, limit)
+    except (asyncio.CancelledError, BlockedPageError):
+        raise
+    except Exception as e:
+        logging.warning(f"[LIST] '{query}' failed: {e}")
+        urls, found = [], False
+    finally:
+        try:
+            await page.close()
+        except Exception:
+            pass
+    return urls, found, time.time() - t0
+
+async def _hedged_search_to_list(list_context, service: str, city: str) -> Tuple[List[str], bool]:
+    """
+    "{service} in {city}, TN" first; if it has produced nothing after LIST_HEDGE_DELAY_MS,
+    race "{service} near {city}, TN" on a second page. The first variant to return cards
+    wins and the other is cancelled. Records the winner and the latency saved vs serial.
+    """
+    variants = {"in": f"{service} in {city}, TN", "near": f"{service} near {city}, TN"}
+    t0 = time.time()
+    stat: Dict[str, Any] = {"city": city, "service": service, "winner": None, "hedged": False, "saved_s": 0.0}
+    tasks: Dict[str, asyncio.Task] = {"in": asyncio.create_task(_search_variant(list_context, variants["in"]))}
+    started: Dict[str, float] = {"in": t0}
+    finished: Dict[str, float] = {}
+    delay_s = LIST_HEDGE_DELAY_MS / 1000.0
+    winner: Optional[Tuple[List[str], bool]] = None
+
+    try:
+        while tasks and winner is None:
+            if "near" not in started:
+                # Serial mode waits for "in"; hedged mode waits at most the hedge delay
+                timeout = None if LIST_HEDGE_DELAY_MS < 0 else max(0.0, delay_s - (time.time() - t0))
+                done, _ = await asyncio.wait(set(tasks.values()), timeout=timeout)
+            else:
+                done, _ = await asyncio.wait(set(tasks.values()), return_when=asyncio.FIRST_COMPLETED)
+
+            for name, task in list(tasks.items()):
+                if task not in done:
+                    continue
+                urls, found, secs = task.result()
+                finished[name] = secs
+                del tasks[name]
+                if urls and winner is None:
+                    winner = (urls, found)
+                    stat["winner"] = name
+
+            if winner is None and "near" not in started:
+                if not done:
+                    stat["hedged"] = True
+                    logging.info(f"[HEDGE] No cards after {delay_s:.1f}s for {city} — racing near-query")
+                else:
+                    logging.info(f"[RETRY] Switching to near-query for {city}")
+                started["near"] = time.time()
+                tasks["near"] = asyncio.create_task(_search_variant(list_context, variants["near"]))
+    finally:
+        for task in tasks.values():
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    elapsed = time.time() - t0
+    if "near" in finished:
+        # Serial = full "in" (a cancelled "in" ran at least `elapsed`) followed by "near"
+        in_secs = finished.get("in", elapsed)
+        stat["saved_s"] = round(max(0.0, in_secs + finished["near"] - elapsed), 2)
+    stat["elapsed_s"] = round(elapsed, 2)
+    LIST_STATS.append(stat)
+    if stat["hedged"]:
+        logging.info(f"[HEDGE] {city} / {service}: winner={stat['winner'] or 'none'} "
+                     f"saved~{stat['saved_s']:.1f}s (list {elapsed:.1f}s)")
+    return winner if winner is not None else ([], False)
+
+async def _parse_details(context, detail_urls: List[str], city: str, service: str,
+                         deadline: Optional[Deadline] = None) -> List[Optional[Business]]:
+    """
+    parse_detail for every URL, up to GOVERNOR.slots pages at a time (pages are reused across URLs).
+    Results keep list order. Once the deadline is too close, URLs not yet started are left as None
+    and deadline.hit is set. A BlockedPageError cancels the remaining pages and propagates.
+    Places this service's metro pass already parsed (METRO_PLACES) are copied instead of opened.
+    """
+    results: List[Optional[Business]] = [None] * len(detail_urls)
+    idle_pages: List[Any] = []
+    started = 0
+
+    async def _one(idx: int, url: str) -> None:
+        nonlocal started
+        known = METRO_PLACES.get(place_id_from_url(url))
+        if known is not None:
+            results[idx] = replace(known, city=city)  # already opened by this service's metro pass
+            PAGE_COUNTS["reused"] += 1
+            return
+        async with GOVERNOR.slot():
+            if deadline is not None and deadline.remaining_s < DEADLINE_MIN_DETAIL_S:
+                if not deadline.hit:
+                    deadline.hit = True
+                    logging.warning(f"[DEADLINE] {city} / {service}: stopping after {started}/{len(detail_urls)} "
+                                    f"detail pages ({deadline.remaining_s:.0f}s left)")
+                return
+            started += 1
+            page = idle_pages.pop() if idle_pages else await context.new_page()
+            try:
+                results[idx] = await parse_detail(page, url, city, service, deadline)
+            finally:
+                idle_pages.append(page)
+
+    tasks = [asyncio.create_task(_one(i, url)) for i, url in enumerate(detail_urls)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for page in idle_pages:
+            try:
+                await page.close()
+            except Exception:
+                pass
+    return results
+
+async def scrape_city(context, browser, target_city: str, target_county: str, service: str,
+                      deadline: Optional[Deadline] = None) -> List[Business]:
+    """
+    Scrape one city/service. With a deadline, waits shrink as it approaches and the detail loop
+    stops early (deadline.hit = True); whatever was parsed is still returned.
+    If the ordered list matches the cached fingerprint, the cached rows are returned without
+    opening any detail page and the scope is recorded in UNCHANGED_SCOPES.
+    """
+    global UNCHANGED_PAGES_SKIPPED
     t0 = time.time()
     logging.info(f"[START] {service} in {target_city}, TN")
 
-    list_context = await browser.new_context()
+    list_context = await new_context(browser)
     await block_requests_for_list(list_context)
-    list_page = await list_context.new_page()
 
-    results: List[Dict[str, Any]] = []
+    results: List[Business] = []
     try:
-        base_query = f"{service} in {target_city}, TN"
-        detail_urls, found_list = await _perform_search_to_list(list_page, base_query)
-
-        if not detail_urls:
-            near_query = f"{service} near {target_city}, TN"
-            logging.info(f"[RETRY] Switching to near-query for {target_city}")
-            detail_urls, found_list = await _perform_search_to_list(list_page, near_query)
+        detail_urls, found_list = await _hedged_search_to_list(list_context, service, target_city)
 
         if not detail_urls:
             logging.warning(f"[LIST] No results within timeout for {target_city} — skipping city")
@@ -604,39 +1010,55 @@ async def scrape_city(context, browser, target_city: str, target_county: str, se
 
         await list_context.close()
 
-        detail_page = await context.new_page()
+        list_fp = fingerprint(detail_urls)
+        cached = LIST_CACHE.lookup((target_city, service), list_fp)
+        if cached:
+            results = [Business.from_row(r) for r in cached]
+            add_to_global_seen(results)
+            UNCHANGED_SCOPES.setdefault(target_city, set()).add(service)
+            UNCHANGED_PAGES_SKIPPED += len(detail_urls)
+            logging.info(f"[UNCHANGED] {target_city} / {service}: same {len(detail_urls)} places as last run — "
+                         f"{len(results)} cached rows, detail pages skipped | {time.time() - t0:.1f}s")
+            return results
 
         if not found_list and len(detail_urls) == 1:
-            biz = await parse_detail(detail_page, detail_urls[0], target_city, service)
-            if biz and (biz.get("name") or biz.get("website")):
-                name = biz.get("name", "")
-                website = biz.get("website", "")
+            detail_page = await context.new_page()
+            biz = await parse_detail(detail_page, detail_urls[0], target_city, service, deadline)
+            if biz and (biz.name or biz.website):
+                name = biz.name
+                website = biz.website
                 if name and website and not (not is_handyman_tn(website) and is_globally_seen(name, website)):
                     results.append(biz)
             await detail_page.close()
         else:
-            for url in detail_urls:
-                biz = await parse_detail(detail_page, url, target_city, service)
-                if biz and (biz.get("name") or biz.get("website")):
-                    name = biz.get("name", "")
-                    website = biz.get("website", "")
+            for biz in await _parse_details(context, detail_urls, target_city, service, deadline):
+                if biz and (biz.name or biz.website):
+                    name = biz.name
+                    website = biz.website
                     if name and website and not is_handyman_tn(website) and is_globally_seen(name, website):
                         logging.info(f"[SKIP DUP-GLOBAL] {name} ({website})")
                     else:
                         results.append(biz)
-                await asyncio.sleep(0.25)
-            await detail_page.close()
 
         # PIN (if enabled) -> local de-dupe -> promote our brand -> global seen
         results = ensure_pinned_top(results, target_city, service)
         results = deduplicate_local(results)
         results = promote_handyman_tn(results)
         add_to_global_seen(results)
+        if results and not (deadline is not None and deadline.hit):
+            LIST_CACHE.store((target_city, service), list_fp, [b.to_export() for b in results])
 
         t1 = time.time()
-        logging.info(f"[DONE] {target_city}: {len(results)} kept | {t1 - t0:.1f}s total")
+        partial = " | PARTIAL (deadline)" if deadline is not None and deadline.hit else ""
+        logging.info(f"[DONE] {target_city}: {len(results)} kept | {t1 - t0:.1f}s total | {THROTTLE.rate:.2f} req/s{partial}")
         return results
 
+    except BlockedPageError:
+        try:
+            await list_context.close()
+        except Exception:
+            pass
+        raise
     except Exception as e:
         logging.error(f"[CITY ERROR] {target_city}: {e}")
         try:
@@ -645,106 +1067,771 @@ async def scrape_city(context, browser, target_city: str, target_county: str, se
             pass
         return results
 
-async def scrape_and_collect_for_target(browser, target_city: str, target_county: str, service: str) -> List[Dict[str, Any]]:
+async def scrape_and_collect_for_target(browser, target_city: str, target_county: str, service: str) -> List[Business]:
     city_slug = target_city.lower().replace(" ", "_")
     service_slug = service.lower().replace(" ", "_")
-    deep_path = EXPORT_DIR / f"{city_slug}_{service_slug}_deep.json"
-    flat_path = EXPORT_DIR / f"{city_slug}_{service_slug}_flat.json"
+    partial_path = EXPORT_DIR / f"{city_slug}_{service_slug}_partial.json"
+    deadline = Deadline(CITY_WATCHDOG_SECONDS, tight_s=DEADLINE_TIGHT_S)
+    t_start = time.time()
+    navigations_before = THROTTLE.stats["requests"]
 
     async def _run_city():
-        context = await browser.new_context()
+        context = await new_context(browser)
+        await TAIL.start_trace(context)
         try:
-            businesses = await scrape_city(context, browser, target_city, target_county, service)
+            businesses = await scrape_city(context, browser, target_city, target_county, service, deadline)
         finally:
+            await TAIL.stop_trace(context, target_city, service)
             await context.close()
         return businesses
 
     try:
-        businesses = await asyncio.wait_for(_run_city(), timeout=CITY_WATCHDOG_SECONDS)
+        businesses = await asyncio.wait_for(_run_city(), timeout=CITY_WATCHDOG_SECONDS + CITY_WATCHDOG_GRACE_S)
     except asyncio.TimeoutError:
-        logging.warning(f"[WATCHDOG] City timed out after {CITY_WATCHDOG_SECONDS}s — {target_city} skipped")
+        logging.warning(f"[WATCHDOG] City hung past its deadline ({CITY_WATCHDOG_SECONDS + CITY_WATCHDOG_GRACE_S}s) "
+                        f"— {target_city} / {service} kept as partial with no new rows")
+        deadline.hit = True
+        businesses = []
+    except BlockedPageError as e:
+        logging.warning(f"[BLOCKED] {target_city} / {service}: {e} — city short-circuited")
+        BLOCK_BACKOFF.record_block(e.state)
+        THROTTLE.on_block()
+        # Streaming uploads skip blocked cities; the marker keeps --merge-shards from replacing this scope
+        _write_partial_marker(partial_path, target_city, service, 0, "blocked")
         return []
+    BLOCK_BACKOFF.record_ok()
+    DURATIONS.record((target_city, service), time.time() - t_start)
+    REFRESH.record_scrape((target_city, service), THROTTLE.stats["requests"] - navigations_before)
+    return _save_scope(target_city, service, businesses, partial=deadline.hit)
 
-    if businesses:
-        with open(deep_path, "w", encoding="utf-8") as f:
-            json.dump(businesses, f, ensure_ascii=False, indent=2)
-        logging.info(f"[SAVE] {len(businesses)} deep records -> {deep_path}")
+def _save_scope(target_city: str, service: str, businesses: List[Business], partial: bool) -> List[Business]:
+    """Partial / unchanged markers, export store, rank history and flat export of one finished scope; returns its rows."""
+    city_slug = target_city.lower().replace(" ", "_")
+    service_slug = service.lower().replace(" ", "_")
+    flat_path = EXPORT_DIR / f"{city_slug}_{service_slug}_flat.json"
+    partial_path = EXPORT_DIR / f"{city_slug}_{service_slug}_partial.json"
+    unchanged_path = EXPORT_DIR / f"{city_slug}_{service_slug}_unchanged.json"
+
+    # Same list as last run: --merge-shards skips a city whose every scope carries this marker
+    if not partial and service in UNCHANGED_SCOPES.get(target_city, ()):
+        with open(unchanged_path, "w", encoding="utf-8") as f:
+            json.dump({"city": target_city, "service": service, "rows": len(businesses)}, f)
+    elif unchanged_path.exists():
+        unchanged_path.unlink()
+
+    # Partial scopes are merged with the stored rows at upload time instead of replacing them
+    if partial:
+        PARTIAL_SCOPES.setdefault(target_city, set()).add(service)
+        _write_partial_marker(partial_path, target_city, service, len(businesses), "deadline")
+    elif partial_path.exists():
+        partial_path.unlink()
 
-        with open(flat_path, "w", encoding="utf-8") as f:
-            json.dump(businesses, f, ensure_ascii=False, indent=2)
-        logging.info(f"[SAVE] {len(businesses)} flat records -> {flat_path}")
+    if businesses:
+        export_rows = [b.to_export() for b in businesses]
+        digest, changed = EXPORT_STORE.put_scope(target_city, service, export_rows)
+        if not partial:
+            # Complete scopes only: a cut-short list would read as businesses dropping out
+            try:
+                HISTORY.append(target_city, service, businesses)
+            except (OSError, ValueError) as e:
+                logging.warning(f"[HISTORY] {target_city} / {service}: not recorded: {e}")
+        if changed or not flat_path.exists():
+            with open(flat_path, "w", encoding="utf-8") as f:
+                json.dump(export_rows, f, ensure_ascii=False, indent=2)
+            logging.info(f"[SAVE] {len(businesses)} flat records -> {flat_path} (blob {digest[:12]})")
+        else:
+            logging.info(f"[SAVE] {len(businesses)} records unchanged since the last export -> {flat_path} kept")
         return businesses
 
     logging.warning(f"[SKIP] No results to save for {target_city}")
     return []
 
-async def collect_all_rows(only_city: Optional[str]) -> List[Dict[str, Any]]:
+async def consolidate_metro(browser, metro: str, targets: List[str], service: str,
+                            max_budget_s: Optional[float] = None) -> Dict[str, List[Business]]:
+    """
+    One wide "{service} near {metro}, TN" list for all of the metro's targets: each candidate's detail page
+    is opened once (or the cached candidates are reused when the wide list is unchanged), then assigned to
+    targets by the locality of its address. Returns the targets filled to METRO_MIN_FILL, rows final
+    (pinned / deduped / promoted, marked globally seen); the others run their per-city query, which reuses
+    the pages parsed here. A block or timeout returns {} so every target falls back.
+    """
+    scope = (f"metro {metro}", service)  # list cache entry of the wide search
+    limit = min(METRO_LIST_LIMIT, TOP_N_RESULTS * len(targets))  # never more pages than the per-city plan
+    budget_s = CITY_WATCHDOG_SECONDS * max(1, limit // TOP_N_RESULTS)
+    if max_budget_s is not None:
+        budget_s = min(budget_s, max_budget_s)
+    deadline = Deadline(budget_s, tight_s=DEADLINE_TIGHT_S)
+    t0 = time.time()
+
+    async def _run() -> Optional[List[Business]]:
+        list_context = await new_context(browser)
+        await block_requests_for_list(list_context)
+        try:
+            urls, _, _ = await _search_variant(list_context, f"{service} near {metro}, TN", limit=limit)
+        finally:
+            await list_context.close()
+        if not urls:
+            return None
+        list_fp = fingerprint(urls)
+        cached = LIST_CACHE.lookup(scope, list_fp)
+        if cached:
+            candidates = [Business.from_row(r) for r in cached]
+            for row, biz in zip(cached, candidates):
+                METRO_PLACES[row["place_id"]] = biz
+            return candidates
+        context = await new_context(browser)
+        try:
+            parsed = await _parse_details(context, urls, metro, service, deadline)
+        finally:
+            await context.close()
+        candidates, cache_rows = [], []
+        for url, biz in zip(urls, parsed):
+            if biz is not None and (biz.name or biz.website):
+                METRO_PLACES[place_id_from_url(url)] = biz
+                candidates.append(biz)
+                cache_rows.append({**biz.to_export(), "place_id": place_id_from_url(url)})
+        if not deadline.hit:
+            LIST_CACHE.store(scope, list_fp, cache_rows)
+        return candidates
+
+    try:
+        candidates = await asyncio.wait_for(_run(), timeout=budget_s + CITY_WATCHDOG_GRACE_S)
+    except asyncio.TimeoutError:
+        logging.warning(f"[METRO] {metro} / {service}: wide search hung — per-city queries for every target")
+        return {}
+    except BlockedPageError as e:
+        logging.warning(f"[BLOCKED] {metro} / {service} (metro search): {e} — per-city queries for every target")
+        BLOCK_BACKOFF.record_block(e.state)
+        THROTTLE.on_block()
+        return {}
+    if not candidates or deadline.hit:
+        logging.warning(f"[METRO] {metro} / {service}: wide search {'cut short' if candidates else 'empty'} — "
+                        f"per-city queries for every target")
+        return {}
+
+    filled: Dict[str, List[Business]] = {}
+    for target, rows in assign_to_targets(candidates, targets, TOP_N_RESULTS).items():
+        if len(rows) >= METRO_MIN_FILL:
+            rows = ensure_pinned_top(rows, target, service)
+            rows = deduplicate_local(rows)
+            filled[target] = promote_handyman_tn(rows)
+            add_to_global_seen(filled[target])  # per-city fallbacks of this metro must not list them again
+    logging.info(f"[METRO] {metro} / {service}: {len(candidates)} places from one wide search -> "
+                 f"{len(filled)}/{len(targets)} targets filled (>= {METRO_MIN_FILL}) | {time.time() - t0:.1f}s")
+    return filled
+
+def _save_metro_scope(target_city: str, service: str, rows: List[Business]) -> List[Business]:
+    """A target filled by its metro's wide search: saved like a per-city scrape, no list query of its own."""
+    # Scraped tonight; the per-city page estimate is left as it was (the metro report compares against it)
+    REFRESH.record_scrape((target_city, service), round(REFRESH.pages((target_city, service))))
+    logging.info(f"[METRO] {target_city} / {service}: {len(rows)} kept from the metro search")
+    return _save_scope(target_city, service, rows, partial=False)
+
+def _metro_baseline(targets: List[str], service: str) -> Dict[str, float]:
+    """Navigation counters now + the per-city plan's detail pages for the targets (refresh history estimate)."""
+    per_city_pages = sum(max(0.0, min(float(TOP_N_RESULTS), REFRESH.pages((t, service)) - 1)) for t in targets)
+    return {**PAGE_COUNTS, "per_city_pages": per_city_pages}
+
+def _record_metro_stats(metro: str, service: str, targets: List[str], filled: int, before: Dict[str, float]) -> None:
+    """What the metro's targets cost tonight (metro pass + fallbacks) vs their per-city plan."""
+    counts = {
+        "scopes": len(targets),
+        "filled": filled,
+        "fallback": len(targets) - filled,
+        "list_queries": PAGE_COUNTS["list_queries"] - before["list_queries"],
+        "list_queries_per_city": len(targets),
+        "detail_pages": PAGE_COUNTS["detail_pages"] - before["detail_pages"],
+        "detail_pages_per_city": before["per_city_pages"],
+        "reused": PAGE_COUNTS["reused"] - before["reused"],
+    }
+    METRO_STATS.add(metro, **counts)
+    logging.info(f"[METRO] {metro} / {service}: {MetroStats.format_row(counts)}")
+
+def _write_partial_marker(path: Path, city: str, service: str, rows: int, reason: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"city": city, "service": service, "rows": rows, "reason": reason}, f)
+
+def _planned_cities(only_city: Optional[str]) -> List[str]:
+    return [t["name"] for m in city_config() for t in [{"name": m["city"]}] + m.get("targets", [])
+            if not only_city or t["name"].lower() == only_city.lower()]
+
+def plan_shard(only_city: Optional[str], shard: Tuple[int, int]) -> List[Job]:
+    """This shard's (city, service) jobs; every shard derives the same split from the same plan + history."""
     services = get_services()
-    logging.info(f"[RUN] Services: {services}")
+    jobs = list(dict.fromkeys((city, service) for service in services for city in _planned_cities(only_city)))
+    weights = DURATIONS.weights(jobs)
+    shards = assign_shards(jobs, shard[1], weights)
+    for idx, part in shards.items():
+        logging.info(f"[SHARD] {idx}/{shard[1]}: {len(part)} jobs, ~{sum(weights[j] for j in part):.0f}s")
+    return shards[shard[0]]
+
+def plan_refresh(services: List[str], page_budget: int) -> Set[Job]:
+    """
+    Tonight's scopes under the page budget, chosen over the whole plan (not just --only-city)
+    so every per-city process of the night works from the same selection.
+    """
+    jobs = list(dict.fromkeys((city, service) for service in services for city in _planned_cities(None)))
+    selected, report, fresh = REFRESH.nightly_plan(jobs, page_budget)
+    line = format_refresh_report(report)
+    logging.info(f"[REFRESH] budget {page_budget} pages: {line}" + ("" if fresh else " (plan reused)"))
+    if fresh:
+        REFRESH.save()
+        _append_summary_line(f"- Refresh plan: {line}")
+    return set(selected)
+
+def _defer_scope(city: str, service: str) -> None:
+    """Not refreshed tonight: keep its stored rows (merge) and tell --merge-shards to do the same."""
+    DEFERRED_SCOPES.setdefault(city, set()).add(service)
+    city_slug = city.lower().replace(" ", "_")
+    service_slug = service.lower().replace(" ", "_")
+    _write_partial_marker(EXPORT_DIR / f"{city_slug}_{service_slug}_partial.json", city, service, 0, "deferred")
 
-    all_rows: List[Dict[str, Any]] = []
-    async with async_playwright() as p:
+async def collect_all_rows(only_city: Optional[str], on_city_done=None,
+                           shard: Optional[Tuple[int, int]] = None, page_budget: int = 0,
+                           metro_consolidate: bool = METRO_CONSOLIDATE) -> List[Business]:
+    """
+    Scrape every (service, target) pair. If on_city_done is given, it is awaited with
+    (city, rows) as soon as a city's last service has been scraped, so uploads can
+    start while the remaining cities are still being scraped.
+    With shard=(i, N), only this shard's jobs are scraped (see plan_shard); with a page budget,
+    only the scopes plan_refresh picked (the rest are deferred and merged at upload).
+    With metro_consolidate, each metro's targets share one wide search per service (consolidate_metro);
+    an --only-city run keeps only its own city from that search.
+    """
+    services = get_services()
+    logging.info(f"[RUN] Services: {services}")
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+
+    # A city is complete at its last occurrence in the final service pass
+    planned = _planned_cities(only_city)
+    last_visit = {name: idx for idx, name in enumerate(planned)}
+    city_rows: Dict[str, List[Business]] = {}
+    blocked_cities: Set[str] = set()  # at least one service hit a block page -> never replace the city
+    scraped_cities: Set[str] = set()  # at least one service actually scraped (not all deferred)
+    changed_cities: Set[str] = set()  # at least one scraped service not short-circuited as unchanged
+    unchanged_cities: Set[str] = set()
+
+    all_rows: List[Business] = []
+    THROTTLE.load()
+    WAIT_TIMEOUTS.load()
+    DURATIONS.load()
+    REFRESH.load()
+    shard_jobs = set(plan_shard(only_city, shard)) if shard else None
+    refresh_jobs = plan_refresh(services, page_budget) if page_budget > 0 else None
+    async with playwright_api.async_playwright() as p:
         browser = await p.chromium.launch(headless=True)
+        GOVERNOR.start()
         try:
-            for service in services:
+            for service_idx, service in enumerate(services):
                 GLOBAL_SEEN.clear()
+                METRO_PLACES.clear()
                 logging.info(f"[SERVICE] === {service} ===")
-                for metro in CITY_CONFIG:
+                visit = -1
+                for metro in city_config():
                     targets = [{"name": metro["city"], "county": metro["county"]}] + metro.get("targets", [])
                     if only_city and not any(t["name"].lower() == only_city.lower() for t in targets):
                         continue
+                    metro_rows: Dict[str, List[Business]] = {}
+                    metro_before: Optional[Dict[str, float]] = None
+                    eligible: List[str] = []
+                    counted: List[str] = []  # targets this run saves (the metro report's scopes)
+                    metro_filled = 0
+                    if metro_consolidate and not BLOCK_BACKOFF.should_abort:
+                        eligible = [t["name"] for t in targets
+                                    if (shard_jobs is None or (t["name"], service) in shard_jobs)
+                                    and (refresh_jobs is None or (t["name"], service) in refresh_jobs)]
+                        counted = eligible
+                        if only_city:
+                            # Per-city runs (the nightly job): the wide search still covers every member, so it
+                            # and its list cache entry are the same in each member's run. The first run opens
+                            # the detail pages; the next ones find the candidates cached. Only this city is saved.
+                            counted = [t for t in eligible if t.lower() == only_city.lower()]
+                            eligible = [t["name"] for t in targets] if counted else []
+                        if len(eligible) > 1:
+                            metro_before = _metro_baseline(counted, service)
+                            await BLOCK_BACKOFF.wait()
+                            metro_rows = await consolidate_metro(
+                                browser, metro["city"], eligible, service,
+                                max_budget_s=METRO_ONLY_CITY_BUDGET_S if only_city else None,
+                            )
+                            metro_rows = {t: r for t, r in metro_rows.items() if t in counted}
+                            metro_filled = len(metro_rows)
                     for target in targets:
                         if only_city and target["name"].lower() != only_city.lower():
                             continue
-                        rows = await scrape_and_collect_for_target(
-                            browser=browser,
-                            target_city=target["name"],
-                            target_county=target["county"],
-                            service=service,
-                        )
-                        all_rows.extend(rows)
-                        await asyncio.sleep(BETWEEN_CITIES_DELAY_S)
+                        visit += 1
+                        if shard_jobs is not None and (target["name"], service) not in shard_jobs:
+                            continue
+                        if refresh_jobs is not None and (target["name"], service) not in refresh_jobs:
+                            _defer_scope(target["name"], service)
+                            rows = []
+                        elif BLOCK_BACKOFF.should_abort:
+                            # Keep going through the plan only to skip it; never upload a half-scraped city
+                            continue
+                        else:
+                            await BLOCK_BACKOFF.wait()
+                            if GOVERNOR.should_restart_browser:
+                                # Between scopes nothing is in flight: swap the browser, carry on with the plan
+                                logging.warning(f"[GOVERNOR] browser at {GOVERNOR.browser_mb:.0f} MB "
+                                                f"(> {GOVERNOR.restart_browser_mb:.0f} MB) — restarting it")
+                                await browser.close()
+                                browser = await p.chromium.launch(headless=True)
+                                GOVERNOR.note_restart()
+                            blocks_before = BLOCK_BACKOFF.total
+                            if target["name"] in metro_rows:
+                                rows = _save_metro_scope(target["name"], service, metro_rows.pop(target["name"]))
+                            else:
+                                rows = await scrape_and_collect_for_target(
+                                    browser=browser,
+                                    target_city=target["name"],
+                                    target_county=target["county"],
+                                    service=service,
+                                )
+                            all_rows.extend(rows)
+                            scraped_cities.add(target["name"])
+                            if service in UNCHANGED_SCOPES.get(target["name"], ()):
+                                REFRESH.record_change((target["name"], service), rows, rows)  # a zero-churn observation
+                            else:
+                                changed_cities.add(target["name"])
+                            if BLOCK_BACKOFF.total != blocks_before:
+                                blocked_cities.add(target["name"])
+                        if on_city_done is not None:
+                            city_rows.setdefault(target["name"], []).extend(rows)
+                            if service_idx == len(services) - 1 and last_visit[target["name"]] == visit:
+                                done_rows = city_rows.pop(target["name"])
+                                if target["name"] in blocked_cities:
+                                    logging.warning(f"[BLOCKED] {target['name']}: incomplete after block pages — upload skipped")
+                                elif target["name"] not in scraped_cities:
+                                    logging.info(f"[REFRESH] {target['name']}: every service deferred tonight — nothing to upload")
+                                elif target["name"] not in changed_cities:
+                                    unchanged_cities.add(target["name"])
+                                    logging.info(f"[UNCHANGED] {target['name']}: every scraped service matched its list "
+                                                 f"fingerprint — DB write skipped")
+                                else:
+                                    await on_city_done(target["name"], done_rows)
+                    if metro_before is not None:
+                        _record_metro_stats(metro["city"], service, counted, metro_filled, metro_before)
         finally:
+            await GOVERNOR.stop()
             await browser.close()
+            THROTTLE.save()
+            WAIT_TIMEOUTS.save()
+            DURATIONS.save()
+            REFRESH.save()
+    logging.info(f"[THROTTLE] {THROTTLE.describe()}")
+    _append_summary_line(f"- Throttle: {THROTTLE.describe()}")
+    _log_wait_stats()
+    _log_list_stats()
+    _log_metro_stats()
+    logging.info(f"[GOVERNOR] {GOVERNOR.summary()}")
+    _append_summary_line(f"- Resources: {GOVERNOR.summary()}")
+    index = TAIL.write_index()
+    if index is not None:
+        logging.info(f"[TAIL] {TAIL.describe()} | index -> {index}")
+        _append_summary_line(f"- Detail page tail: {TAIL.describe()}")
+    if TRAFFIC is not None:
+        logging.info(f"[{TRAFFIC.mode.upper()}] {TRAFFIC.describe()}")
+        _append_summary_line(f"- Traffic {TRAFFIC.mode}: {TRAFFIC.describe()}")
+    if UNCHANGED_SCOPES:
+        count = sum(len(svcs) for svcs in UNCHANGED_SCOPES.values())
+        line = (f"unchanged scopes: {count} (detail pages skipped: {UNCHANGED_PAGES_SKIPPED}"
+                + (f", city writes skipped: {len(unchanged_cities)}" if on_city_done is not None else "") + ")")
+        logging.info(f"[UNCHANGED] {line}")
+        _append_summary_line(f"- List fingerprint {line}")
+    if PARTIAL_SCOPES:
+        scopes = ", ".join(f"{c}/{s}" for c, svcs in sorted(PARTIAL_SCOPES.items()) for s in sorted(svcs))
+        logging.warning(f"[DEADLINE] partial scopes (merged, not replaced): {scopes}")
+        _append_summary_line(f"- Partial scopes (deadline): {scopes}")
+    if BLOCK_BACKOFF.total:
+        line = f"blocked pages: {BLOCK_BACKOFF.total} {BLOCK_BACKOFF.by_state}"
+        if BLOCK_BACKOFF.should_abort:
+            line += f" | run stopped after {BLOCK_BACKOFF.consecutive} consecutive blocks"
+        logging.warning(f"[BACKOFF] {line}")
+        _append_summary_line(f"- Google {line}")
     return all_rows
 
-def run_with_upload_logic(all_rows: List[Dict[str, Any]], only_city: str):
+def _log_wait_stats() -> None:
+    """Per-place tail time and the learned waits that shape it, vs the history loaded at start."""
+    for step in ["detail_total", *WAIT_BUDGETS]:
+        line = WAIT_TIMEOUTS.report(step)
+        if not line:
+            continue
+        if step in WAIT_BUDGETS:
+            line += f" | next budget {WAIT_TIMEOUTS.timeout_ms(step)}ms"
+        logging.info(f"[TIMEOUTS] {line}")
+        if step == "detail_total":
+            _append_summary_line(f"- Time per place {line.split(': ', 1)[1]}")
+
+def _log_list_stats() -> None:
+    """Per-run roll-up of the hedged list searches (which variant won, time saved)."""
+    if not LIST_STATS:
+        return
+    wins = {"in": 0, "near": 0, None: 0}
+    for st in LIST_STATS:
+        wins[st["winner"]] = wins.get(st["winner"], 0) + 1
+    hedged = sum(1 for st in LIST_STATS if st["hedged"])
+    saved = sum(st["saved_s"] for st in LIST_STATS)
+    line = (f"list searches: {len(LIST_STATS)} | in={wins['in']} near={wins['near']} empty={wins[None]} "
+            f"| hedged={hedged} | saved~{saved:.1f}s vs serial")
+    logging.info(f"[HEDGE] {line}")
+    _append_summary_line(f"- Hedged {line}")
+    if LIST_HTTP_FETCH:
+        tried = LIST_FETCH_STATS["http"] + LIST_FETCH_STATS["browser_fallback"]
+        avg = LIST_FETCH_STATS["http_s"] / tried if tried else 0.0
+        line = (f"HTTP list fetch: {LIST_FETCH_STATS['http']}/{tried} served without a browser page "
+                f"(avg {avg:.2f}s per attempt), {LIST_FETCH_STATS['browser_fallback']} fell back")
+        logging.info(f"[LIST] {line}")
+        _append_summary_line(f"- {line}")
+
+def _log_metro_stats() -> None:
+    """Per-metro roll-up of the consolidated searches vs the per-city plan."""
+    total = METRO_STATS.total()
+    if total is None:
+        return
+    for metro, row in METRO_STATS.metros.items():
+        logging.info(f"[METRO] {metro}: {MetroStats.format_row(row)}")
+    line = f"{len(METRO_STATS.metros)} metros: {MetroStats.format_row(total)}"
+    logging.info(f"[METRO] {line}")
+    _append_summary_line(f"- Metro consolidation, {line}")
+    for metro, row in METRO_STATS.metros.items():
+        _append_summary_line(f"  - {metro}: {MetroStats.format_row(row)}")
+
+def merge_partial_services(city: str, rows: List[Business], partial_services: Iterable[str]) -> Optional[List[Business]]:
+    """
+    For services whose scrape was cut short, carry over the stored rows that were not re-scraped,
+    so replacing the city only adds/refreshes them. Returns None if the stored rows can't be read.
+    """
+    fresh_keys = {r.business_key for r in rows}
+    merged = list(rows)
+    for service in sorted(partial_services):
+        try:
+            stored = iter_rows(
+                SUPABASE_URL, SUPABASE_TABLE, _sb_headers(),
+                filters={"city": f"eq.{city}", "service": f"eq.{service}"},
+                columns=PAYLOAD_FIELDS,
+                session=_http_session(),
+            )
+            kept = [b for b in (Business.from_row(r) for r in stored) if b.business_key not in fresh_keys]
+        except (requests.RequestException, ValueError) as e:
+            logging.error(f"[MERGE] {city} / {service}: could not read stored rows: {e}")
+            return None
+        merged.extend(kept)
+        logging.info(f"[MERGE] {city} / {service}: partial scrape, kept {len(kept)} stored rows")
+    return merged
+
+def _stored_city_rows(city: str) -> Optional[List[Dict[str, Any]]]:
+    """Current rows of one city in id (= upload, i.e. rank) order; None if they can't be read."""
+    try:
+        return list(iter_rows(
+            SUPABASE_URL, SUPABASE_TABLE, _sb_headers(),
+            filters={"city": f"eq.{city}"},
+            columns=PAYLOAD_FIELDS,
+            session=_http_session(),
+        ))
+    except (requests.RequestException, ValueError) as e:
+        logging.warning(f"[CHURN] {city}: stored rows unreadable, churn not recorded: {e}")
+        return None
+
+def _record_city_churn(city: str, stored: Optional[Iterable[Dict[str, Any]]], fresh: List[Business],
+                       skip_services: Set[str]) -> None:
+    """Fold fresh-vs-replaced differences of every fully scraped service into the refresh history."""
+    if stored is None:
+        return
+    old_by_service: Dict[str, List[Business]] = {}
+    for r in stored:
+        b = Business.from_row(r)
+        old_by_service.setdefault(b.service, []).append(b)
+    new_by_service: Dict[str, List[Business]] = {}
+    for b in fresh:
+        new_by_service.setdefault(b.service, []).append(b)
+    scores = []
+    for service, rows in new_by_service.items():
+        if service in skip_services or service in UNCHANGED_SCOPES.get(city, ()):
+            continue  # incomplete, or already recorded as a zero-churn observation
+        change = REFRESH.record_change((city, service), old_by_service.get(service, []), rows)
+        scores.append(f"{service}={change['score']:.2f}")
+    if scores:
+        logging.info(f"[CHURN] {city}: {', '.join(scores)}")
+
+def _publish_listings(city: str, rows: List[Business]) -> None:
+    """After a successful city replace: refresh the site's per-scope listing documents (best effort)."""
+    if publish_city(SUPABASE_URL, _sb_headers(), city, group_by_service(rows), session=_http_session()) is None:
+        logging.warning(f"[LISTINGS] {city}: listing snapshots not updated — the site reads businesses directly")
+
+def run_with_upload_logic(all_rows: List[Business], only_city: str, partial_services: Iterable[str] = ()) -> bool:
     """
-    Encapsulates per-city snapshot -> delete -> upload, with auto-restore on failure.
+    Replace one city's rows. Uses the server-side RPC when enabled (CITY_REPLACE_MODE);
+    otherwise per-city snapshot -> delete -> upload, with auto-restore on failure.
+    Services in partial_services (deadline hit / deferred) are merged with their stored rows, not replaced.
+    On success, fresh vs replaced rows feed the churn history (see refresh.py; the RPC path only reads
+    the replaced rows when the refresh scheduler is on, REFRESH_CHURN) and the city's
+    listing snapshots for the site build are refreshed (see scope_listings.py).
+    Returns True when the city was replaced with the new rows.
     """
+    partial_services = set(partial_services)
+    scraped = list(all_rows)
+    if partial_services:
+        merged = merge_partial_services(only_city, all_rows, partial_services)
+        if merged is None:
+            logging.error(f"[ABORT] {only_city}: partial scrape and stored rows unreadable — not replacing.")
+            return False
+        all_rows = merged
+
     if not all_rows:
         logging.error("[ABORT] Scrape produced 0 rows.")
-        return
+        return False
 
     # Batch-level dedupe before touching DB
     all_rows = deduplicate_across_all_rows(all_rows)
 
+    # Server-side atomic replace (single round-trip, nothing to restore on failure)
+    if _replace_rpc_enabled():
+        stored = _stored_city_rows(only_city) if REFRESH_CHURN else None
+        replaced = replace_city_via_rpc(only_city, all_rows)
+        if replaced is not None:
+            if replaced:
+                _record_city_churn(only_city, stored, scraped, partial_services)
+                _publish_listings(only_city, all_rows)
+            return replaced
+        logging.warning(f"[RPC] {CITY_REPLACE_RPC} not available; using client-side replace for {only_city}")
+
     # City-scoped snapshot
     city_snapshot = backup_supabase_city(only_city)
 
     # Delete only this city
     if not delete_supabase_city(only_city):
         logging.error("[ABORT] Initial delete failed.")
-        return
+        return False
 
     # Try upload; if it fails (e.g., 23505), restore the city snapshot
     try:
         upload_businesses_chunked(all_rows)
         logging.info(f"[DONE] Uploaded {len(all_rows)} rows for city: {only_city}")
+        _record_city_churn(only_city, read_snapshot(city_snapshot) if city_snapshot else None, scraped, partial_services)
+        _publish_listings(only_city, all_rows)
+        return True
     except Exception as e:
         logging.error(f"[UPLOAD ERROR] {e}")
         restore_supabase_city(only_city, city_snapshot)
+        return False
+
+_RPC_MISSING = False
+
+def _replace_rpc_enabled() -> bool:
+    if CITY_REPLACE_MODE == "client" or _RPC_MISSING:
+        return False
+    return CITY_REPLACE_MODE in ("rpc", "auto")
+
+def replace_city_via_rpc(city: str, rows: List[Business]) -> Optional[bool]:
+    """
+    Replace one city in a single transaction via PostgREST /rpc/.
+    Returns True/False for success/failure (a failure leaves the old rows in place),
+    or None when the function is not deployed and mode is "auto" (caller falls back).
+    """
+    global _RPC_MISSING
+    body = (b'{"p_city":' + json.dumps(city, ensure_ascii=False).encode("utf-8")
+            + b',"p_rows":[' + b",".join(_encode_row(r) for r in rows) + b"]}")
+    t0 = time.perf_counter()
+    try:
+        resp = _http_session().post(
+            f"{SUPABASE_URL}/rest/v1/rpc/{CITY_REPLACE_RPC}",
+            headers=_sb_headers(json_mode=True),
+            data=body,
+            timeout=120,
+        )
+    except requests.RequestException as e:
+        logging.error(f"[RPC] {city}: network error (transaction either committed fully or not at all): {e}")
+        return False
+    if resp.status_code == 404 and CITY_REPLACE_MODE == "auto":
+        _RPC_MISSING = True
+        return None
+    if not resp.ok:
+        logging.error(f"[RPC] {city}: replace failed, previous rows kept: {resp.status_code} {resp.text[:400]}")
+        return False
+    logging.info(f"[RPC] {city}: replaced with {resp.text.strip()} rows in {time.perf_counter() - t0:.2f}s "
+                 f"({len(body) / 1e3:.1f} kB)")
+    return True
+
+class CityUploadPipeline:
+    """
+    Background consumer for finished cities: each city goes through run_with_upload_logic
+    (snapshot -> delete -> concurrent chunk upload -> restore on failure) on a worker thread
+    while the scraper keeps going. The queue is bounded, so a slow database applies
+    backpressure to the scraper instead of buffering every city in memory.
+    """
+    _STOP = object()
+
+    def __init__(self, max_queued: int = UPLOAD_QUEUE_MAX):
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, max_queued))
+        self._thread = threading.Thread(target=self._run, name="city-upload", daemon=True)
+        self.results: Dict[str, bool] = {}
+
+    def start(self) -> "CityUploadPipeline":
+        self._thread.start()
+        return self
+
+    async def submit(self, city: str, rows: List[Business]) -> None:
+        # Blocking put runs off the event loop so Playwright keeps servicing pages
+        partial = set(PARTIAL_SCOPES.get(city, ())) | DEFERRED_SCOPES.get(city, set())
+        logging.info(f"[PIPELINE] queued {city} ({len(rows)} rows)" + (f" | partial: {sorted(partial)}" if partial else ""))
+        await asyncio.to_thread(self._queue.put, (city, rows, partial))
+
+    def close(self) -> Dict[str, bool]:
+        """Wait for every queued city to finish; returns {city: replaced_ok}."""
+        self._queue.put(self._STOP)
+        self._thread.join()
+        return self.results
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+            city, rows, partial = item
+            try:
+                self.results[city] = run_with_upload_logic(rows, city, partial)
+            except Exception as e:
+                logging.error(f"[PIPELINE] {city}: unexpected error: {e}")
+                self.results[city] = False
+
+def _shard_marker_path(shard: Tuple[int, int], only_city: Optional[str]) -> Path:
+    scope = only_city.lower().replace(" ", "_") if only_city else "all"
+    return EXPORT_DIR / f"shard_{shard[0]}of{shard[1]}_{scope}.json"
+
+def _write_shard_marker(shard: Tuple[int, int], only_city: Optional[str], done: bool) -> None:
+    """Written at the start of a --shard run and rewritten when it completes; --merge-shards reads it back."""
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    with open(_shard_marker_path(shard, only_city), "w", encoding="utf-8") as f:
+        json.dump({"shard": shard[0], "of": shard[1], "only_city": only_city, "done": done}, f)
+
+def unfinished_shard_jobs(dirs: Iterable[Path]) -> List[Job]:
+    """
+    The jobs of every shard run that failed, timed out or never uploaded its exports. The split is
+    re-derived with plan_shard, so DURATIONS must hold the history the shards started from.
+    """
+    markers = []
+    for d in dirs:
+        for path in sorted(Path(d).rglob("shard_*of*_*.json")):
+            with open(path, "r", encoding="utf-8") as f:
+                markers.append(json.load(f))
+    if not markers:
+        return []
+    n = markers[0]["of"]
+    scopes = {m["only_city"] for m in markers}
+    done = {(m["shard"], m["only_city"]) for m in markers if m["done"]}
+    jobs: List[Job] = []
+    for i in range(1, n + 1):
+        for only_city in sorted(scopes, key=lambda c: c or ""):
+            if (i, only_city) in done:
+                continue
+            missed = plan_shard(only_city, (i, n))
+            logging.warning(f"[MERGE] shard {i}/{n}" + (f" ({only_city})" if only_city else "")
+                            + f" did not finish: its {len(missed)} scopes keep their stored rows")
+            jobs.extend(missed)
+    return jobs
+
+def load_shard_exports(dirs: Iterable[Path]) -> Tuple[List[Business], Dict[str, Set[str]], Dict[str, Set[str]]]:
+    """All *_flat.json rows under the shard export dirs, plus the partial/blocked and unchanged scopes they marked."""
+    rows: List[Business] = []
+    partial: Dict[str, Set[str]] = {}
+    unchanged: Dict[str, Set[str]] = {}
+    for d in dirs:
+        for path in sorted(Path(d).rglob("*_flat.json")):
+            with open(path, "r", encoding="utf-8") as f:
+                rows.extend(Business.from_row(r) for r in json.load(f))
+        for pattern, scopes in (("*_partial.json", partial), ("*_unchanged.json", unchanged)):
+            for path in sorted(Path(d).rglob(pattern)):
+                with open(path, "r", encoding="utf-8") as f:
+                    marker = json.load(f)
+                scopes.setdefault(marker["city"], set()).add(marker["service"])
+    return rows, partial, unchanged
+
+def merge_shards(dirs: List[Path], with_upload: bool) -> bool:
+    """
+    Combine the exports of every --shard run, dedupe them globally and (with upload) replace
+    each city once. A dir holding a shard's whole scraper/ layout (CI artifacts) also brings back
+    the state that shard learned (see fold_shard_state). Scopes of a shard that did not finish are
+    treated as partial. Returns False if any city failed to upload.
+    """
+    DURATIONS.load()  # the history the shards split the plan with, before theirs is folded in
+    unfinished = unfinished_shard_jobs(dirs)
+    taken = fold_shard_state(dirs, {"state": STATE_DIR, "store": EXPORT_STORE_DIR})
+    if taken:
+        logging.info(f"[MERGE] {taken} state entries / files taken from the shard runs")
+    rows, partial, unchanged = load_shard_exports(dirs)
+    for city, service in unfinished:
+        partial.setdefault(city, set()).add(service)
+    rows = deduplicate_across_all_rows(rows)
+    by_city: Dict[str, List[Business]] = {}
+    for r in rows:
+        by_city.setdefault(r.city, []).append(r)
+    # Same as the streaming path: a city whose every scraped scope matched its list fingerprint is not rewritten
+    skipped = sorted(city for city, city_rows in by_city.items()
+                     if {r.service for r in city_rows} <= unchanged.get(city, set()))
+    for city in skipped:
+        del by_city[city]
+    if skipped:
+        logging.info(f"[UNCHANGED] every scope matched its list fingerprint — DB write skipped: {', '.join(skipped)}")
+    untouched = sorted(set(partial) - set(by_city) - set(skipped))
+    if untouched:
+        # Only blocked / cut-short scopes and no fresh rows: keep what the table has
+        logging.warning(f"[MERGE] no fresh rows, left as stored: {', '.join(untouched)}")
+    logging.info(f"[MERGE] {len(rows)} rows across {len(by_city)} cities from {len(dirs)} export dir(s)"
+                 + (f" | partial scopes in {len(partial)} cities" if partial else ""))
+    if not with_upload:
+        logging.info("[MODE] SCRAPE-ONLY: merge checked, no DB writes performed.")
+        return True
+    REFRESH.load()
+    failed = [city for city in sorted(by_city)
+              if not run_with_upload_logic(by_city[city], city, partial.get(city, ()))]
+    REFRESH.save()
+    logging.info(f"[MERGE] cities uploaded: {len(by_city) - len(failed)}/{len(by_city)}"
+                 + (f" | failed: {', '.join(failed)}" if failed else ""))
+    metrics = format_summary(upload_batcher().summary())
+    logging.info(f"[METRICS] {metrics}")
+    _append_summary_line(f"- Upload metrics: {metrics}")
+    return not failed
 
 # ------------------------
 # Main execution block
 # ------------------------
+def configure_traffic(record_dir: Optional[Path], replay_dir: Optional[Path], latency: str) -> None:
+    """
+    --record: a live run that also stores every browser response under record_dir.
+    --replay: the same pipeline served from replay_dir only, starting from cold learned state
+    (throttle, waits, durations, refresh) that is not saved afterwards, so replays repeat.
+    Both send list searches through the browser and bypass the list cache, so every scope
+    opens its detail pages.
+    """
+    global TRAFFIC, LIST_HTTP_FETCH
+    if record_dir is not None:
+        TRAFFIC = TrafficRecorder(record_dir, skip_types=BLOCK_RESOURCE_TYPES)
+    else:
+        TRAFFIC = TrafficReplayer(replay_dir, latency=latency, skip_types=BLOCK_RESOURCE_TYPES)
+        for learned in (THROTTLE, WAIT_TIMEOUTS, DURATIONS, REFRESH):
+            learned.state_path = None
+        logging.info(f"[REPLAY] {TRAFFIC.recorded} recorded responses from {replay_dir} | latency={latency}")
+    LIST_HTTP_FETCH = False
+    LIST_CACHE.ttl_s = 0
+
+def prune_export_store() -> None:
+    """End of run: drop blobs no export / retained snapshot points to, report the store size."""
+    try:
+        result = EXPORT_STORE.gc(legacy_dir=EXPORT_DIR)
+    except OSError as e:
+        logging.warning(f"[STORE] cleanup skipped: {e}")
+        return
+    line = EXPORT_STORE.describe(result)
+    logging.info(f"[STORE] {line}")
+    _append_summary_line(f"- Export store: {line}")
+
 def _resolve_with_upload_from_args_env(parsed_value: Optional[bool]) -> bool:
     if parsed_value is not None:
         return parsed_value
     # default: upload locally, scrape-only on CI
-    return os.getenv("CI", "").lower() != "true"
+    return env("CI", "").lower() != "true"
 
-if __name__ == "__main__":
+def main() -> None:
     parser = argparse.ArgumentParser(description="TN Google Maps scraper.")
     parser.add_argument("--only-city", default=None, help="Limit to one city, e.g., 'Franklin'")
 
@@ -753,21 +1840,101 @@ if __name__ == "__main__":
                        help="Scrape and write JSON exports only (NEVER touch DB).")
     group.add_argument("--with-upload", dest="with_upload", action="store_true",
                        help="After scraping, run city snapshot -> scoped delete -> upload (with auto-restore on failure).")
+    parser.add_argument("--stream-upload", action="store_true",
+                        help="With --with-upload: replace each city as soon as it finishes scraping "
+                             "(allows multi-city runs; each city is still snapshot/restore protected).")
+    parser.add_argument("--shard", default=None, metavar="i/N",
+                        help="Scrape only shard i of N (1-based) of the (city, service) plan; exports only, "
+                             "upload later with --merge-shards.")
+    parser.add_argument("--plan", action="store_true",
+                        help="With --shard: print this shard's jobs and exit (no browser).")
+    parser.add_argument("--page-budget", type=int, default=REFRESH_PAGE_BUDGET, metavar="PAGES",
+                        help="Nightly navigation budget: refresh the most volatile / stalest scopes first and "
+                             "defer the rest (0 = scrape everything; env REFRESH_PAGE_BUDGET).")
+    parser.add_argument("--merge-shards", nargs="+", type=Path, default=None, metavar="DIR",
+                        help="Merge the exports of all shard runs (global dedupe) and, with --with-upload, "
+                             "replace each city once.")
+
+    traffic = parser.add_mutually_exclusive_group()
+    traffic.add_argument("--record", type=Path, default=None, metavar="DIR",
+                         help="Store every list / detail page response under DIR while scraping live.")
+    traffic.add_argument("--replay", type=Path, default=None, metavar="DIR",
+                         help="Serve the browser from a --record DIR only (offline, cold learned state, scrape-only).")
+    parser.add_argument("--replay-latency", default="0", metavar="MS|recorded",
+                        help="With --replay: delay per response, fixed ms or the recorded fetch time (default 0).")
+
+    parser.add_argument("--metro-consolidate", action="store_true", default=METRO_CONSOLIDATE,
+                        help="One wide search per metro and service, assigned to targets by address; per-city "
+                             "queries only for targets left under METRO_MIN_FILL places (env METRO_CONSOLIDATE).")
+    parser.add_argument("--playwright-traces", action="store_true", default=TAIL_PLAYWRIGHT_TRACES,
+                        help="Also keep a Playwright trace.zip of every scope with a sampled (slow / failed) "
+                             "detail page (env TAIL_PLAYWRIGHT_TRACES).")
 
     parser.set_defaults(with_upload=None)
     args = parser.parse_args()
+    configure_logging()
+    global REFRESH_CHURN
+    REFRESH_CHURN = args.page_budget > 0
+    TAIL.playwright_traces = args.playwright_traces
+    if args.record or args.replay:
+        try:
+            configure_traffic(args.record, args.replay, args.replay_latency)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
 
     with_upload = _resolve_with_upload_from_args_env(args.with_upload)
-    logging.info(f"[CONFIG] with_upload={with_upload} (CI={os.getenv('CI','')})")
+    logging.info(f"[CONFIG] with_upload={with_upload} stream_upload={args.stream_upload} (CI={env('CI','')})")
+
+    if args.merge_shards:
+        sys.exit(0 if merge_shards(args.merge_shards, with_upload) else 1)
 
-    # Collect rows
-    all_rows = asyncio.run(collect_all_rows(args.only_city))
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.plan:
+            DURATIONS.load()
+            for city, service in plan_shard(args.only_city, shard):
+                print(f"{city}\t{service}\t{DURATIONS.weight((city, service)):.0f}s")
+            sys.exit(0)
+        if with_upload:
+            logging.warning("[SAFEGUARD] Shard runs never upload; run --merge-shards once all shards finished.")
+            with_upload = False
+
+    if args.replay and with_upload:
+        logging.warning("[SAFEGUARD] Replayed runs never upload (recorded data may be stale).")
+        with_upload = False
+
+    # If uploading, require --only-city (or explicit streaming) to keep operations scoped & safe
+    if with_upload and not args.only_city and not args.stream_upload:
+        logging.warning("[SAFEGUARD] Multi-city upload disabled. Use --scrape-only, --only-city or --stream-upload.")
+        with_upload = False
 
-    # If uploading, require --only-city to keep operations scoped & safe
     if with_upload:
-        if not args.only_city:
-            logging.warning("[SAFEGUARD] Multi-city upload disabled. Use --scrape-only or specify --only-city.")
-        else:
-            run_with_upload_logic(all_rows, args.only_city)
+        pipeline = CityUploadPipeline().start()
+        try:
+            asyncio.run(collect_all_rows(args.only_city, on_city_done=pipeline.submit,
+                                         page_budget=args.page_budget, metro_consolidate=args.metro_consolidate))
+        finally:
+            results = pipeline.close()
+            REFRESH.save()
+        failed = sorted(c for c, ok in results.items() if not ok)
+        logging.info(f"[PIPELINE] cities uploaded: {len(results) - len(failed)}/{len(results)}"
+                     + (f" | failed: {', '.join(failed)}" if failed else ""))
+        metrics = format_summary(upload_batcher().summary())
+        logging.info(f"[METRICS] {metrics}")
+        _append_summary_line(f"- Upload metrics: {metrics}")
     else:
+        if shard:
+            _write_shard_marker(shard, args.only_city, done=False)
+        asyncio.run(collect_all_rows(args.only_city, shard=shard, page_budget=args.page_budget,
+                                     metro_consolidate=args.metro_consolidate))
+        if shard:
+            _write_shard_marker(shard, args.only_city, done=True)
         logging.info("[MODE] SCRAPE-ONLY: Completed. No DB writes performed.")
+    prune_export_store()
+
+if __name__ == "__main__":
+    main()
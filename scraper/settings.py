@@ -0,0 +1,82 @@
+# scraper/settings.py
+# Environment and import helpers shared by the entry points (scraper.py, upload_to_supabase.py, tools)
+# - env(): process environment first, then .env.local; the file is read on the first lookup, not when this
+#   module is imported. scraper.py and upload_to_supabase.py look up their config constants at module level,
+#   so importing either of them reads it (once) and fixes those constants for the process
+# - use_env_file(False) skips .env.local (upload_to_supabase.py does so when CI == 'true')
+# - Supabase URL / key / headers in one place (service role key preferred over anon)
+# - lazy_import(): module object whose import runs on first attribute access (Playwright's async API)
+
+import importlib
+import importlib.util
+import os
+import sys
+from pathlib import Path
+from types import ModuleType
+from typing import Dict, Optional
+
+ENV_FILE = Path(".env.local")
+
+_file_values: Optional[Dict[str, Optional[str]]] = None
+_use_file = True
+
+def use_env_file(enabled: bool) -> None:
+    """Entry points that must not read .env.local (e.g. the uploader in CI) switch it off before any env()."""
+    global _use_file, _file_values
+    _use_file = enabled
+    _file_values = None
+
+def _env_file() -> Dict[str, Optional[str]]:
+    global _file_values
+    if _file_values is None:
+        _file_values = {}
+        if _use_file and ENV_FILE.exists():
+            from dotenv import dotenv_values
+            _file_values = dict(dotenv_values(ENV_FILE))
+    return _file_values
+
+def env(name: str, default: Optional[str] = None) -> Optional[str]:
+    """os.environ wins (CI secrets); .env.local fills in for local runs."""
+    value = os.environ.get(name)
+    if value is None:
+        value = _env_file().get(name)
+    return default if value is None else value
+
+def supabase_url() -> str:
+    return (env("NEXT_PUBLIC_SUPABASE_URL") or "").rstrip("/")
+
+def service_key() -> str:
+    return env("SUPABASE_SERVICE_ROLE_KEY") or ""
+
+def supabase_key() -> str:
+    return service_key() or env("NEXT_PUBLIC_SUPABASE_ANON_KEY") or ""
+
+def supabase_headers(json_mode: bool = False, prefer: str = "") -> Dict[str, str]:
+    key = supabase_key()
+    headers = {"apikey": key, "Authorization": f"Bearer {key}"}
+    if json_mode:
+        headers["Content-Type"] = "application/json"
+    if prefer:
+        headers["Prefer"] = prefer
+    return headers
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Import `name` on first attribute access instead of now (importlib LazyLoader).
+    Only the named module is deferred: the parent package of a dotted name is imported here, since
+    find_spec needs its __path__. LazyLoader is not thread-safe before Python 3.12, so use it only for
+    modules first touched from a single thread (the event loop); thread pools import eagerly.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    parent = name.rpartition(".")[0]
+    if parent:
+        importlib.import_module(parent)
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"No module named {name!r}")
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
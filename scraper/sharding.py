@@ -0,0 +1,229 @@
+# scraper/sharding.py
+# Deterministic partition of the (city, service) plan across N runners
+# - consistent hashing with bounded loads: each job hashes onto a ring of shard points and takes the
+#   first shard clockwise whose load (historical seconds) stays under (1 + slack) x the fair share
+# - every shard computes the same assignment from the same plan + history, no coordination needed
+# - per-job durations are an EWMA persisted in scraper/state/durations.json (merged on save,
+#   so concurrent shard processes on one machine don't overwrite each other)
+# - fold_shard_state(): shard runs on separate runners bring back their learned state (durations, refresh
+#   history, list cache, export store, rank history, AIMD rate, wait histograms) for the --merge-shards
+#   runner to keep
+
+import bisect
+import hashlib
+import json
+import logging
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+Job = Tuple[str, str]  # (city, service)
+
+_POINTS_PER_SHARD = 64
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """'2/4' -> (2, 4). Shards are numbered 1..N."""
+    try:
+        i, n = (int(x) for x in spec.split("/", 1))
+    except ValueError:
+        raise ValueError(f"--shard expects i/N (e.g. 1/4), got {spec!r}")
+    if n < 1 or not 1 <= i <= n:
+        raise ValueError(f"--shard {spec}: need 1 <= i <= N")
+    return i, n
+
+def _hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+def job_id(job: Job) -> str:
+    return f"{job[0]}|{job[1]}"
+
+def assign_shards(jobs: Sequence[Job], n: int, weights: Dict[Job, float], slack: float = 0.05) -> Dict[int, List[Job]]:
+    """
+    Map each job to a shard 1..n. Heaviest jobs are placed first (ties broken by id) so the
+    load bound bites on the big ones; the result only depends on the inputs.
+    """
+    ring = sorted((_hash(f"shard-{s}-{p}"), s) for s in range(1, n + 1) for p in range(_POINTS_PER_SHARD))
+    points = [h for h, _ in ring]
+    total = sum(weights[j] for j in jobs)
+    heaviest = max((weights[j] for j in jobs), default=0.0)
+    cap = max(total / n * (1 + slack), heaviest)
+    load = {s: 0.0 for s in range(1, n + 1)}
+    out: Dict[int, List[Job]] = {s: [] for s in range(1, n + 1)}
+    for job in sorted(jobs, key=lambda j: (-weights[j], job_id(j))):
+        w = weights[job]
+        start = bisect.bisect(points, _hash(job_id(job))) % len(ring)
+        chosen = None
+        for step in range(len(ring)):
+            shard = ring[(start + step) % len(ring)][1]
+            if load[shard] + w <= cap:
+                chosen = shard
+                break
+        if chosen is None:
+            chosen = min(load, key=lambda s: (load[s], s))
+        load[chosen] += w
+        out[chosen].append(job)
+    return out
+
+class DurationHistory:
+    """EWMA of seconds per (city, service) scrape, used as shard weights."""
+
+    def __init__(self, state_path: Optional[Path] = None, alpha: float = 0.3, default_s: float = 60.0):
+        self.state_path = state_path
+        self.alpha = alpha
+        self.default_s = default_s
+        self.seconds: Dict[str, float] = {}
+        self._touched: Dict[str, float] = {}
+
+    def weight(self, job: Job) -> float:
+        if job_id(job) in self.seconds:
+            return self.seconds[job_id(job)]
+        # Unknown job: the mean of what we know is a better guess than a constant
+        return sum(self.seconds.values()) / len(self.seconds) if self.seconds else self.default_s
+
+    def weights(self, jobs: Sequence[Job]) -> Dict[Job, float]:
+        return {j: self.weight(j) for j in jobs}
+
+    def record(self, job: Job, seconds: float) -> None:
+        key = job_id(job)
+        prev = self.seconds.get(key)
+        value = seconds if prev is None else prev + self.alpha * (seconds - prev)
+        self.seconds[key] = self._touched[key] = round(value, 2)
+
+    def load(self) -> None:
+        if not self.state_path or not self.state_path.exists():
+            return
+        try:
+            data = json.loads(self.state_path.read_text(encoding="utf-8"))
+            self.seconds = {k: float(v) for k, v in data.get("seconds", {}).items()}
+        except Exception as e:
+            logging.warning(f"[SHARD] ignoring unreadable state {self.state_path}: {e}")
+
+    def save(self) -> None:
+        if not self.state_path or not self._touched:
+            return
+        try:
+            # Re-read so parallel shards only overwrite the jobs they actually ran
+            current: Dict[str, float] = {}
+            if self.state_path.exists():
+                try:
+                    current = json.loads(self.state_path.read_text(encoding="utf-8")).get("seconds", {})
+                except ValueError:
+                    current = {}
+            current.update(self._touched)
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.state_path.with_name(f"{self.state_path.name}.{time.time_ns()}.tmp")
+            tmp.write_text(json.dumps({"saved_at": int(time.time()), "seconds": current}, sort_keys=True), encoding="utf-8")
+            tmp.replace(self.state_path)
+        except OSError as e:
+            logging.warning(f"[SHARD] could not persist durations: {e}")
+
+# Shard state: JSON files whose entries are per job / scope (file -> key of that dict) and directories of
+# per-scope or content-addressed files. Shards touch disjoint jobs, so what a shard changed is taken as is.
+_KEYED_STATE = (("state/durations.json", "seconds"), ("state/refresh.json", "scopes"),
+                ("store/manifest.json", "scopes"))
+_FILE_STATE = ("state/list_cache", "store/blobs", "store/history")
+
+def _merge_rate(base: dict, shards: List[dict]) -> Optional[dict]:
+    """throttle.json: every shard warm-started from the same rate; keep the median of what they learned."""
+    rates = sorted(float(s["rate"]) for s in shards if "rate" in s)
+    if not rates or all(r == base.get("rate") for r in rates):
+        return None
+    mid = len(rates) // 2
+    rate = rates[mid] if len(rates) % 2 else (rates[mid - 1] + rates[mid]) / 2
+    return {"rate": round(rate, 4), "saved_at": int(time.time())}
+
+def _merge_histograms(base: dict, shards: List[dict]) -> Optional[dict]:
+    """
+    timeouts.json: a shard saves decay x base + its own observations per step, so the merged step is
+    decay x base plus the sum of each shard's excess over that (clamped at 0 per bucket).
+    """
+    base_steps = base.get("steps", {})
+    steps: Dict[str, List[float]] = {}
+    for shard in shards:
+        decay = float(shard.get("decay", 0.7))
+        for step, counts in shard.get("steps", {}).items():
+            prior = [c * decay for c in base_steps.get(step, [0.0] * len(counts))]
+            if len(prior) != len(counts):
+                continue
+            merged = steps.setdefault(step, list(prior))
+            for idx, (c, p) in enumerate(zip(counts, prior)):
+                merged[idx] += c - p
+    if not steps:
+        return None
+    out = {step: [round(max(0.0, c), 3) for c in counts] for step, counts in steps.items()}
+    return {"saved_at": int(time.time()), "decay": shards[0].get("decay", 0.7),
+            "steps": {**base_steps, **out}}
+
+# Process-wide state every shard learned from the same starting point: combined, not taken per entry
+_MERGED_STATE = (("state/throttle.json", _merge_rate), ("state/timeouts.json", _merge_histograms))
+
+def fold_shard_state(shard_dirs: Sequence[Path], roots: Mapping[str, Path]) -> int:
+    """
+    Copy into the local state what the shard runs changed. Each shard dir holds that run's scraper/ layout
+    (state/..., store/...); roots maps "state" / "store" to the local directories. A shard's entry or file
+    is taken only where it differs from the local copy as it was before any shard was folded in (every
+    shard started from that copy), so a shard never undoes another one's change. Returns the count taken.
+    """
+    taken = 0
+    for rel, key in _KEYED_STATE:
+        top, _, name = rel.partition("/")
+        dst = roots[top] / name
+        try:
+            ours = json.loads(dst.read_text(encoding="utf-8")) if dst.exists() else {}
+        except ValueError as e:
+            logging.warning(f"[SHARD] {dst}: unreadable, shard entries not folded ({e})")
+            continue
+        base = dict(ours.get(key, {}))
+        changed: Dict[str, object] = {}
+        for shard_dir in shard_dirs:
+            src = Path(shard_dir) / rel
+            if not src.exists():
+                continue
+            try:
+                theirs = json.loads(src.read_text(encoding="utf-8")).get(key, {})
+            except ValueError as e:
+                logging.warning(f"[SHARD] {src}: not folded ({e})")
+                continue
+            changed.update({k: v for k, v in theirs.items() if base.get(k) != v})
+        if changed:
+            ours.setdefault(key, {}).update(changed)
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            dst.write_text(json.dumps(ours, ensure_ascii=False, sort_keys=True), encoding="utf-8")
+            taken += len(changed)
+    for rel, merge in _MERGED_STATE:
+        top, _, name = rel.partition("/")
+        dst = roots[top] / name
+        try:
+            base = json.loads(dst.read_text(encoding="utf-8")) if dst.exists() else {}
+        except ValueError as e:
+            logging.warning(f"[SHARD] {dst}: unreadable, starting from the shard copies ({e})")
+            base = {}
+        shards: List[dict] = []
+        for shard_dir in shard_dirs:
+            src = Path(shard_dir) / rel
+            if not src.exists():
+                continue
+            try:
+                shards.append(json.loads(src.read_text(encoding="utf-8")))
+            except ValueError as e:
+                logging.warning(f"[SHARD] {src}: not folded ({e})")
+        merged = merge(base, shards) if shards else None
+        if merged is not None:
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            dst.write_text(json.dumps(merged, separators=(",", ":")), encoding="utf-8")
+            taken += 1
+    for rel in _FILE_STATE:
+        top, _, sub = rel.partition("/")
+        copies: Dict[Path, Path] = {}
+        for shard_dir in shard_dirs:
+            src_dir = Path(shard_dir) / rel
+            for src in sorted(src_dir.rglob("*")) if src_dir.is_dir() else []:
+                dst = roots[top] / sub / src.relative_to(src_dir)
+                if src.is_file() and not (dst.exists() and dst.read_bytes() == src.read_bytes()):
+                    copies[dst] = src
+        for dst, src in copies.items():
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(src, dst)
+        taken += len(copies)
+    return taken
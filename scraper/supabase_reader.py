@@ -0,0 +1,77 @@
+# scraper/supabase_reader.py
+# Paginated, projected reads from PostgREST
+# - keyset pagination on id (id=gt.<last>&order=id.asc&limit=N): no OFFSET rescans, stable under inserts
+# - only the columns the caller asks for
+# - stops on an empty page, so a server-side max-rows cap can never silently truncate the result
+# - snapshot helpers stream pages straight into gzip'd JSON Lines (flat memory per city)
+
+from __future__ import annotations
+
+import gzip
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence
+
+import requests
+
+DEFAULT_PAGE_SIZE = 1000
+
+def iter_rows(
+    base_url: str,
+    table: str,
+    headers: Dict[str, str],
+    filters: Dict[str, str],
+    columns: Sequence[str],
+    page_size: int = DEFAULT_PAGE_SIZE,
+    session: Optional[requests.Session] = None,
+    timeout: int = 60,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield rows matching filters (PostgREST syntax, e.g. {"city": "eq.Franklin"}) one page at a time.
+    id is always selected because it drives the keyset. Raises requests.RequestException on failure.
+    """
+    http = session or requests
+    cols = list(columns)
+    if "id" not in cols:
+        cols.append("id")
+    url = f"{base_url}/rest/v1/{table}"
+    last_id: Any = None
+    while True:
+        params = dict(filters)
+        params["select"] = ",".join(cols)
+        params["order"] = "id.asc"
+        params["limit"] = str(page_size)
+        if last_id is not None:
+            params["id"] = f"gt.{last_id}"
+        resp = http.get(url, headers=headers, params=params, timeout=timeout)
+        resp.raise_for_status()
+        page = resp.json()
+        if not isinstance(page, list):
+            raise ValueError(f"unexpected response shape from {table}: {type(page).__name__}")
+        if not page:
+            return
+        yield from page
+        last_id = page[-1]["id"]
+
+def write_snapshot(path: Path, rows: Iterable[Dict[str, Any]]) -> int:
+    """Stream rows into a gzip'd JSON Lines file; returns the row count. Written atomically."""
+    tmp = path.with_name(path.name + ".tmp")
+    count = 0
+    with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as fh:
+        for row in rows:
+            fh.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")))
+            fh.write("\n")
+            count += 1
+    tmp.replace(path)
+    return count
+
+def read_snapshot(path: Path) -> Iterator[Dict[str, Any]]:
+    """Yield rows back from a snapshot written by write_snapshot (or a legacy .json array)."""
+    if path.suffix == ".json":
+        with open(path, "r", encoding="utf-8") as fh:
+            yield from json.load(fh)
+        return
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,269 @@
+# scraper/tail_sampler.py
+# Tail-based sampling of detail pages: evidence for the slow / failed ones, nothing kept for the rest
+# - every detail page gets a step timing breakdown (throttle, goto, state, idle, name, snapshot, info) and a
+#   rolling network buffer (page.on request / response / finished / failed; the last N requests only)
+# - the sample is written only when the page failed (timeout, error, cancelled by the watchdog) or took longer
+#   than the run's latency percentile so far (with a floor, so a fast run keeps nothing): <seq>_<city>_<service>.json
+#   with the timings + a .har of the buffered requests (opens in browser devtools / HAR viewers)
+# - optional Playwright traces: the detail context of a scope is traced, and the trace.zip is kept only when one
+#   of the scope's pages was sampled (tracing is per context, so it also shows the pages that ran alongside)
+# - index.json per run: outcome counts, threshold, the saved samples and the slowest K pages with breakdowns
+# Files: <dir>/<run timestamp>/ (scraper/exports/traces, uploaded with the exports artifact)
+
+import heapq
+import json
+import logging
+import re
+import time
+import weakref
+from collections import Counter, deque
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+FAILED = {"timeout", "error", "cancelled", "blocked"}
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", text.lower()).strip("_")[:40]
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+class _NetBuffer:
+    """The last maxlen requests of one page since the current detail navigation started."""
+
+    def __init__(self, maxlen: int):
+        self.entries: Deque[Dict[str, Any]] = deque(maxlen=maxlen)
+        self._open: Dict[Any, Dict[str, Any]] = {}
+
+    def reset(self) -> None:
+        self.entries.clear()
+        self._open.clear()
+
+    def on_request(self, request: Any) -> None:
+        entry = {"url": request.url, "method": request.method, "type": request.resource_type,
+                 "start": time.time(), "ms": None, "status": None, "failure": None, "timing": None}
+        self.entries.append(entry)
+        self._open[request] = entry
+
+    def on_response(self, response: Any) -> None:
+        entry = self._open.get(response.request)
+        if entry is not None:
+            entry["status"] = response.status
+
+    def on_done(self, request: Any) -> None:
+        entry = self._open.pop(request, None)
+        if entry is None:
+            return
+        entry["ms"] = round((time.time() - entry["start"]) * 1000, 1)
+        try:
+            entry["failure"] = request.failure
+            entry["timing"] = request.timing
+        except Exception:
+            pass
+
+    def to_har(self, page_url: str) -> Dict[str, Any]:
+        entries = []
+        for e in list(self.entries):
+            t = e["timing"] or {}
+            wait = t.get("responseStart", -1) - t.get("requestStart", 0) if t.get("responseStart", -1) >= 0 else -1
+            receive = t.get("responseEnd", -1) - t.get("responseStart", 0) if t.get("responseEnd", -1) >= 0 else -1
+            entries.append({
+                "startedDateTime": _iso(e["start"]),
+                # Unfinished requests (still pending when the page was given up on) show as -1
+                "time": e["ms"] if e["ms"] is not None else -1,
+                "request": {"method": e["method"], "url": e["url"], "httpVersion": "", "headers": [],
+                            "queryString": [], "cookies": [], "headersSize": -1, "bodySize": -1},
+                "response": {"status": e["status"] or 0, "statusText": e["failure"] or "", "httpVersion": "",
+                             "headers": [], "cookies": [], "content": {"size": -1, "mimeType": ""},
+                             "redirectURL": "", "headersSize": -1, "bodySize": -1},
+                "cache": {},
+                "timings": {"send": 0, "wait": round(wait, 1), "receive": round(receive, 1)},
+                "_resourceType": e["type"],
+            })
+        return {"log": {"version": "1.2", "creator": {"name": "scraper/tail_sampler.py", "version": "1"},
+                        "pages": [{"id": "page_1", "title": page_url, "startedDateTime": entries[0]["startedDateTime"]
+                                   if entries else _iso(time.time()), "pageTimings": {}}],
+                        "entries": entries}}
+
+class PageSample:
+    """Timing of one parse_detail call; mark(step) closes the step that just finished."""
+
+    __slots__ = ("url", "city", "service", "buffer", "started", "steps", "outcome", "error", "total_ms", "_t0", "_last")
+
+    def __init__(self, url: str, city: str, service: str, buffer: Optional[_NetBuffer]):
+        self.url = url
+        self.city = city
+        self.service = service
+        self.buffer = buffer
+        self.started = time.time()
+        self.steps: Dict[str, float] = {}
+        self.outcome = "cancelled"  # replaced on every normal exit; a cancelled task never gets to set it
+        self.error = ""
+        self.total_ms = 0.0
+        self._t0 = self._last = time.perf_counter()
+
+    def mark(self, step: str) -> None:
+        now = time.perf_counter()
+        self.steps[step] = round(self.steps.get(step, 0.0) + (now - self._last) * 1000, 1)
+        self._last = now
+
+    def summary(self) -> Dict[str, Any]:
+        return {"url": self.url, "city": self.city, "service": self.service, "outcome": self.outcome,
+                "error": self.error[:300], "total_ms": self.total_ms, "steps": self.steps,
+                "started_at": _iso(self.started)}
+
+class TailSampler:
+    def __init__(self, directory: Path, percentile: float = 0.95, min_samples: int = 20, min_s: float = 5.0,
+                 top_k: int = 20, max_saved: int = 40, buffer_size: int = 300, playwright_traces: bool = False):
+        self.run_dir = directory / datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_s = min_s
+        self.top_k = top_k
+        self.max_saved = max_saved
+        self.buffer_size = buffer_size
+        self.playwright_traces = playwright_traces
+        self.outcomes: Counter = Counter()
+        self.saved: List[Dict[str, Any]] = []
+        self.traces: List[str] = []
+        self.not_saved = 0
+        self._durations: Deque[float] = deque(maxlen=500)  # recent pages: the threshold follows the run
+        self._slowest: List[Tuple[float, int, Dict[str, Any]]] = []  # min-heap of the top_k
+        self._seq = 0
+        self._buffers: "weakref.WeakKeyDictionary[Any, _NetBuffer]" = weakref.WeakKeyDictionary()
+        self._sampled_scopes: set = set()
+
+    # ---------- per page ----------
+    def _buffer(self, page: Any) -> Optional[_NetBuffer]:
+        buf = self._buffers.get(page)
+        if buf is None:
+            try:
+                buf = _NetBuffer(self.buffer_size)
+                page.on("request", buf.on_request)
+                page.on("response", buf.on_response)
+                page.on("requestfinished", buf.on_done)
+                page.on("requestfailed", buf.on_done)
+                self._buffers[page] = buf
+            except Exception:
+                return None  # not a Playwright page (tests / tools): timings only
+        return buf
+
+    def begin(self, page: Any, url: str, city: str, service: str) -> PageSample:
+        buf = self._buffer(page)
+        if buf is not None:
+            buf.reset()  # pages are reused across URLs: the buffer holds this navigation only
+        return PageSample(url, city, service, buf)
+
+    def threshold_s(self) -> Optional[float]:
+        """Latency above which an ok page is sampled; None until enough pages have finished."""
+        if len(self._durations) < self.min_samples:
+            return None
+        ordered = sorted(self._durations)
+        return max(self.min_s, ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))])
+
+    def finish(self, sample: PageSample) -> Optional[Path]:
+        """Record the page; writes its sample when it is in the tail. Returns the written path, if any."""
+        # Time since the last mark: wrap-up for a finished page, the step that was cut off for a failed one
+        sample.mark("unfinished" if sample.outcome in FAILED else "rest")
+        sample.total_ms = round((time.perf_counter() - sample._t0) * 1000, 1)
+        self._seq += 1
+        self.outcomes[sample.outcome] += 1
+        seconds = sample.total_ms / 1000
+        threshold = self.threshold_s()
+        self._durations.append(seconds)
+        summary = sample.summary()
+        entry = (seconds, self._seq, summary)
+        if len(self._slowest) < self.top_k:
+            heapq.heappush(self._slowest, entry)
+        elif seconds > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+        slow = threshold is not None and seconds > threshold
+        if sample.outcome not in FAILED and not slow:
+            return None
+        self._sampled_scopes.add((sample.city, sample.service))
+        if len(self.saved) >= self.max_saved:
+            self.not_saved += 1  # a bad night: the index still lists the slowest pages
+            return None
+        path = self.run_dir / f"{self._seq:04d}_{_slug(sample.city)}_{_slug(sample.service)}.json"
+        reason = sample.outcome if sample.outcome in FAILED else f"slow (> p{self.percentile * 100:.0f} {threshold:.1f}s)"
+        try:
+            self.run_dir.mkdir(parents=True, exist_ok=True)
+            record = {**summary, "reason": reason,
+                      "threshold_ms": round(threshold * 1000, 1) if threshold is not None else None}
+            if sample.buffer is not None:
+                har = path.with_suffix(".har")
+                har.write_text(json.dumps(sample.buffer.to_har(sample.url)), encoding="utf-8")
+                pending = [e["url"] for e in sample.buffer.entries if e["ms"] is None]
+                slow_requests = sorted((e for e in sample.buffer.entries if e["ms"] is not None),
+                                       key=lambda e: e["ms"], reverse=True)[:10]
+                record.update(har=har.name, requests=len(sample.buffer.entries), pending=pending[:20],
+                              slowest_requests=[{k: e[k] for k in ("url", "type", "status", "ms", "failure")}
+                                                for e in slow_requests])
+            path.write_text(json.dumps(record, ensure_ascii=False, indent=2), encoding="utf-8")
+        except OSError as e:
+            logging.warning(f"[TAIL] could not write {path}: {e}")
+            return None
+        self.saved.append({"file": path.name, "url": sample.url, "city": sample.city, "service": sample.service,
+                           "reason": reason, "total_ms": sample.total_ms})
+        logging.info(f"[TAIL] sampled {sample.url} ({reason}, {seconds:.1f}s) -> {path}")
+        return path
+
+    # ---------- Playwright traces (per scope context) ----------
+    async def start_trace(self, context: Any) -> None:
+        if self.playwright_traces:
+            try:
+                await context.tracing.start(screenshots=True, snapshots=True)
+            except Exception as e:
+                logging.warning(f"[TAIL] tracing not started: {e}")
+
+    async def stop_trace(self, context: Any, city: str, service: str) -> None:
+        """Keep the scope's trace only when one of its pages was sampled; otherwise discard it."""
+        if not self.playwright_traces:
+            return
+        path = None
+        if (city, service) in self._sampled_scopes:
+            path = self.run_dir / f"trace_{_slug(city)}_{_slug(service)}.zip"
+            self.run_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            await context.tracing.stop(path=path)
+        except Exception as e:
+            logging.warning(f"[TAIL] tracing not stopped cleanly: {e}")
+            return
+        if path is not None:
+            self.traces.append(path.name)
+
+    # ---------- per run ----------
+    def slowest(self) -> List[Dict[str, Any]]:
+        return [s for _, _, s in sorted(self._slowest, key=lambda e: e[0], reverse=True)]
+
+    def write_index(self) -> Optional[Path]:
+        if not self._seq:
+            return None
+        threshold = self.threshold_s()
+        index = {
+            "pages": self._seq,
+            "outcomes": dict(self.outcomes),
+            "percentile": self.percentile,
+            "threshold_ms": round(threshold * 1000, 1) if threshold is not None else None,
+            "saved": self.saved,
+            "not_saved": self.not_saved,
+            "traces": self.traces,
+            "slowest": self.slowest(),
+        }
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        path = self.run_dir / "index.json"
+        path.write_text(json.dumps(index, ensure_ascii=False, indent=2), encoding="utf-8")
+        return path
+
+    def describe(self) -> str:
+        threshold = self.threshold_s()
+        slowest = self.slowest()
+        line = f"{self._seq} detail pages, {sum(self.outcomes[o] for o in FAILED)} failed"
+        if threshold is not None:
+            line += f" | p{self.percentile * 100:.0f} {threshold:.1f}s"
+        line += f" | sampled {len(self.saved)}" + (f" (+{self.not_saved} over the cap)" if self.not_saved else "")
+        if slowest:
+            line += f" | slowest {slowest[0]['total_ms'] / 1000:.1f}s ({slowest[0]['city']} / {slowest[0]['service']})"
+        return line
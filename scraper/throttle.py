@@ -0,0 +1,93 @@
+# scraper/throttle.py
+# AIMD request-rate controller for Google Maps navigations
+# - one instance shared by list and detail fetches on every page (acquire() spaces request starts)
+# - additive increase on fast successes, multiplicative decrease on slow responses / timeouts / blocks
+# - learned rate persisted to disk so the next run (or the next per-city subprocess) starts warm
+
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Optional
+
+class AimdThrottle:
+    """
+    rate: allowed request starts per second across the whole process.
+    acquire() never holds a lock across an await: the slot is claimed synchronously,
+    so concurrent pages on one event loop get strictly spaced start times.
+    """
+
+    def __init__(self, initial_rate: float = 1.0, min_rate: float = 0.05, max_rate: float = 4.0,
+                 increase: float = 0.05, decrease: float = 0.5, block_decrease: float = 0.25,
+                 slow_s: float = 10.0, state_path: Optional[Path] = None):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.block_decrease = block_decrease
+        self.slow_s = slow_s
+        self.state_path = state_path
+        self.rate = self._clamp(initial_rate)
+        self._next_slot = 0.0
+        self.stats = {"requests": 0, "increases": 0, "decreases": 0, "blocks": 0, "waited_s": 0.0}
+
+    def _clamp(self, rate: float) -> float:
+        return min(self.max_rate, max(self.min_rate, rate))
+
+    async def acquire(self) -> None:
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + 1.0 / self.rate
+        self.stats["requests"] += 1
+        if slot > now:
+            self.stats["waited_s"] += slot - now
+            await asyncio.sleep(slot - now)
+
+    def on_success(self, latency_s: float) -> None:
+        if latency_s > self.slow_s:
+            self._cut(self.decrease, f"slow response {latency_s:.1f}s")
+            return
+        self.rate = self._clamp(self.rate + self.increase)
+        self.stats["increases"] += 1
+
+    def on_timeout(self) -> None:
+        self._cut(self.decrease, "timeout")
+
+    def on_block(self) -> None:
+        self.stats["blocks"] += 1
+        self._cut(self.block_decrease, "block page")
+
+    def _cut(self, factor: float, reason: str) -> None:
+        old = self.rate
+        self.rate = self._clamp(self.rate * factor)
+        self.stats["decreases"] += 1
+        # Push out the next slot so the cut applies immediately, not after the queued ones
+        self._next_slot = max(self._next_slot, time.monotonic() + 1.0 / self.rate)
+        logging.info(f"[THROTTLE] {reason}: {old:.2f} -> {self.rate:.2f} req/s")
+
+    def load(self) -> None:
+        if not self.state_path or not self.state_path.exists():
+            return
+        try:
+            data = json.loads(self.state_path.read_text(encoding="utf-8"))
+            self.rate = self._clamp(float(data["rate"]))
+            logging.info(f"[THROTTLE] warm start at {self.rate:.2f} req/s (from {self.state_path})")
+        except Exception as e:
+            logging.warning(f"[THROTTLE] ignoring unreadable state {self.state_path}: {e}")
+
+    def save(self) -> None:
+        if not self.state_path:
+            return
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.state_path.with_name(self.state_path.name + ".tmp")
+            tmp.write_text(json.dumps({"rate": round(self.rate, 4), "saved_at": int(time.time())}), encoding="utf-8")
+            tmp.replace(self.state_path)
+        except OSError as e:
+            logging.warning(f"[THROTTLE] could not persist rate: {e}")
+
+    def describe(self) -> str:
+        s = self.stats
+        return (f"rate={self.rate:.2f} req/s | requests={s['requests']} waited={s['waited_s']:.1f}s "
+                f"| +{s['increases']} / -{s['decreases']} (blocks {s['blocks']})")
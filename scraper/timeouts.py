@@ -0,0 +1,153 @@
+# scraper/timeouts.py
+# Per-step wait budgets learned from run history
+# - each step (goto, name heading, info panel, list cards, ...) keeps a small log-bucketed latency histogram
+# - wait budget = high percentile x headroom, clamped to the step's floor/cap (fixed default until enough samples)
+# - histograms persist between runs with decay, so budgets follow Google's current behavior
+# - per-place totals are tracked too, to report how tail time per place moves run over run
+# - Deadline: per-scope wall-clock budget that clamps those waits and lets a scrape stop early with partial results
+
+import json
+import logging
+import math
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+_MIN_MS = 25.0
+_GROWTH = 1.25
+_BUCKETS = 48  # 25 ms .. ~1.1 h, far beyond any wait we use
+
+def _bucket(ms: float) -> int:
+    if ms <= _MIN_MS:
+        return 0
+    return min(_BUCKETS - 1, int(math.log(ms / _MIN_MS, _GROWTH)) + 1)
+
+def _upper_ms(idx: int) -> float:
+    return _MIN_MS * (_GROWTH ** idx)
+
+class LatencyHistogram:
+    def __init__(self, counts: Optional[List[float]] = None):
+        self.counts = list(counts) if counts and len(counts) == _BUCKETS else [0.0] * _BUCKETS
+
+    @property
+    def total(self) -> float:
+        return sum(self.counts)
+
+    def add(self, ms: float) -> None:
+        self.counts[_bucket(ms)] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        total = self.total
+        if total <= 0:
+            return None
+        target = q * total
+        acc = 0.0
+        for idx, c in enumerate(self.counts):
+            acc += c
+            if acc >= target:
+                return _upper_ms(idx)
+        return _upper_ms(_BUCKETS - 1)
+
+    def decayed(self, factor: float) -> "LatencyHistogram":
+        return LatencyHistogram([c * factor for c in self.counts])
+
+class TimeoutLearner:
+    """
+    budgets: {step: (default_ms, floor_ms, cap_ms)}. timeout_ms(step) returns the default until
+    min_samples observations exist, then clamp(percentile * headroom, floor, cap).
+    Timed-out waits are recorded at the budget they were given (a lower bound on the real latency).
+    """
+
+    def __init__(self, budgets: Dict[str, Tuple[int, int, int]], state_path: Optional[Path] = None,
+                 percentile: float = 0.95, headroom: float = 1.5, min_samples: int = 20, decay: float = 0.7):
+        self.budgets = budgets
+        self.state_path = state_path
+        self.percentile = percentile
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.decay = decay
+        self.hist: Dict[str, LatencyHistogram] = {}
+        self.prior: Dict[str, LatencyHistogram] = {}  # history as loaded, for run-over-run reports
+        self.run: Dict[str, LatencyHistogram] = {}    # this run only
+        self.timeouts: Dict[str, int] = {}
+
+    def timeout_ms(self, step: str) -> int:
+        default, floor, cap = self.budgets[step]
+        h = self.hist.get(step)
+        if h is None or h.total < self.min_samples:
+            return default
+        learned = (h.quantile(self.percentile) or default) * self.headroom
+        return int(min(cap, max(floor, learned)))
+
+    def observe(self, step: str, ms: float, timed_out: bool = False) -> None:
+        self.hist.setdefault(step, LatencyHistogram()).add(ms)
+        self.run.setdefault(step, LatencyHistogram()).add(ms)
+        if timed_out:
+            self.timeouts[step] = self.timeouts.get(step, 0) + 1
+
+    def load(self) -> None:
+        if not self.state_path or not self.state_path.exists():
+            return
+        try:
+            data = json.loads(self.state_path.read_text(encoding="utf-8"))
+            for step, counts in data.get("steps", {}).items():
+                loaded = LatencyHistogram(counts)
+                self.prior[step] = loaded
+                self.hist[step] = loaded.decayed(self.decay)
+            learned = ", ".join(f"{s}={self.timeout_ms(s)}ms" for s in self.budgets)
+            logging.info(f"[TIMEOUTS] learned budgets: {learned}")
+        except Exception as e:
+            logging.warning(f"[TIMEOUTS] ignoring unreadable state {self.state_path}: {e}")
+
+    def save(self) -> None:
+        if not self.state_path:
+            return
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            data = {"saved_at": int(time.time()), "decay": self.decay,
+                    "steps": {k: [round(c, 3) for c in h.counts] for k, h in self.hist.items()}}
+            tmp = self.state_path.with_name(self.state_path.name + ".tmp")
+            tmp.write_text(json.dumps(data, separators=(",", ":")), encoding="utf-8")
+            tmp.replace(self.state_path)
+        except OSError as e:
+            logging.warning(f"[TIMEOUTS] could not persist histograms: {e}")
+
+    def report(self, step: str) -> Optional[str]:
+        """p50/p95/max of `step` this run vs the p95 of the history loaded at start."""
+        h = self.run.get(step)
+        if h is None or h.total == 0:
+            return None
+        p50, p95, p100 = h.quantile(0.5), h.quantile(0.95), h.quantile(1.0)
+        line = f"{step}: n={int(h.total)} p50<={p50 / 1e3:.1f}s p95<={p95 / 1e3:.1f}s max<={p100 / 1e3:.1f}s"
+        prior = self.prior.get(step)
+        if prior is not None and prior.total:
+            prev = prior.quantile(0.95)
+            line += f" (previous p95<={prev / 1e3:.1f}s, {((p95 - prev) / prev) * 100:+.0f}%)"
+        if self.timeouts.get(step):
+            line += f" timeouts={self.timeouts[step]}"
+        return line
+
+class Deadline:
+    """
+    Wall-clock budget for one scope (a city/service scrape). Waits are clamped to what is left;
+    below tight_s optional waits are skipped. Callers set hit when they stop early, which marks
+    the scope's results as partial.
+    """
+
+    def __init__(self, seconds: float, tight_s: float = 0.0):
+        self.seconds = seconds
+        self.tight_s = tight_s
+        self.end = time.monotonic() + seconds
+        self.hit = False
+
+    @property
+    def remaining_s(self) -> float:
+        return max(0.0, self.end - time.monotonic())
+
+    @property
+    def tight(self) -> bool:
+        return self.remaining_s < self.tight_s
+
+    def clamp_ms(self, ms: int) -> int:
+        """ms, or less if the deadline is closer; 0 means no time left (never pass 0 to Playwright)."""
+        return int(max(0.0, min(ms, self.remaining_s * 1000)))
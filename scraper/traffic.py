@@ -0,0 +1,192 @@
+# scraper/traffic.py
+# Record / replay of the browser's network traffic (scraper.py --record DIR / --replay DIR)
+# - record: every routed request is fetched live, stored, then fulfilled from the fetched response
+# - store: <dir>/index.jsonl (one line per response: method, url, post hash, status, headers, elapsed)
+#   + <dir>/blobs/ab/abcdef... (bodies by sha1, so the JS bundles every page loads are stored once)
+# - replay: requests are answered from the store (exact URL first, else the closest recorded query on the
+#   same path); anything not recorded is aborted, so a replay never reaches the network
+# - latency: none (default), a fixed number of ms per response, or "recorded" (the live fetch time)
+# - redirects are recorded as-is (the browser follows them through the route again)
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+INDEX_FILE = "index.jsonl"
+BLOB_DIR = "blobs"
+# Stripped on replay: the stored body is already decoded and its length is re-computed by Playwright
+_DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+def _post_hash(data: Optional[bytes]) -> str:
+    return hashlib.sha1(data).hexdigest() if data else ""
+
+def _path_key(method: str, url: str) -> str:
+    parts = urlsplit(url)
+    return f"{method} {parts.scheme}://{parts.netloc}{parts.path}"
+
+def _exact_key(method: str, url: str, post: str) -> str:
+    return f"{method} {url.split('#', 1)[0]} {post}"
+
+def _query_pairs(url: str) -> FrozenSet[Tuple[str, str]]:
+    return frozenset(parse_qsl(urlsplit(url).query, keep_blank_values=True))
+
+class TrafficStore:
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.index_path = directory / INDEX_FILE
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.directory / BLOB_DIR / digest[:2] / digest
+
+    def put_body(self, body: bytes) -> str:
+        digest = hashlib.sha1(body).hexdigest()
+        path = self._blob_path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_bytes(body)
+            tmp.replace(path)
+        return digest
+
+    def get_body(self, digest: str) -> bytes:
+        return self._blob_path(digest).read_bytes() if digest else b""
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        # One line per response, appended as it arrives: a crashed recording keeps what it captured
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def entries(self) -> Iterable[Dict[str, Any]]:
+        with open(self.index_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+class TrafficRecorder:
+    """Context route handler that stores every response it passes through (skip_types: not stored)."""
+
+    mode = "record"
+
+    def __init__(self, directory: Path, skip_types: Iterable[str] = ()):
+        self.store = TrafficStore(directory)
+        self.skip_types = set(skip_types)
+        self.stats = Counter()
+        directory.mkdir(parents=True, exist_ok=True)
+
+    async def handle(self, route) -> None:
+        req = route.request
+        if req.resource_type in self.skip_types:
+            self.stats["skipped"] += 1
+            return await route.fallback()
+        t0 = time.time()
+        try:
+            response = await route.fetch(max_redirects=0)
+            body = await response.body()
+        except Exception as e:
+            # Page closed mid-request, connection reset, ...: nothing worth storing
+            self.stats["failed"] += 1
+            logging.debug(f"[RECORD] {req.url[:120]}: {e}")
+            try:
+                await route.abort()
+            except Exception:
+                pass
+            return
+        elapsed_ms = round((time.time() - t0) * 1000, 1)
+        self.store.append({
+            "method": req.method,
+            "url": req.url,
+            "post": _post_hash(req.post_data_buffer),
+            "type": req.resource_type,
+            "status": response.status,
+            "headers": response.headers,
+            "body": self.store.put_body(body),
+            "elapsed_ms": elapsed_ms,
+        })
+        self.stats["responses"] += 1
+        self.stats["bytes"] += len(body)
+        await route.fulfill(response=response, body=body)
+
+    def describe(self) -> str:
+        return (f"{self.stats['responses']} responses ({self.stats['bytes'] / 1e6:.1f} MB) -> "
+                f"{self.store.directory} | skipped {self.stats['skipped']}, failed {self.stats['failed']}")
+
+class TrafficReplayer:
+    """Context route handler that answers from a TrafficStore and never touches the network."""
+
+    mode = "replay"
+
+    def __init__(self, directory: Path, latency: str = "0", skip_types: Iterable[str] = ()):
+        self.store = TrafficStore(directory)
+        if not self.store.index_path.exists():
+            raise FileNotFoundError(f"no recording at {directory} ({INDEX_FILE} missing)")
+        if latency != "recorded":
+            float(latency)  # ValueError on anything else, before the browser starts
+        self.latency = latency
+        self.skip_types = set(skip_types)
+        self.stats = Counter()
+        self.missed: Counter = Counter()
+        # Same request recorded more than once: served in recording order, the last one repeats
+        self._exact: Dict[str, List[Dict[str, Any]]] = {}
+        self._by_path: Dict[str, List[Tuple[FrozenSet[Tuple[str, str]], Dict[str, Any]]]] = {}
+        self._served: Counter = Counter()
+        for entry in self.store.entries():
+            self._exact.setdefault(_exact_key(entry["method"], entry["url"], entry["post"]), []).append(entry)
+            self._by_path.setdefault(_path_key(entry["method"], entry["url"]), []).append(
+                (_query_pairs(entry["url"]), entry))
+        self.recorded = sum(len(v) for v in self._exact.values())
+
+    def _pick(self, key: str, entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        idx = min(self._served[key], len(entries) - 1)
+        self._served[key] += 1
+        return entries[idx]
+
+    def lookup(self, method: str, url: str, post: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """(entry, "exact" | "path") or (None, "miss")."""
+        key = _exact_key(method, url, post)
+        if key in self._exact:
+            return self._pick(key, self._exact[key]), "exact"
+        candidates = self._by_path.get(_path_key(method, url))
+        if candidates:
+            # Tokens / timestamps in the query differ between runs: take the closest recorded query
+            wanted = _query_pairs(url)
+            best = max(range(len(candidates)), key=lambda i: (len(wanted & candidates[i][0]), -i))
+            return candidates[best][1], "path"
+        return None, "miss"
+
+    def _delay_s(self, entry: Dict[str, Any]) -> float:
+        if self.latency == "recorded":
+            return entry.get("elapsed_ms", 0) / 1000.0
+        return float(self.latency) / 1000.0
+
+    async def handle(self, route) -> None:
+        req = route.request
+        if req.resource_type in self.skip_types:
+            self.stats["skipped"] += 1
+            return await route.abort()
+        entry, how = self.lookup(req.method, req.url, _post_hash(req.post_data_buffer))
+        self.stats[how] += 1
+        if entry is None:
+            self.missed[_path_key(req.method, req.url)] += 1
+            return await route.abort("internetdisconnected")
+        delay = self._delay_s(entry)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        headers = {k: v for k, v in entry["headers"].items() if k.lower() not in _DROP_HEADERS}
+        try:
+            await route.fulfill(status=entry["status"], headers=headers, body=self.store.get_body(entry["body"]))
+        except Exception as e:
+            logging.debug(f"[REPLAY] {req.url[:120]}: {e}")
+
+    def describe(self) -> str:
+        line = (f"{self.stats['exact']} exact, {self.stats['path']} by path, {self.stats['miss']} not recorded "
+                f"(of {self.recorded} recorded responses) | latency={self.latency}")
+        if self.missed:
+            top = ", ".join(f"{k} x{n}" for k, n in self.missed.most_common(3))
+            line += f" | most missed: {top}"
+        return line
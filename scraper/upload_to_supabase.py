@@ -2,19 +2,23 @@
 import argparse
 import json
 import os
+import time
 from pathlib import Path
 from typing import Dict, List, Tuple, Set
-from dotenv import load_dotenv
-import requests
 from urllib.parse import quote
-if os.getenv('CI') != 'true':
-    load_dotenv(dotenv_path='.env.local')
-# ---------- env ----------
 
-SUPABASE_URL  = os.getenv("NEXT_PUBLIC_SUPABASE_URL", "").rstrip("/")
-ANON_KEY      = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY", "")
-SERVICE_KEY   = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")  # preferred when present
-API_KEY       = SERVICE_KEY or ANON_KEY
+import requests
+
+from batching import AdaptiveBatcher, format_summary, iter_chunks
+from records import url_has_domain
+from scope_listings import LISTING_FIELDS, publish_city
+from settings import env, service_key, supabase_headers, supabase_url, use_env_file
+from supabase_reader import iter_rows
+# ---------- env (process environment, then .env.local outside CI; see settings.py) ----------
+use_env_file(os.getenv("CI") != "true")
+
+SUPABASE_URL  = supabase_url()
+SERVICE_KEY   = service_key()  # preferred when present
 
 EXPORT_DIR    = Path("scraper/exports")
 SERVICE_NAME  = "handyman"  # default service for this project
@@ -24,30 +28,26 @@ ALLOWED_FIELDS = {
     "name","website","phone","address","city","service","review_count","avg_rating","pin_rank"
 }
 
+# Stale-row deletes put ids in the URL (id=in.(...)): size chunks by rows AND URL bytes
+DELETE_BATCHER = AdaptiveBatcher(
+    start_rows=300,
+    min_rows=10,
+    max_rows=int(env("DELETE_CHUNK_MAX_ROWS", "1000")),
+    max_bytes=int(env("DELETE_URL_MAX_BYTES", "6000")),
+    target_latency_s=5.0,
+    name="delete",
+)
+
 # ---------- http helpers ----------
 def h(json_mode: bool = False, prefer_extra: str = "") -> Dict[str, str]:
-    headers = {
-        "apikey": API_KEY,
-        "Authorization": f"Bearer {API_KEY}",
-    }
-    if json_mode:
-        headers["Content-Type"] = "application/json"
-    if prefer_extra:
-        headers["Prefer"] = prefer_extra
-    return headers
+    return supabase_headers(json_mode, prefer_extra)
 
 def sb(path: str) -> str:
     return f"{SUPABASE_URL}{path}"
 
 # ---------- utils ----------
 def is_our_site(url: str) -> bool:
-    if not url:
-        return False
-    u = url.strip().lower()
-    if u.startswith("https://"): u = u[8:]
-    if u.startswith("http://"):  u = u[7:]
-    if u.startswith("www."):     u = u[4:]
-    return OUR_DOMAIN in u
+    return url_has_domain(url, OUR_DOMAIN)
 
 def detect_pin_rank_support() -> bool:
     # Try selecting pin_rank; if column missing, Supabase returns 400
@@ -85,31 +85,44 @@ def load_scope_rows(only_city: str | None) -> Dict[Tuple[str, str], List[Dict]]:
         scopes[(city, SERVICE_NAME)] = rows
     return scopes
 
+def is_partial_scope(city: str) -> bool:
+    """The scraper leaves <city>_handyman_partial.json when a scope hit its deadline (rows are incomplete)."""
+    return (EXPORT_DIR / f"{city.lower().replace(' ', '_')}_handyman_partial.json").exists()
+
 # ---------- CRUD helpers ----------
+def _payload_rows(rows: List[Dict], pin_supported: bool) -> List[Dict]:
+    """
+    Rows from load_scope_rows are already fresh, payload-shaped dicts: send them as-is.
+    Only when pin_rank is unsupported do we project once (without pin_rank).
+    """
+    if pin_supported:
+        return rows
+    return [{k: v for k, v in r.items() if k != "pin_rank"} for r in rows]
+
 def fetch_existing_scope(city: str, service: str) -> List[Dict]:
-    url = sb("/rest/v1/businesses")
-    params = {
-        "city":     f"eq.{city}",
-        "service":  f"eq.{service}",
-        "select":   "id,name,website,city,service"
-    }
-    r = requests.get(url, headers=h(), params=params, timeout=60)
-    if r.status_code not in (200, 206):
-        print(f"[WARN] fetch scope {city}/{service} -> {r.status_code} {r.text[:200]}")
-        return []
+    """
+    All (id, name, website) rows in one scope, paged by id so large scopes are never
+    cut off at PostgREST's max-rows.
+    """
+    rows = iter_rows(
+        SUPABASE_URL, "businesses", h(),
+        filters={"city": f"eq.{city}", "service": f"eq.{service}"},
+        columns=("id", "name", "website"),
+    )
     try:
-        return r.json()
-    except Exception:
+        return list(rows)
+    except requests.RequestException as e:
+        resp = getattr(e, "response", None)
+        detail = f"{resp.status_code} {resp.text[:200]}" if resp is not None else str(e)
+        print(f"[WARN] fetch scope {city}/{service} -> {detail}")
+        return []
+    except ValueError:
         return []
 
 def post_bulk(rows: List[Dict], pin_supported: bool) -> Tuple[int, str]:
     if not rows:
         return 0, ""
-    # strip pin_rank if column not supported
-    payload = [dict({**r}) for r in rows]
-    if not pin_supported:
-        for r in payload:
-            r.pop("pin_rank", None)
+    payload = _payload_rows(rows, pin_supported)
 
     r = requests.post(
         sb("/rest/v1/businesses"),
@@ -129,10 +142,7 @@ def upsert_bulk(rows: List[Dict], pin_supported: bool) -> Tuple[int, str]:
     """
     if not rows:
         return 0, ""
-    payload = [dict({**r}) for r in rows]
-    if not pin_supported:
-        for r in payload:
-            r.pop("pin_rank", None)
+    payload = _payload_rows(rows, pin_supported)
 
     params = "?on_conflict=name,website,city,service"
     prefer = "resolution=merge-duplicates,return=representation"
@@ -180,21 +190,36 @@ def delete_stale_for_scope(city: str, service: str, keep_pairs: Set[Tuple[str, s
         return 0
 
     deleted = 0
-    CHUNK = 300
-    for i in range(0, len(stale_ids), CHUNK):
-        chunk = stale_ids[i:i+CHUNK]
-        id_list = ",".join(str(x) for x in chunk)
+    for chunk in iter_chunks((str(x).encode() for x in stale_ids), DELETE_BATCHER, overhead=len("id=in.()")):
+        deleted += _delete_id_chunk(chunk)
+    return deleted
+
+def _delete_id_chunk(ids: List[bytes]) -> int:
+    """Delete one id chunk; retryable failures (414/5xx/timeouts) are split in half and retried."""
+    id_list = b",".join(ids).decode()
+    status, text = None, ""
+    t0 = time.perf_counter()
+    try:
         # correct Supabase filter form: id=in.(1,2,3)
         r = requests.delete(
             sb(f"/rest/v1/businesses?id=in.({id_list})"),
             headers=h(),
             timeout=60
         )
-        if r.status_code in (200, 204):
-            deleted += len(chunk)
-        else:
-            print(f"[WARN] delete chunk failed: {r.status_code} {r.text[:200]}")
-    return deleted
+        status, text = r.status_code, r.text
+    except requests.RequestException as e:
+        text = str(e)
+    ok = status in (200, 204)
+    DELETE_BATCHER.record(len(ids), len(id_list), time.perf_counter() - t0, ok=ok, status=status)
+    if ok:
+        return len(ids)
+    if DELETE_BATCHER.is_retryable(status) and len(ids) > 1:
+        DELETE_BATCHER.note_split()
+        mid = len(ids) // 2
+        print(f"[WARN] delete chunk of {len(ids)} failed ({status or 'no response'}); splitting")
+        return _delete_id_chunk(ids[:mid]) + _delete_id_chunk(ids[mid:])
+    print(f"[WARN] delete chunk failed: {status} {text[:200]}")
+    return 0
 
 # ---------- scope flow ----------
 def process_scope(city: str, service: str, rows: List[Dict], pin_supported: bool, apply_deletes: bool) -> Tuple[int, int, int]:
@@ -246,6 +271,26 @@ def process_scope(city: str, service: str, rows: List[Dict], pin_supported: bool
 
     return upserted, failed, stale_deleted
 
+def publish_scope_listing(city: str, service: str, rows: List[Dict], pin_supported: bool, deletes_applied: bool) -> None:
+    """
+    Refresh the site's listing snapshot for one scope after a clean upload.
+    Without stale deletes the table may still hold older rows: those follow the fresh ones.
+    """
+    listing = list(rows)
+    if not deletes_applied:
+        fresh = {(str(r.get("name","")).strip(), str(r.get("website","")).strip()) for r in rows}
+        cols = LISTING_FIELDS + (("pin_rank",) if pin_supported else ())
+        try:
+            stored = list(iter_rows(SUPABASE_URL, "businesses", h(),
+                                    filters={"city": f"eq.{city}", "service": f"eq.{service}"}, columns=cols))
+        except (requests.RequestException, ValueError) as e:
+            print(f"[WARN] listing {city}/{service}: stored rows unreadable, snapshot not updated: {e}")
+            return
+        listing += [r for r in stored if (str(r.get("name","")).strip(), str(r.get("website","")).strip()) not in fresh]
+    result = publish_city(SUPABASE_URL, h(), city, {service: listing}, replace_city=False)
+    if result is not None:
+        print(f"[LISTING] {city}/{service} -> {'written' if result[0] else 'unchanged'} ({len(listing)} rows)")
+
 # ---------- main ----------
 def main():
     parser = argparse.ArgumentParser(description="Scope-replace uploader (UPSERT + scoped deletes with 409 fallback).")
@@ -269,15 +314,25 @@ def main():
     total_ok = total_fail = total_stale = 0
 
     for (city, service), rows in scopes.items():
-        ok, fail, stale = process_scope(city, service, rows, pin_supported, args.apply_deletes)
+        partial = is_partial_scope(city)
+        if partial:
+            # Incomplete top-N: merge (upsert only), never delete rows that simply weren't reached
+            print(f"[PARTIAL] {city}/{service}: scrape hit its deadline; stale deletes skipped")
+        deletes = args.apply_deletes and not partial
+        ok, fail, stale = process_scope(city, service, rows, pin_supported, deletes)
         if ok == 0 and fail == len(rows):
             print(f"[ERROR] UPSERT {city}/{service} failed entirely; skipping deletes for this scope.")
+        elif fail == 0:
+            publish_scope_listing(city, service, rows, pin_supported, deletes)
         print(f"[SCOPE] {city}/{service} -> upserted: {ok}, failed: {fail}, stale_to_delete: {stale}")
         total_ok    += ok
         total_fail  += fail
         total_stale += stale
 
     print(f"\n[RESULT] upserted={total_ok}, failed={total_fail}, stale_to_delete={total_stale}")
+    delete_metrics = DELETE_BATCHER.summary()
+    if delete_metrics["chunks"] or delete_metrics["errors"]:
+        print(f"[METRICS] {format_summary(delete_metrics)}")
     if not args.apply_deletes:
         print("[NOTE] Deletes ran in DRY mode. Re-run with --apply-deletes (and service key) to actually remove stale rows.")
 
@@ -0,0 +1,65 @@
+// src/lib/scopeListings.js
+// Build-time reads of the pipeline's scope_listings table (see scope_listings.sql).
+// - getScopeManifest(): one query for every page's slugs + content hash (no business rows)
+// - getScopeListing(): one small read per page, skipped during `next build` when .next/cache holds the
+//   same content hash; ISR revalidation under `next start` always reads the table (the manifest is build-time)
+// - returns null when the table is missing/empty, so pages can fall back to `businesses`
+import fs from 'fs';
+import path from 'path';
+import { supabase } from './db';
+
+const CACHE_DIR = path.join(process.cwd(), '.next', 'cache', 'scope-listings');
+const MANIFEST_FILE = path.join(CACHE_DIR, 'manifest.json');
+
+function readJson(file) {
+  try {
+    return JSON.parse(fs.readFileSync(file, 'utf8'));
+  } catch {
+    return null;
+  }
+}
+
+function writeJson(file, value) {
+  try {
+    fs.mkdirSync(CACHE_DIR, { recursive: true });
+    fs.writeFileSync(file, JSON.stringify(value), 'utf8');
+  } catch {
+    // Cache is an optimization only
+  }
+}
+
+const scopeFile = (citySlug, serviceSlug) => path.join(CACHE_DIR, `${citySlug}__${serviceSlug}.json`);
+
+const isBuildPhase = () => process.env.NEXT_PHASE === 'phase-production-build';
+
+export async function getScopeManifest() {
+  const { data, error } = await supabase
+    .from('scope_listings')
+    .select('city, service, city_slug, service_slug, content_hash, version');
+  if (error || !data?.length) return null;
+  // getStaticProps runs in separate workers: they look their hash up here instead of querying again
+  writeJson(MANIFEST_FILE, data);
+  return data;
+}
+
+export async function getScopeListing(citySlug, serviceSlug) {
+  const file = scopeFile(citySlug, serviceSlug);
+  // The manifest is only as fresh as the last getStaticPaths, so it can vouch for the cache during the build only
+  if (isBuildPhase()) {
+    const entry = (readJson(MANIFEST_FILE) || []).find(
+      (s) => s.city_slug === citySlug && s.service_slug === serviceSlug
+    );
+    const cached = entry ? readJson(file) : null;
+    if (cached && cached.content_hash === entry.content_hash) return cached;
+  }
+
+  const { data, error } = await supabase
+    .from('scope_listings')
+    .select('city, service, listing, content_hash, version')
+    .eq('city_slug', citySlug)
+    .eq('service_slug', serviceSlug)
+    .maybeSingle();
+  if (error || !data) return null;
+  writeJson(file, data);
+  return data;
+}
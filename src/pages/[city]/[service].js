@@ -1,4 +1,5 @@
 import { supabase } from '../../lib/db';
+import { getScopeListing, getScopeManifest } from '../../lib/scopeListings';
 import BusinessCard from '../../components/BusinessCard';
 import SEOHead from '../../components/SEOHead';
 
@@ -14,7 +15,7 @@ export default function ServicePage({ city, service, businesses }) {
           {service} in {city}
         </h1>
         {businesses.map((biz) => (
-          <BusinessCard key={biz.id} business={biz} />
+          <BusinessCard key={biz.id ?? biz.rank} business={biz} />
         ))}
       </div>
     </>
@@ -22,23 +23,47 @@ export default function ServicePage({ city, service, businesses }) {
 }
 
 export async function getStaticPaths() {
+  // One row per page from the pipeline-maintained manifest
+  const manifest = await getScopeManifest();
+  if (manifest) {
+    const paths = manifest.map((s) => ({
+      params: { city: s.city_slug, service: s.service_slug },
+    }));
+    return { paths, fallback: 'blocking' };
+  }
+
+  // Fallback before scope_listings exists: distinct scopes from businesses
   const { data } = await supabase
     .from('businesses')
     .select('city, service');
 
-  const paths =
-    data?.map((b) => ({
-      params: {
-        city: b.city.toLowerCase(),
-        service: b.service.toLowerCase(),
-      },
-    })) || [];
+  const seen = new Set();
+  const paths = [];
+  for (const b of data || []) {
+    const params = { city: b.city.toLowerCase(), service: b.service.toLowerCase() };
+    const key = `${params.city}||${params.service}`;
+    if (seen.has(key)) continue;
+    seen.add(key);
+    paths.push({ params });
+  }
 
   return { paths, fallback: 'blocking' };
 }
 
 export async function getStaticProps({ params }) {
   const { city, service } = params;
+  const listing = await getScopeListing(city, service);
+  if (listing) {
+    return {
+      props: {
+        city: listing.city,
+        service: listing.service,
+        businesses: listing.listing || [],
+      },
+      revalidate: 86400,
+    };
+  }
+
   const { data } = await supabase
     .from('businesses')
     .select('*')
@@ -0,0 +1,134 @@
+/**
+ * src/scripts/bench-build-queries.js
+ * Build-time Supabase query volume for /[city]/[service] pages: `businesses` scan vs scope_listings.
+ * Runs against a local PostgREST-shaped stub with synthetic data (no network, no Supabase project), and
+ * issues the same REST calls the page's getStaticPaths / getStaticProps make.
+ *
+ *   before : getStaticPaths selects city,service for every business row; every page selects its scope
+ *   after  : one manifest read + one listing document per page (cold .next/cache)
+ *   rebuild: same, with a warm cache and --changed of the scopes re-published by the pipeline
+ *
+ * Usage: node src/scripts/bench-build-queries.js [--cities 60] [--services 5] [--rows 10] [--changed 0.1]
+ */
+const http = require('http');
+const crypto = require('crypto');
+
+function arg(name, fallback) {
+  const i = process.argv.indexOf(`--${name}`);
+  return i > -1 ? Number(process.argv[i + 1]) : fallback;
+}
+
+const CITIES = arg('cities', 60);
+const SERVICES = arg('services', 5);
+const ROWS = arg('rows', 10);
+const CHANGED = arg('changed', 0.1);
+
+// ---------- synthetic data ----------
+const businesses = [];
+const listings = [];
+for (let c = 0; c < CITIES; c++) {
+  for (let s = 0; s < SERVICES; s++) {
+    const city = `City ${c}`;
+    const service = `service ${s}`;
+    const cards = [];
+    for (let r = 0; r < ROWS; r++) {
+      const row = {
+        id: businesses.length + 1, name: `Biz ${c}-${s}-${r}`, address: `${r} Main St, ${city}, TN`,
+        phone: '(615) 555-0100', website: `https://biz-${c}-${s}-${r}.example.com`, city, service, state: 'TN',
+        maps_url: `https://www.google.com/maps/place/biz-${c}-${s}-${r}`, review_count: 10 * r, avg_rating: 4.5,
+        pin_rank: 100, created_at: '2025-01-01T00:00:00Z', updated_at: '2025-01-01T00:00:00Z',
+      };
+      businesses.push(row);
+      cards.push({ name: row.name, address: row.address, phone: row.phone, website: row.website,
+        maps_url: row.maps_url, review_count: row.review_count, avg_rating: row.avg_rating, pin_rank: 100, rank: r + 1 });
+    }
+    const hash = crypto.createHash('sha1').update(JSON.stringify(cards)).digest('hex');
+    listings.push({ city, service, city_slug: `city-${c}`, service_slug: `service-${s}`,
+      listing: cards, row_count: cards.length, content_hash: hash, version: 1 });
+  }
+}
+
+// ---------- PostgREST-shaped stub ----------
+const stats = { requests: 0, rows: 0, bytes: 0 };
+
+function handle(req, res) {
+  const url = new URL(req.url, 'http://stub');
+  const table = url.pathname.replace('/rest/v1/', '');
+  const source = table === 'businesses' ? businesses : table === 'scope_listings' ? listings : null;
+  if (!source) {
+    res.writeHead(404).end();
+    return;
+  }
+  const select = (url.searchParams.get('select') || '*').split(',').map((c) => c.trim());
+  let rows = source;
+  for (const [key, value] of url.searchParams) {
+    if (value.startsWith('eq.')) rows = rows.filter((r) => String(r[key]) === value.slice(3));
+  }
+  rows = rows.map((r) => (select[0] === '*' ? r : Object.fromEntries(select.map((c) => [c, r[c]]))));
+  const body = JSON.stringify(rows);
+  stats.requests += 1;
+  stats.rows += rows.length;
+  stats.bytes += Buffer.byteLength(body);
+  res.writeHead(200, { 'Content-Type': 'application/json' }).end(body);
+}
+
+// ---------- the page's data functions, as REST calls ----------
+async function get(base, pathAndQuery) {
+  const r = await fetch(`${base}${pathAndQuery}`);
+  return r.json();
+}
+
+async function buildBefore(base) {
+  const data = await get(base, '/rest/v1/businesses?select=city,service');
+  const paths = data.map((b) => ({ city: b.city, service: b.service }));
+  // Next renders each distinct path once
+  const unique = [...new Map(paths.map((p) => [`${p.city}||${p.service}`, p])).values()];
+  for (const p of unique) {
+    await get(base, `/rest/v1/businesses?select=*&city=eq.${encodeURIComponent(p.city)}&service=eq.${encodeURIComponent(p.service)}`);
+  }
+  return unique.length;
+}
+
+async function buildAfter(base, cache) {
+  const manifest = await get(base, '/rest/v1/scope_listings?select=city,service,city_slug,service_slug,content_hash,version');
+  for (const s of manifest) {
+    const key = `${s.city_slug}__${s.service_slug}`;
+    if (cache.get(key) === s.content_hash) continue;
+    const [doc] = await get(base, `/rest/v1/scope_listings?select=city,service,listing,content_hash,version` +
+      `&city_slug=eq.${s.city_slug}&service_slug=eq.${s.service_slug}`);
+    cache.set(key, doc.content_hash);
+  }
+  return manifest.length;
+}
+
+async function measure(label, fn) {
+  Object.assign(stats, { requests: 0, rows: 0, bytes: 0 });
+  const t0 = process.hrtime.bigint();
+  const pages = await fn();
+  const ms = Number(process.hrtime.bigint() - t0) / 1e6;
+  console.log(`${label.padEnd(9)} pages=${String(pages).padStart(5)} queries=${String(stats.requests).padStart(5)} ` +
+    `rows=${String(stats.rows).padStart(7)} kB=${(stats.bytes / 1024).toFixed(0).padStart(7)} wall=${ms.toFixed(0)}ms`);
+}
+
+(async () => {
+  const server = http.createServer(handle).listen(0);
+  await new Promise((resolve) => server.once('listening', resolve));
+  const base = `http://127.0.0.1:${server.address().port}`;
+  console.log(`synthetic: ${CITIES} cities x ${SERVICES} services x ${ROWS} rows = ${businesses.length} businesses\n`);
+
+  const cache = new Map();
+  await measure('before', () => buildBefore(base));
+  await measure('after', () => buildAfter(base, cache));
+
+  // Pipeline re-publishes a share of the scopes (new hash), the rest stay cached
+  const changed = Math.round(listings.length * CHANGED);
+  for (const doc of listings.slice(0, changed)) {
+    doc.version += 1;
+    doc.content_hash = crypto.createHash('sha1').update(`${doc.content_hash}:${doc.version}`).digest('hex');
+  }
+  await measure('rebuild', () => buildAfter(base, cache));
+  console.log(`\nrebuild: ${changed}/${listings.length} scopes changed since the previous build`);
+  console.log('note: hosted PostgREST caps a response at max-rows (1000 by default), so the "before" paths ' +
+    'query silently misses scopes once businesses outgrows it; the manifest grows with pages, not rows.');
+  server.close();
+})();
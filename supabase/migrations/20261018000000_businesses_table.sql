@@ -0,0 +1,23 @@
+-- 0000 businesses: base table (no-op where it already exists)
+-- Columns are the ones the scraper writes (scraper/records.py PAYLOAD_FIELDS) plus pin_rank and timestamps.
+-- Unqualified names: applies to the current search_path (public on Supabase).
+
+CREATE TABLE IF NOT EXISTS businesses (
+  id            bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  name          text,
+  address       text,
+  phone         text,
+  website       text,
+  city          text NOT NULL,
+  service       text NOT NULL,
+  state         text DEFAULT 'TN',
+  maps_url      text,
+  review_count  integer,
+  avg_rating    numeric(2, 1),
+  pin_rank      integer,
+  created_at    timestamptz NOT NULL DEFAULT now(),
+  updated_at    timestamptz NOT NULL DEFAULT now()
+);
+
+-- Older deployments predate pin_rank (upload_to_supabase.py probes for it)
+ALTER TABLE businesses ADD COLUMN IF NOT EXISTS pin_rank integer;
@@ -0,0 +1,20 @@
+-- 0001 businesses.business_key: generated fingerprint the scraper mirrors in records.business_key_for()
+--   maps_url present -> lower(trimmed maps_url)
+--   otherwise        -> lower(name, whitespace collapsed) || '|' || website without scheme/www./trailing '/' (or 'no-site')
+-- Keep both sides in step: scraper/bench_db_indexes.py checks parity on tricky rows.
+-- ADD COLUMN IF NOT EXISTS leaves an existing column (and its expression) untouched.
+
+ALTER TABLE businesses ADD COLUMN IF NOT EXISTS business_key text GENERATED ALWAYS AS (
+  CASE
+    WHEN btrim(coalesce(maps_url, ''), E' \t\r\n') <> '' THEN lower(btrim(maps_url, E' \t\r\n'))
+    ELSE lower(btrim(regexp_replace(coalesce(name, ''), '\s+', ' ', 'g'), ' '))
+         || '|'
+         || coalesce(
+              nullif(
+                lower(rtrim(
+                  regexp_replace(regexp_replace(btrim(coalesce(website, ''), E' \t\r\n'), '^https?://', '', 'i'), '^www\.', '', 'i'),
+                  '/')),
+                ''),
+              'no-site')
+  END
+) STORED;
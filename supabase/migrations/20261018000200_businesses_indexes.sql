@@ -0,0 +1,54 @@
+-- 0002 businesses: indexes for the pipeline's filters
+--   city                              backup_supabase_city / _stored_city_rows (keyset: city=eq, id=gt, order=id), delete_supabase_city
+--   (city, service)                   fetch_existing_scope (id, name, website; keyset on id), merge_partial_services, site pages
+--   (name, website, city, service)    upsert on_conflict target, patch_one
+--   id = in.(...)                     delete_stale_for_scope -> primary key
+--   (city, service, business_key)     dedupe rule mirrored by deduplicate_across_all_rows
+-- An equivalent index that already exists under another name is not duplicated: each extra index
+-- costs write time on every nightly city replace.
+
+CREATE OR REPLACE FUNCTION pg_temp.has_index(tbl regclass, cols text[], must_be_unique boolean, same_order boolean)
+RETURNS boolean LANGUAGE sql AS $$
+  SELECT EXISTS (
+    SELECT 1
+    FROM pg_index i
+    CROSS JOIN LATERAL (
+      SELECT array_agg(a.attname::text ORDER BY k.ord) AS keys
+      FROM unnest(i.indkey::int2[]) WITH ORDINALITY AS k(attnum, ord)
+      JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+      WHERE k.ord <= i.indnkeyatts
+    ) k
+    WHERE i.indrelid = tbl
+      AND i.indpred IS NULL
+      AND i.indexprs IS NULL
+      AND (i.indisunique OR NOT must_be_unique)
+      AND CASE WHEN same_order THEN k.keys = cols
+               ELSE k.keys @> cols AND k.keys <@ cols AND cardinality(k.keys) = cardinality(cols) END
+  )
+$$;
+
+DO $$
+BEGIN
+  -- ON CONFLICT infers by column set, so any column order satisfies the upsert; this order also
+  -- serves the city and (city, service) prefixes
+  IF NOT pg_temp.has_index('businesses', ARRAY['name', 'website', 'city', 'service'], true, false) THEN
+    CREATE UNIQUE INDEX businesses_scope_name_website_key ON businesses (city, service, name, website);
+  END IF;
+
+  IF NOT pg_temp.has_index('businesses', ARRAY['city', 'service', 'business_key'], true, false) THEN
+    CREATE UNIQUE INDEX businesses_scope_business_key_key ON businesses (city, service, business_key);
+  END IF;
+
+  -- Keyset pages of one scope in id order, answered from the index alone (fetch_existing_scope)
+  IF NOT pg_temp.has_index('businesses', ARRAY['city', 'service', 'id'], false, true) THEN
+    CREATE INDEX businesses_scope_id_idx ON businesses (city, service, id) INCLUDE (name, website);
+  END IF;
+
+  -- Keyset pages of one city in id order (snapshots, churn reads) without a sort
+  IF NOT pg_temp.has_index('businesses', ARRAY['city', 'id'], false, true) THEN
+    CREATE INDEX businesses_city_id_idx ON businesses (city, id);
+  END IF;
+END
+$$;
+
+ANALYZE businesses;
@@ -0,0 +1,31 @@
+-- 0003 businesses: row-level security (supersedes businesses_policies.sql)
+-- Policies are constant predicates, so the planner keeps using the indexes above for anon reads.
+-- Any future predicate calling auth.uid()/auth.role() should be written as (select auth.uid()) so it
+-- is evaluated once per statement instead of once per row.
+-- The nightly job uses the service role, which bypasses RLS; anon keeps read + the legacy insert path.
+
+ALTER TABLE businesses ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Allow public insert" ON businesses;
+DROP POLICY IF EXISTS "Allow anonymous inserts" ON businesses;
+DROP POLICY IF EXISTS "Allow anonymous reads" ON businesses;
+
+-- Site build and pages
+CREATE POLICY "Allow anonymous reads"
+ON businesses
+FOR SELECT
+TO anon
+USING (
+  true
+);
+
+-- upload_to_supabase.py without a service key (ANON mode)
+CREATE POLICY "Allow anonymous inserts"
+ON businesses
+FOR INSERT
+TO anon
+WITH CHECK (
+  true
+);
+
+NOTIFY pgrst, 'reload schema';